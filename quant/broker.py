@@ -1,9 +1,9 @@
 from .markets import WatchList
 from .util.events import Event
+from .util.price import Price
 
 from enum import Enum
 from typing import NamedTuple
-from decimal import Decimal
 from abc import abstractmethod, ABC
 
 
@@ -53,7 +53,7 @@ class Position(NamedTuple):
 
 
 class Order:
-    def __init__(self, position: Position, status=OrderStatus.UNPOSTED, order_id=-1, filled_at=Decimal(0),
+    def __init__(self, position: Position, status=OrderStatus.UNPOSTED, order_id=-1, filled_at=Price(0),
                  filled_quantity=0):
         self.position = position
         self.status = status
@@ -64,15 +64,15 @@ class Order:
     def is_cancellable(self):
         return self.status in (OrderStatus.UNPOSTED, OrderStatus.PENDING)
 
-    def update_status(self, status: OrderStatus, filled_at: Decimal = None, filled_quantity=None) -> 'Order':
+    def update_status(self, status: OrderStatus, filled_at: Price = None, filled_quantity=None) -> 'Order':
         filled_at = filled_at or self.filled_at
         filled_quantity = filled_quantity or self.filled_quantity
         return Order(self.position, status, self.order_id, filled_at, filled_quantity)
 
-    def p_or_l(self, current_price: Decimal):
+    def p_or_l(self, current_price: Price) -> Price:
         if self.status is OrderStatus.UNPOSTED:
-            return Decimal(0)
-        return Decimal((current_price - self.filled_at) * Decimal(self.filled_quantity) * self.position.direction.value) # noqa PyCharm can't do Enum.value
+            return Price(0)
+        return (current_price - self.filled_at) * (self.filled_quantity * self.position.direction.value) # noqa PyCharm can't do Enum.value
 
     def __str__(self):
         msg = f'{self.order_id} {self.position} {self.status.name}'
@@ -81,7 +81,7 @@ class Order:
         return msg
 
     @staticmethod
-    def combined_p_or_l(orders: 'list[Order]', current_price: Decimal):
+    def combined_p_or_l(orders: 'list[Order]', current_price: Price):
         return sum(order.p_or_l(current_price) for order in orders)
 
 
@@ -132,6 +132,10 @@ class OrderEvent(Event):
     def __init__(self, order: Order):
         self.order = order
 
+    @property
+    def key(self):
+        return self.order.position.symbol
+
 
 class Broker(ABC):
 
@@ -151,10 +155,11 @@ class Broker(ABC):
         return self.book.filled_orders
 
     def p_or_l(self, symbol=None):
+        prices = self.watchlist.snapshot().prices  # One consistent view across symbols
         if symbol:
-            return self.book.p_or_l(symbol, self.watchlist[symbol].close)
+            return self.book.p_or_l(symbol, prices[symbol].close)
         else:
-            return sum(self.book.p_or_l(symbol, bar.close) for symbol, bar in self.watchlist.items())
+            return sum(self.book.p_or_l(symbol, bar.close) for symbol, bar in prices.items())
 
     @abstractmethod
     def start(self):
@@ -1,7 +1,6 @@
 from .broker import Broker, Position, Order, OrderStatus, OrderEvent, OrderBook
 from .markets import WatchList
 from .util import events
-from .util.misc import decimal as d
 
 import threading
 from queue import Queue, Empty
@@ -72,7 +71,7 @@ class Worker:
                 order = update_order_status(order, OrderStatus.SUBMITTED)
             elif order.status is OrderStatus.SUBMITTED:
                 filled_quantity = order.position.quantity
-                filled_at = d(self.watchlist[order.position.symbol].close)
+                filled_at = self.watchlist[order.position.symbol].close
                 order = order.update_status(OrderStatus.FILLED, filled_at, filled_quantity)
                 order = update_order_status(order, OrderStatus.FILLED)
             self.book[i] = order
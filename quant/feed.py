@@ -0,0 +1,247 @@
+"""
+ Market data fan-out to local processes through shared memory. One publisher process owns the market data source
+ (the IB connection, random, synthetic or a replay) and writes each bar into a ring buffer; any number of subscriber
+ processes map the same memory and read bars straight from it, with no socket or serialization in between.
+
+ Layout (little endian): HEADER_BYTES of int64 fields, a table of symbol names, then `capacity` fixed size slots.
+ Bar n (counting from 1) goes to slot n % capacity, stamped with n, and the header's `head` becomes n once the slot
+ is complete. A reader remembers the next n it wants. If the head has moved `capacity` or more past it, the bars in
+ between were overwritten: the reader counts them as lost and skips to the oldest bar still held.
+"""
+from __future__ import annotations
+
+from .markets import TickBar, TickEvent, WatchList
+from .util import events, console
+from .util.price import Price
+from .util.timeutil import to_epoch_ns, from_epoch_ns, utc_offset_minutes, offset_tz
+
+from multiprocessing import shared_memory, resource_tracker
+from typing import Callable
+import numpy as np
+import struct
+import threading
+import time
+import logging
+
+_log = logging.getLogger(__name__)
+
+DEFAULT_NAME = 'quant-feed'
+DEFAULT_CAPACITY = 1 << 16
+MAX_SYMBOLS = 4096
+SYMBOL_BYTES = 32
+MAGIC = 0x51464545  # 'QFEE'
+VERSION = 1
+
+HEADER_BYTES = 64
+MAGIC_FIELD, VERSION_FIELD, CAPACITY, SYMBOL_CAPACITY, HEAD, SYMBOLS = range(6)
+SLOT_DTYPE = np.dtype([('sequence', '<i8'), ('symbol', '<u4'), ('scale', 'u1'), ('pad', 'u1'), ('utc_offset', '<i2'),
+                       ('date', '<i8'), ('open', '<i8'), ('high', '<i8'), ('low', '<i8'), ('close', '<i8'),
+                       ('wap', '<i8'), ('volume', '<i8')])
+_SEQUENCE = struct.Struct('<q')
+_SLOT = struct.Struct('<IBxh7q')  # Everything after the sequence
+
+_published: set[str] = set()  # Rings this process created
+
+
+class FeedFormatError(Exception):
+    pass
+
+
+class _Ring:
+    """Typed views of the shared memory: the header, the symbol names and the slots"""
+
+    def __init__(self, memory: shared_memory.SharedMemory, capacity: int, max_symbols: int):
+        self.memory = memory
+        self.capacity = capacity
+        self.header = np.ndarray(6, dtype='<i8', buffer=memory.buf)
+        self.names = np.ndarray(max_symbols, dtype=f'S{SYMBOL_BYTES}', buffer=memory.buf, offset=HEADER_BYTES)
+        self.slots_offset = HEADER_BYTES + max_symbols * SYMBOL_BYTES
+        self.slots = np.ndarray(capacity, dtype=SLOT_DTYPE, buffer=memory.buf, offset=self.slots_offset)
+
+    @staticmethod
+    def size(capacity: int, max_symbols: int) -> int:
+        return HEADER_BYTES + max_symbols * SYMBOL_BYTES + capacity * SLOT_DTYPE.itemsize
+
+    def close(self):
+        del self.header, self.names, self.slots  # The memory can't be closed while arrays still export it
+        self.memory.close()
+
+
+class FeedPublisher:
+    """
+    Creates the ring and publishes bars into it, by default every TickEvent emitted in this process. There must be
+    only one publisher per ring. Publishing a bar is a few stores into the mapped memory
+    """
+
+    def __init__(self, name=DEFAULT_NAME, capacity=DEFAULT_CAPACITY, max_symbols=MAX_SYMBOLS):
+        self.name = name
+        memory = shared_memory.SharedMemory(name, create=True, size=_Ring.size(capacity, max_symbols))
+        self.ring = _Ring(memory, capacity, max_symbols)
+        self.ring.header[:] = [MAGIC, VERSION, capacity, max_symbols, 0, 0]
+        _published.add(name)
+        self.head = 0
+        self.symbols: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._observer = None
+
+    def start(self) -> FeedPublisher:
+        _log.info(f'Publishing market data to shared memory {self.name} ({self.ring.capacity} bars)')
+        self._observer = events.observe(TickEvent, lambda event: self.publish(event.tick_bar))
+        return self
+
+    def _symbol(self, symbol: str) -> int:
+        number = self.symbols.get(symbol)
+        if number is None:
+            number = len(self.symbols)
+            if number >= len(self.ring.names):
+                raise ValueError(f'Too many symbols for the feed, at most {len(self.ring.names)}')
+            self.ring.names[number] = symbol.encode()
+            self.ring.header[SYMBOLS] = number + 1  # Named before any bar refers to it
+            self.symbols[symbol] = number
+        return number
+
+    def publish(self, bar: TickBar):
+        with self._lock:
+            n = self.head + 1
+            offset = self.ring.slots_offset + n % self.ring.capacity * SLOT_DTYPE.itemsize
+            buffer, scale = self.ring.memory.buf, bar.close.scale
+            _SEQUENCE.pack_into(buffer, offset, -n)  # Marks the slot as being written
+            _SLOT.pack_into(buffer, offset + _SEQUENCE.size, self._symbol(bar.symbol), scale,
+                            utc_offset_minutes(bar.date), to_epoch_ns(bar.date),
+                            *(Price.of(price, scale).ticks for price in bar[2:7]), bar.volume)
+            _SEQUENCE.pack_into(buffer, offset, n)
+            self.ring.header[HEAD] = self.head = n
+
+    def close(self):
+        """Stops publishing and removes the shared memory. Subscribers that have it mapped keep their mapping"""
+        if self._observer is not None:
+            events.stop_observing(TickEvent, self._observer)
+        memory = self.ring.memory
+        self.ring.close()
+        memory.unlink()
+        _published.discard(self.name)
+
+
+class FeedSubscriber:
+    """
+    Attaches to a publisher's ring and reads the bars published since, or with `from_start` the oldest still held.
+    `lost` counts bars that were overwritten before they were read. Given a watchlist, run() emits only the bars of
+    its symbols, and warns about those the feed doesn't carry: only the publisher's symbols are ever published.
+    """
+
+    check_interval = 10.  # Seconds between checks that the watched symbols are published
+
+    def __init__(self, name=DEFAULT_NAME, from_start=False, watchlist: WatchList = None):
+        self.name = name
+        self.watchlist = watchlist
+        self.unpublished: set[str] = set()  # Watched symbols already warned about
+        memory = shared_memory.SharedMemory(name)
+        if name not in _published:
+            # Attaching registers the memory with this process's resource tracker, which would remove it at exit
+            resource_tracker.unregister(memory._name, 'shared_memory')  # noqa The publisher owns it
+        header = np.ndarray(6, dtype='<i8', buffer=memory.buf)
+        if header[MAGIC_FIELD] != MAGIC or header[VERSION_FIELD] != VERSION:
+            del header
+            memory.close()
+            raise FeedFormatError(f'Shared memory {name} is not a version {VERSION} feed')
+        self.ring = _Ring(memory, int(header[CAPACITY]), int(header[SYMBOL_CAPACITY]))
+        del header
+        head = int(self.ring.header[HEAD])
+        self.next = max(1, head - self.ring.capacity + 1) if from_start else head + 1
+        self.lost = 0
+        self.symbols: list[str] = []
+        self.stopped = False
+
+    def poll(self, limit: int = None) -> np.ndarray:
+        """
+        The bars published since the last poll, at most `limit`, as SLOT_DTYPE records. They are copied out of the
+        ring in one block, then checked so that a bar overwritten during the copy is never returned
+        """
+        capacity = self.ring.capacity
+        head = int(self.ring.header[HEAD])
+        if head < self.next:
+            return np.empty(0, dtype=SLOT_DTYPE)
+        self._skip_to(head - capacity + 1)
+        last = head if limit is None else min(head, self.next + limit - 1)
+        records = self._copy(self.ring.slots, self.next, last)
+        # A slot reads as -n while the publisher rewrites it. If its sequence was the one expected both before and
+        # after the copy, the publisher didn't touch it in between (a seqlock)
+        expected = np.arange(self.next, last + 1)
+        after = self._copy(self.ring.slots['sequence'], self.next, last)
+        valid = (records['sequence'] == expected) & (after == expected)
+        if not valid.all():
+            self._lost(int((~valid).sum()))
+            records = records[valid]
+        self.next = last + 1
+        return records
+
+    def _copy(self, slots: np.ndarray, first: int, last: int) -> np.ndarray:
+        first_slot, last_slot = first % self.ring.capacity, last % self.ring.capacity
+        if first_slot <= last_slot:
+            return slots[first_slot:last_slot + 1].copy()
+        return np.concatenate([slots[first_slot:], slots[:last_slot + 1]])
+
+    def _skip_to(self, oldest: int):
+        if self.next < oldest:
+            self._lost(oldest - self.next)
+            self.next = oldest
+
+    def _lost(self, count: int):
+        self.lost += count
+        _log.warning(f'Fell behind feed {self.name}: {count} bars were overwritten before being read')
+
+    def _read_symbols(self):
+        count = int(self.ring.header[SYMBOLS])
+        if count > len(self.symbols):
+            self.symbols = [name.decode() for name in self.ring.names[:count].tolist()]
+
+    def check_symbols(self) -> set[str]:
+        """Warns about watched symbols that nothing has been published for, once each, and returns them"""
+        self._read_symbols()
+        missing = set(self.watchlist.symbols()).difference(self.symbols)
+        for symbol in sorted(missing - self.unpublished):
+            console.warn(f'No bars for {symbol} in feed {self.name}: add it to the symbols quant.publisher publishes')
+        self.unpublished = missing
+        return missing
+
+    def tick_bars(self, records: np.ndarray) -> list[TickBar]:
+        if len(records) and int(records['symbol'].max()) >= len(self.symbols):
+            self._read_symbols()
+        offsets = records['utc_offset'].tolist()
+        zones = {offset: offset_tz(offset) for offset in set(offsets)}
+        return [TickBar(self.symbols[symbol], from_epoch_ns(date, zones[offset]), Price(open_, scale),
+                        Price(high, scale), Price(low, scale), Price(close, scale), Price(wap, scale), volume)
+                for symbol, scale, offset, date, open_, high, low, close, wap, volume
+                in zip(*(records[name].tolist() for name in ('symbol', 'scale')), offsets,
+                       *(records[name].tolist() for name in SLOT_DTYPE.names[5:]))]
+
+    def run(self, emit: Callable = events.emit, interval=0.01):
+        """
+        Emits the feed's bars (those of the watchlist's symbols, given one) as TickEvents in this process, polling
+        every `interval` seconds when it is idle
+        """
+        checked = time.monotonic()
+        while not self.stopped:
+            records = self.poll()
+            if not len(records):
+                time.sleep(interval)
+            watched = self.watchlist.symbols() if self.watchlist is not None else None
+            for bar in self.tick_bars(records):
+                if watched is None or bar.symbol in watched:
+                    emit(TickEvent(bar))
+            if watched is not None and time.monotonic() - checked >= self.check_interval:
+                self.check_symbols()
+                checked = time.monotonic()
+
+    def start(self) -> threading.Thread:
+        _log.info(f'Reading market data from shared memory {self.name}')
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopped = True
+
+    def close(self):
+        self.stop()
+        self.ring.close()
@@ -6,23 +6,53 @@ from __future__ import annotations
 
 import argparse
 import dateparser
-from .sources import YahooData, IBKRData
+from .sources import YahooData, IBKRData, HistoryStore, request_cache, in_flight, fetch_incremental
 from .markets import DataRequest, Resolution
 from pandas import DataFrame
 from functools import partial
-from .util import Parser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable
+from .util import Parser, console
+from .util.ratelimit import TokenBucket
+from .writers import writers, open_writer, TerminalWriter
+import sys
 from .util.timeutil import Timer
-from datetime import datetime
-from .markets import render_bar_data
+import logging
 
+_log = logging.getLogger(__name__)
+
+
+# Calls per second each source is sent, with the burst allowed. IBKR additionally paces its own chunks
+_rate_limits = {
+    "yahoo": TokenBucket(rate=2, capacity=5),
+    "ibkr": TokenBucket(rate=3, capacity=6),
+}
+
+
+def _rate_limited(source: str, fetcher: Callable) -> Callable:
+    bucket = _rate_limits[source]
+
+    def limited(request: DataRequest):
+        bucket.acquire()
+        return fetcher(request)
+    return limited
+
+
+_symbol_data_fetchers = {
+    "yahoo": _rate_limited('yahoo', YahooData.fetch_symbol_data),
+    "ibkr": _rate_limited('ibkr', IBKRData.fetch_symbol_data),
+}
 
 _fetchers = {
-    "yahoo": YahooData.fetch,
-    "ibkr": IBKRData.fetch,
+    "yahoo": request_cache.wrap('yahoo', _rate_limited('yahoo', YahooData.fetch)),
+    # Replay caches IBKR SymbolData under the same keys, so cache that and take the frame from it
+    "ibkr": lambda request: request_cache.fetch('ibkr', _symbol_data_fetchers['ibkr'], request).data_frame,
 }
 
 
-def fetch(source: str, symbol: str, start: str, end='today', resolution=Resolution.DAY) -> DataFrame:
+def fetch(source: str, symbol: str, start: str, end='today', resolution=Resolution.DAY,
+          history: HistoryStore = None) -> DataFrame:
+    """Fetches a range of bars. Given a history store, only what it is missing is fetched, and saved there"""
     start = dateparser.parse(start, settings={'TIMEZONE': 'US/Eastern'}).astimezone()
     if start is None:
         raise IOError(f'Unrecognized start date: {start}')
@@ -32,7 +62,9 @@ def fetch(source: str, symbol: str, start: str, end='today', resolution=Resoluti
         raise IOError(f'Unrecognized end date: {end}')
 
     request = DataRequest(symbol, start, end, resolution)
-    print(f'Fetching {symbol} from {source} between {start} and {end}. Request: {request}')
+    _log.info(f'Fetching {symbol} from {source} between {start} and {end}. Request: {request}')
+    if history:
+        return fetch_incremental(history, _symbol_data_fetchers[source], request).data_frame
     return _fetchers[source](request)
 
 
@@ -48,20 +80,38 @@ def main():
     parser.add_argument('start', type=str, help='Start date or time (uses dateparser)')
     parser.add_argument('end', type=str, help='End date or time (uses dateparser)')
     parser.add_argument('symbols', nargs='+', help='Symbols to retrieve')
-    parser.add_argument('-F', dest='format', type=str, default='csv', help='Output format, default to CSV')
+    parser.add_argument('-F', dest='format', type=str, choices=list(writers),
+                        help='Output format, default terminal, or csv when writing to a file')
     parser.add_argument('-f', dest='file', type=str, help='Output to a named file')
     resolutions = argconv(M=Resolution.MONTH, w=Resolution.WEEK, d=Resolution.DAY, m=Resolution.MINUTE, f=Resolution.FIVE_SEC)
     parser.add_argument('-r', dest='resolution', type=resolutions, help='Resolution type', default=Resolution.DAY)
+    parser.add_argument('--history', dest='history', type=str, help='History store directory, to fetch only what it is missing')
+    parser.add_argument('-j', dest='jobs', type=int, default=4, help='Number of symbols to fetch at once, default 4')
     args = parser.parse_args()
-
-    with Timer('fetch'):
-        data_frames = []
-        for symbol in args.symbols:
-            symbol = symbol.upper()
-            data_frames.append(fetch(args.source, symbol, args.start, args.end, args.resolution))
-    for index, df in enumerate(data_frames):
-        print(f'{df.shape[0]} {args.resolution.name.lower()}(s) of data for {args.symbols[index].upper()}:')
-        print_data_frame(args.symbols[index], df)
+    history = HistoryStore(args.history) if args.history else None
+
+    def timed_fetch(symbol):
+        timer = Timer(symbol)
+        return fetch(args.source, symbol, args.start, args.end, args.resolution, history), timer.total()
+
+    writer = open_writer(args.format or ('csv' if args.file else 'terminal'), args.file)
+    # Keep progress out of the data when the data goes to standard output
+    report = print if args.file or isinstance(writer, TerminalWriter) else partial(print, file=sys.stderr)
+    unit = f'{args.resolution.name.lower()}(s)'
+    with Timer('fetch') as timer, ThreadPoolExecutor(max_workers=args.jobs, thread_name_prefix='fetch') as executor:
+        futures = {executor.submit(timed_fetch, symbol.upper()): symbol.upper() for symbol in args.symbols}
+        for future in as_completed(futures):  # Stream each symbol out as soon as it arrives
+            symbol = futures[future]
+            try:
+                df, elapsed = future.result()
+            except Exception as e:
+                console.warn(f'Failed to fetch {symbol}: {e}')
+                continue
+            timer.add(df.shape[0], unit)
+            report(f'{df.shape[0]} {unit} of data for {symbol} in {elapsed:.3f}s ({df.shape[0] / elapsed:.0f}/s):')
+            writer.write(symbol, df)
+    writer.close()
+    _log.info(f'Request cache: {request_cache.stats}. In flight: {in_flight.stats}')
 
 
 def argconv(**convs):
@@ -76,15 +126,9 @@ def argconv(**convs):
 
 
 def print_data_frame(symbol, df: DataFrame, verbose=False):
-    prev_close = None
-    prev_ref_price = None
-    for index, row in df.iterrows():
-        date = index if type(index) is datetime else dateparser.parse(str(index))
-        args = [row[label] for label in df]
-        args.extend([prev_close, prev_ref_price])
-        print(render_bar_data(symbol.upper(), date, *args))
-        prev_close = row['Close']
-        prev_ref_price = row[4]
+    writer = TerminalWriter(sys.stdout)
+    writer.write(symbol, df)
+    writer.close()
     if verbose:
         print(df.describe(include='all'))
 
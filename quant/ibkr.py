@@ -5,12 +5,13 @@ from ibapi.scanner import ScannerSubscription
 from ibapi.tag_value import TagValue
 
 from .broker import Broker, Position, Direction, Order as BrokerOrder, OrderStatus, OrderEvent
-from .util.timeutil import spans_days, count_trading_days, parse_date
-from .util.misc import decimal as d
+from .util.timeutil import spans_days, count_trading_days, parse_date, to_epoch_ns, trading_sessions
+from .util.price import price
 from .markets import Resolution, WatchList, DataRequest, SymbolData, Symbols, TickEvent, TickBar
 from .util import events, channels
 from .util.timeutil import Timer
-from .util.channel import CallChannels
+from .util.channel import CallChannels, CallChannel
+from .util.ratelimit import SlidingWindow
 
 from ibapi.client import EClient
 from ibapi.commission_report import CommissionReport
@@ -20,7 +21,10 @@ from ibapi.wrapper import EWrapper, OrderId, Order
 from ibapi.contract import Contract, ContractDetails
 import threading
 import time
-from datetime import datetime
+import math
+from collections import deque
+from datetime import datetime, timedelta
+import numpy as np
 import logging
 from typing import Callable
 
@@ -30,27 +34,69 @@ logging.getLogger('ibapi').setLevel(logging.INFO)
 
 LIVE_TRADING_PORT = 7496
 SIMULATED_TRADING_PORT = 7497
-CONNECTION_ID = 1
+CONNECTION_ID = 1  # Default IBKR client id. Each process connected at once needs its own
+PUBLISHER_CONNECTION_ID = 2  # Defaults for the publisher and server, so they can run alongside a trader
+SERVER_CONNECTION_ID = 3
+HISTORICAL_DATA_ERROR = 162  # Both "HMDS query returned no data" and pacing violations
+WARNING_CODES = {*range(2100, 2200), 10167}  # Reported through error() but not failures, e.g. data farm status
+MAX_HISTORICAL_IN_FLIGHT = 4
+HISTORICAL_TIMEOUT = 30
+HISTORICAL_PACING = ((6, 2.), (60, 600.))  # No more than 6 requests in 2 seconds, or 60 in 10 minutes
+
+# Most bars IBKR serves in one historical request, per bar size. 5 second bars are limited to 3600 S,
+# 1 minute bars to 1 D and daily or longer bars to 1 Y.
+# See https://interactivebrokers.github.io/tws-api/historical_limitations.html
+MAX_BARS_PER_REQUEST = {
+    Resolution.FIVE_SEC: 720,
+    Resolution.MINUTE: 1440,
+    Resolution.DAY: 365,
+    Resolution.WEEK: 52,
+    Resolution.MONTH: 12,
+}
+
+
+class IBKRError(Exception):
+    """An error IBKR reported for one request"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f'{code}: {message}')
+        self.code = code
+
+
+class HistoricalDataError(IBKRError):
+    """IBKR refused a historical data request, for example for a pacing violation. The data may well exist"""
 
 
 class BrokerContext:
-    def __init__(self):
-        self.started = False
+    """
+    Connects to IBKR for the duration of a block. Nested and concurrent blocks share the connection, which is shut
+    down when the last of them exits, if it was one of them that started it.
+    """
+
+    _lock = threading.Lock()
+    _users = 0
+    _started = False
 
     def __enter__(self):
-        self.started = IBApi.instance().start()
+        with BrokerContext._lock:
+            if not BrokerContext._users:
+                BrokerContext._started = bool(IBApi.instance().start())
+            BrokerContext._users += 1
         return IBApi.instance()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.started:
-            IBApi.instance().shutdown()
+        with BrokerContext._lock:
+            BrokerContext._users -= 1
+            if not BrokerContext._users and BrokerContext._started:
+                IBApi.instance().shutdown()
+                BrokerContext._started = False
 
 
 class InteractiveBroker(Broker):
 
-    def __init__(self, watchlist: WatchList):
+    def __init__(self, watchlist: WatchList, client_id: int = None):
         super().__init__(watchlist)
-        self.ib = IBApi.instance()
+        self.ib = IBApi.instance(client_id)
 
     def start(self):
         self.ib.start()
@@ -77,7 +123,8 @@ class InteractiveBroker(Broker):
             order, index = self.book.by_order_id(order_id)
             if type(filled) is float and not filled.is_integer():
                 _log.warning('Fractional order fill!')
-            order = order.update_status(status, d(avg_fill_price), filled)
+            filled_at = price(avg_fill_price, Symbols.price_scale(order.position.symbol))
+            order = order.update_status(status, filled_at, filled)
             self.book[index] = order
             events.emit(OrderEvent(order))
         except KeyError:
@@ -89,22 +136,29 @@ class IBApi(EWrapper, EClient):
     _instance = None
 
     @staticmethod
-    def instance():
+    def instance(client_id: int = None):
+        """The process's connection. `client_id` sets the IBKR client id it connects with, until it is connected"""
         if not IBApi._instance:
             IBApi._instance = IBApi()
+        if client_id is not None and client_id != IBApi._instance.client_id:
+            if IBApi._instance.is_connected:
+                raise ValueError(f'Already connected as client {IBApi._instance.client_id}, not {client_id}')
+            IBApi._instance.client_id = client_id
         return IBApi._instance
 
-    def __init__(self):
+    def __init__(self, client_id: int = CONNECTION_ID):
         EClient.__init__(self, self)
+        self.client_id = client_id
         self.thread_running = False
         self.orders = None
         self.is_connected = False
         self.subscriptions = {}
+        self._pacing = SlidingWindow(*HISTORICAL_PACING)
 
     def start(self):
         if not self.is_connected:
-            _log.info('Connecting to IB Server')
-            self.connect('127.0.0.1', SIMULATED_TRADING_PORT, CONNECTION_ID)
+            _log.info(f'Connecting to IB Server as client {self.client_id}')
+            self.connect('127.0.0.1', SIMULATED_TRADING_PORT, self.client_id)
             self.is_connected = True
         if not self.thread_running:
             _log.info('Starting IB Thread')
@@ -157,7 +211,7 @@ class IBApi(EWrapper, EClient):
         if symbol not in self.subscriptions:
             raise ValueError(f'Not subscribed to {symbol}')
         _log.info(f'Unsubscribing to realtime data for {symbol}')
-        channel = self.subscriptions[symbol]
+        channel = self.subscriptions.pop(symbol)
         self.cancelRealTimeBars(channel.key)
         channel.close()
 
@@ -167,11 +221,60 @@ class IBApi(EWrapper, EClient):
     def scannerParameters(self, xml: str):
         channels.channel_for('scannerParams').close(xml)
 
-    def req_historical_data(self, request: DataRequest) -> SymbolData:
-        """Blocking call to underlying API"""
+    def req_historical_data(self, request: DataRequest, max_in_flight=MAX_HISTORICAL_IN_FLIGHT) -> SymbolData:
+        """
+        Blocking call to underlying API. Requests larger than IBKR serves at once are split into chunks, with up to
+        `max_in_flight` outstanding at a time, and stitched back together in order.
+        """
+        chunks = plan_chunks(request)
+        if not chunks:
+            _log.info(f'No trading hours in {request}')
+            return SymbolData(request.symbol, resolution=request.resolution)
+        if len(chunks) == 1:
+            return self._historical_result(self.start_historical_data(chunks[0]))
+        _log.info(f'Requesting {request} as {len(chunks)} chunks')
+        parts, in_flight = [], deque()
+        try:
+            for chunk in chunks:
+                if len(in_flight) == max_in_flight:
+                    parts.append(self._historical_result(in_flight.popleft()))
+                in_flight.append(self.start_historical_data(chunk))
+            while in_flight:
+                parts.append(self._historical_result(in_flight.popleft()))
+        except Exception:
+            for channel in in_flight:  # Abandoned: don't leave them using up IBKR's pacing allowance
+                self.cancelHistoricalData(channel.key)
+                channel.fail(IBKRError(0, 'Cancelled'))
+            raise
+        symbol_data = SymbolData.concat(parts)
+        dates = symbol_data.dates
+        first, last = (np.searchsorted(dates, to_epoch_ns(t)) for t in (request.start, request.end))
+        return SymbolData.from_arrays(request.symbol, dates[first:last],
+                                      {label: symbol_data.column(label)[first:last] for label in SymbolData.labels},
+                                      symbol_data.tz, request.resolution)
+
+    def _pace(self):
+        """Spaces out historical requests to stay inside IBKR's pacing limits"""
+        wait = self._pacing.acquire()
+        if wait > 1:
+            _log.info(f'Waited {wait:.1f}s to stay inside IBKR historical data pacing limits')
+
+    def _historical_result(self, channel: CallChannel) -> SymbolData:
+        """A historical request's data. Raises if it failed, or timed out (after cancelling it)"""
+        try:
+            return channel.result(HISTORICAL_TIMEOUT)
+        except TimeoutError:
+            self.cancelHistoricalData(channel.key)
+            channel.fail(TimeoutError(f'Historical data for {channel.metadata} timed out'))
+            raise
 
-        symbol_data = SymbolData(request.symbol)
-        channel = channels.next_channel(metadata=request.symbol, result=symbol_data)
+    def start_historical_data(self, request: DataRequest) -> CallChannel:
+        """
+        Requests historical data without waiting for it. The returned channel completes with the SymbolData when the
+        last bar arrives; get it with result(timeout), or await it
+        """
+        symbol_data = SymbolData(request.symbol, capacity=request.expected_size(), resolution=request.resolution)
+        channel = channels.next_channel(metadata=request.symbol, data=symbol_data)
         channel.add_callback(symbol_data.append_bar)
 
         def make_request():
@@ -183,9 +286,10 @@ class IBApi(EWrapper, EClient):
             what_to_show = 'MIDPOINT' if Symbols.is_forex(request.symbol) else 'TRADES'
             _log.debug(f'Requesting historical data. IBKR request:'
                        f' req_id: {channel.key} query_time: {query_time} duration: {duration} bar_size: {bs}')
+            self._pace()
             self.reqHistoricalData(channel.key, contract, query_time, duration, bs, what_to_show, 1, 1, False, [])
 
-        return channel.call(make_request)
+        return channel.start(make_request)
 
     def create_scanner(self, tags, callback):
         scanner = ScannerSubscription()
@@ -227,6 +331,17 @@ class IBApi(EWrapper, EClient):
     def error(self, req_id: TickerId, error_code: int, error_str: str):
         super().error(req_id, error_code, error_str)
         _log.error(f'Error. Id:{req_id}, Code: {error_code}, Msg:, {error_str}')
+        channel = channels.get(req_id)
+        if channel is None or error_code in WARNING_CODES:
+            return
+        if self.subscriptions.get(channel.metadata) is channel:
+            del self.subscriptions[channel.metadata]  # Refused: subscribe again on the next pass
+        if error_code == HISTORICAL_DATA_ERROR and 'returned no data' in error_str:
+            channel.close()  # Nothing is coming for this request, don't wait it out
+        elif error_code == HISTORICAL_DATA_ERROR:
+            channel.fail(HistoricalDataError(error_code, error_str))  # Pacing violation: not the same as no data
+        else:
+            channel.fail(IBKRError(error_code, error_str))
 
     def execDetails(self, req_id: int, contract: Contract, execution: Execution):
         super().execDetails(req_id, contract, execution)
@@ -235,14 +350,18 @@ class IBApi(EWrapper, EClient):
 
     def historicalData(self, req_id, bar: BarData):
         _log.debug(f'Received historical data: {bar!r}')
+        channel = channels.get(req_id)
+        if channel is None:
+            return  # Failed or cancelled: the rest of its bars are of no use
         date = parse_date(bar.date).astimezone()
-        channel = channels.channel_for(req_id)
         tick_bar = to_tick_bar(channel.metadata, date, bar.open, bar.high, bar.low, bar.close, bar.average, bar.volume)
         channel.on_data(tick_bar)
 
     def historicalDataEnd(self, req_id: int, start: str, end: str):
         _log.debug(f'Completed historical data request {req_id}')
-        channels.channel_for(req_id).close()
+        channel = channels.get(req_id)
+        if channel is not None:
+            channel.close()
 
     def nextValidId(self, order_id):
         _log.info(f'Connection ready. Next valid ID: {order_id}')
@@ -260,7 +379,9 @@ class IBApi(EWrapper, EClient):
     def realtimeBar(self, req_id: TickerId, date: int, open_: float, high: float, low: float, close: float,
                     volume: int, wap: float, count: int):
         _log.debug(f'Received realtime bar for {req_id}')
-        channel = channels.channel_for(req_id)
+        channel = channels.get(req_id)
+        if channel is None:
+            return  # Unsubscribed or refused
         tick_bar = to_tick_bar(channel.metadata, date, open_, high, low, close, wap, volume)
         channel.on_data(tick_bar)
 
@@ -282,8 +403,7 @@ def to_tick_bar(symbol: str, date, open_: float, high: float, low: float, close:
         date = datetime.utcfromtimestamp(date).astimezone()
     elif type(date) is str:
         date = parse_date(date).astimezone()
-    open_, high, low, close, wap = d(open_), d(high), d(low), d(close), d(wap)
-    return TickBar(symbol, date, open_, high, low, close, wap, volume)
+    return TickBar.new(symbol, date, open_, high, low, close, wap, volume)
 
 
 def bar_size(resolution: Resolution):
@@ -332,14 +452,38 @@ def forex_contract(symbol):
 
 
 def to_time_string(start: datetime, end: datetime):
-    if spans_days(start, end):
+    if spans_days(start, end) and end - start >= timedelta(days=1):
         total_days, trading_days = count_trading_days(start, end)
         return f'{trading_days if trading_days else total_days} D'  # Include end day
     else:
-        secs = (end - start).total_seconds()
+        secs = math.ceil((end - start).total_seconds())
         return f'{secs} S'
 
 
+def plan_chunks(request: DataRequest) -> list[DataRequest]:
+    """
+    Splits a request into consecutive requests no larger than IBKR serves at once. Requests are made for regular
+    trading hours only, so intraday stock requests are only planned over the trading sessions within the request.
+    """
+    max_bars = MAX_BARS_PER_REQUEST.get(request.resolution)
+    if max_bars is None:
+        return [request]
+    sessions = [(request.start, request.end)]
+    if request.resolution.value < Resolution.DAY.value and \
+            not (Symbols.is_forex(request.symbol) or Symbols.is_crypto(request.symbol)):
+        sessions = trading_sessions(request.start, request.end)
+    if sessions == [(request.start, request.end)] and request.expected_size() <= max_bars:
+        return [request]
+    step = timedelta(seconds=max_bars * request.resolution.value)
+    chunks = []
+    for start, session_end in sessions:
+        while start < session_end:
+            end = min(start + step, session_end)
+            chunks.append(request._replace(start=start, end=end))
+            start = end
+    return chunks
+
+
 def to_order_status(status: str) -> OrderStatus:
     if status in ('ApiPending', 'PendingSubmit', 'PendingCancel', 'PreSubmitted'):
         return OrderStatus.PENDING
@@ -0,0 +1,201 @@
+"""
+ Technical indicators, computed either incrementally from a stream of bars or in one vectorized pass over a
+ SymbolData. Both paths perform the same floating point operations in the same order, so they agree exactly and
+ a batch warm-up can be continued by the streaming path.
+"""
+from __future__ import annotations
+
+from .markets import TickBar, TickEvent, SymbolData
+from .util import events
+
+from abc import ABC, abstractmethod
+from typing import Callable
+import numpy as np
+import pandas as pd
+import logging
+
+_log = logging.getLogger(__name__)
+
+_DAY_NS = 86_400 * 1_000_000_000
+_EPOCH_ORDINAL = 719_163  # date(1970, 1, 1).toordinal()
+
+
+class Indicator(ABC):
+    """Running state for one indicator on one symbol"""
+
+    value: float | None = None
+
+    @abstractmethod
+    def update(self, bar: TickBar) -> float:
+        """Advances the indicator by one bar in O(1) and returns its new value"""
+
+    @abstractmethod
+    def batch(self, data: SymbolData) -> np.ndarray:
+        """Computes the indicator for every bar of `data`, leaving the running state as of the last bar"""
+
+
+class Smoother:
+    """
+    Exponential smoothing with the exact arithmetic of pandas' ewm(alpha=..., adjust=False).mean(), which
+    serves as its batch form
+    """
+
+    def __init__(self, alpha: float):
+        self.alpha_arg = alpha
+        self.alpha = 1. / (1. + (1. - alpha) / alpha)  # As pandas derives it from the center of mass
+        self.decay = 1. - self.alpha
+        self.value = None
+
+    def update(self, x: float) -> float:
+        if self.value is None:
+            self.value = x
+        elif self.value != x:
+            self.value = (self.decay * self.value + self.alpha * x) / (self.decay + self.alpha)
+        return self.value
+
+    def batch(self, values: np.ndarray) -> np.ndarray:
+        smoothed = pd.Series(values).ewm(alpha=self.alpha_arg, adjust=False).mean().to_numpy()
+        self.value = float(smoothed[-1]) if len(smoothed) else None
+        return smoothed
+
+
+class Vwap(Indicator):
+    """Volume weighted average of the bars' Ref Price, reset at the start of each (local) day"""
+
+    def __init__(self):
+        self.day = None
+        self.price_volume = 0.
+        self.volume = 0
+
+    def update(self, bar: TickBar) -> float:
+        day = bar.date.toordinal() - _EPOCH_ORDINAL
+        if day != self.day:
+            self.day, self.price_volume, self.volume = day, 0., 0
+        wap = float(bar.wap)
+        self.price_volume += wap * bar.volume
+        self.volume += bar.volume
+        self.value = self.price_volume / self.volume if self.volume else wap
+        return self.value
+
+    def batch(self, data: SymbolData) -> np.ndarray:
+        if not len(data):
+            return np.empty(0)
+        wap, volume = data.column('Ref Price'), data.column('Volume')
+        days = data.date_index.tz_localize(None).as_unit('ns').asi8 // _DAY_NS
+        sessions = np.flatnonzero(np.diff(days, prepend=days[0] - 1))
+        price_volume, cum_volume = np.empty(len(data)), np.empty(len(data), dtype=np.int64)
+        for start, end in zip(sessions, np.append(sessions[1:], len(data))):
+            price_volume[start:end] = np.cumsum(wap[start:end] * volume[start:end])
+            cum_volume[start:end] = np.cumsum(volume[start:end])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            vwap = np.where(cum_volume > 0, price_volume / cum_volume, wap)
+        self.day = int(days[-1])
+        self.price_volume, self.volume, self.value = float(price_volume[-1]), int(cum_volume[-1]), float(vwap[-1])
+        return vwap
+
+
+class Ema(Indicator):
+    """Exponential moving average of Close over `periods` bars"""
+
+    def __init__(self, periods: int):
+        self.smoother = Smoother(2 / (periods + 1))
+
+    def update(self, bar: TickBar) -> float:
+        self.value = self.smoother.update(float(bar.close))
+        return self.value
+
+    def batch(self, data: SymbolData) -> np.ndarray:
+        ema = self.smoother.batch(data.column('Close'))
+        self.value = self.smoother.value
+        return ema
+
+
+class Atr(Indicator):
+    """Average true range over `periods` bars, with Wilder's smoothing"""
+
+    def __init__(self, periods: int = 14):
+        self.smoother = Smoother(1 / periods)
+        self.prev_close = None
+
+    def update(self, bar: TickBar) -> float:
+        high, low = float(bar.high), float(bar.low)
+        true_range = high - low
+        if self.prev_close is not None:
+            true_range = max(true_range, abs(high - self.prev_close), abs(low - self.prev_close))
+        self.prev_close = float(bar.close)
+        self.value = self.smoother.update(true_range)
+        return self.value
+
+    def batch(self, data: SymbolData) -> np.ndarray:
+        if not len(data):
+            return np.empty(0)
+        high, low, close = data.column('High'), data.column('Low'), data.column('Close')
+        prev_close = np.roll(close, 1)
+        true_range = np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+        true_range[0] = high[0] - low[0]
+        atr = self.smoother.batch(true_range)
+        self.prev_close, self.value = float(close[-1]), self.smoother.value
+        return atr
+
+
+class Rsi(Indicator):
+    """Relative strength index over `periods` bars, with Wilder's smoothing. 50 until there is any movement"""
+
+    def __init__(self, periods: int = 14):
+        self.gains = Smoother(1 / periods)
+        self.losses = Smoother(1 / periods)
+        self.prev_close = None
+
+    def update(self, bar: TickBar) -> float:
+        close = float(bar.close)
+        change = close - self.prev_close if self.prev_close is not None else 0.
+        self.prev_close = close
+        gain, loss = self.gains.update(max(change, 0.)), self.losses.update(max(-change, 0.))
+        self.value = 100. - 100. / (1. + gain / loss) if loss else 100. if gain else 50.
+        return self.value
+
+    def batch(self, data: SymbolData) -> np.ndarray:
+        if not len(data):
+            return np.empty(0)
+        close = data.column('Close')
+        change = np.diff(close, prepend=close[0])
+        gain, loss = self.gains.batch(np.maximum(change, 0.)), self.losses.batch(np.maximum(-change, 0.))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rsi = np.where(loss > 0, 100. - 100. / (1. + gain / loss), np.where(gain > 0, 100., 50.))
+        self.prev_close, self.value = float(close[-1]), float(rsi[-1])
+        return rsi
+
+
+class IndicatorEngine:
+    """
+    Keeps a set of indicators per symbol, updated from TickEvents as they arrive. Indicators are given as
+    factories, for example {'vwap': Vwap, 'ema9': partial(Ema, 9)}, and created the first time a symbol is seen.
+    """
+
+    def __init__(self, indicators: dict[str, Callable[[], Indicator]]):
+        self.factories = indicators
+        self.indicators: dict[str, dict[str, Indicator]] = {}
+        events.observe(TickEvent, lambda event: self.update(event.tick_bar))
+
+    def _for(self, symbol) -> dict[str, Indicator]:
+        if symbol not in self.indicators:
+            self.indicators[symbol] = {name: factory() for name, factory in self.factories.items()}
+        return self.indicators[symbol]
+
+    def update(self, bar: TickBar) -> dict[str, float]:
+        return {name: indicator.update(bar) for name, indicator in self._for(bar.symbol).items()}
+
+    def warm_up(self, data: SymbolData) -> dict[str, np.ndarray]:
+        """Runs the indicators over history in batch, so that streaming continues from its last bar"""
+        _log.info(f'Warming up {len(self.factories)} indicators on {len(data)} bars of {data.symbol}')
+        self.indicators.pop(data.symbol, None)
+        return {name: indicator.batch(data) for name, indicator in self._for(data.symbol).items()}
+
+    def values(self, symbol) -> dict[str, float]:
+        return {name: indicator.value for name, indicator in self._for(symbol).items()}
+
+    def __getitem__(self, symbol) -> dict[str, float]:
+        return self.values(symbol)
+
+    def __contains__(self, symbol):
+        return symbol in self.indicators
@@ -0,0 +1,223 @@
+"""
+ An append-only binary journal of the TickEvents and OrderEvents a session emitted, and a replayer that memory maps
+ it and emits them again, at the recorded pace, a multiple of it or as fast as possible.
+
+ Layout (little endian): a RECORD_SIZE byte header (magic b'QJNL', format version, record size), then fixed size
+ records. Prices are stored as integer ticks with their scale, so they replay exactly. Symbols are numbered: a
+ SYMBOL record names each number the first time it is used, so tick and order records hold just the number.
+"""
+from __future__ import annotations
+
+from .broker import Direction, Order, OrderEvent, OrderStatus, Position
+from .markets import TickBar, TickEvent
+from .replay import ReplayClock
+from .util import events
+from .util.events import Event
+from .util.price import Price
+from .util.timeutil import to_epoch_ns, from_epoch_ns, utc_offset_minutes, offset_tz
+
+from typing import Callable, Iterator
+import numpy as np
+import os
+import struct
+import threading
+import time
+import logging
+
+_log = logging.getLogger(__name__)
+
+MAGIC = b'QJNL'
+VERSION = 2  # 2: filled quantities are doubles, as IB reports them
+EXTENSION = '.qjnl'
+FLUSH_BYTES = 1 << 16
+CHUNK_RECORDS = 65_536
+
+SYMBOL, TICK, ORDER = 0, 1, 2
+
+# One layout per kind of record, all the same size. The first 16 bytes are common to all of them
+_COMMON = [('kind', 'u1'), ('scale', 'u1'), ('utc_offset', '<i2'), ('symbol', '<u4'), ('recorded', '<i8')]
+TICK_DTYPE = np.dtype(_COMMON + [('date', '<i8'), ('open', '<i8'), ('high', '<i8'), ('low', '<i8'),
+                                 ('close', '<i8'), ('wap', '<i8'), ('volume', '<i8')])
+RECORD_SIZE = TICK_DTYPE.itemsize
+SYMBOL_DTYPE = np.dtype({'names': [n for n, _ in _COMMON] + ['name'],
+                         'formats': [f for _, f in _COMMON] + ['S32'],
+                         'offsets': [0, 1, 2, 4, 8, 16], 'itemsize': RECORD_SIZE})
+ORDER_DTYPE = np.dtype({'names': [n for n, _ in _COMMON] + ['order_id', 'direction', 'quantity', 'status',
+                                                            'filled_at', 'filled_quantity'],
+                        'formats': [f for _, f in _COMMON] + ['<i8', '<i8', '<i8', '<i8', '<i8', '<f8'],
+                        'offsets': [0, 1, 2, 4, 8, 16, 24, 32, 40, 48, 56], 'itemsize': RECORD_SIZE})
+
+_HEADER = struct.Struct('<4sII')
+_TICK = struct.Struct('<BBhIqq5qq')
+_SYMBOL = struct.Struct(f'<BBhIq32s{RECORD_SIZE - 48}x')
+_ORDER = struct.Struct(f'<BBhIq5qd{RECORD_SIZE - 64}x')
+
+
+class JournalFormatError(Exception):
+    pass
+
+
+def _whole(value, name: str) -> int:
+    """An integral value (int, float or Decimal) as an int, refusing to silently round away a fraction"""
+    whole = round(value)
+    if whole != value:
+        raise ValueError(f'{name} {value} is not a whole number')
+    return whole
+
+
+class Journal:
+    """
+    Records events to the end of a journal file as they are emitted. Recording packs a record into a buffer, which
+    is written out every FLUSH_BYTES and when stopped, so it costs the emitting thread about a microsecond.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.symbols: dict[str, int] = {}
+        self.count = 0
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._observers = []
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            self.symbols = {name: number for number, name in read(path)[1].items()}
+            _truncate_partial(path)
+        self.file = open(path, 'ab')
+        if not exists:
+            self.file.write(_HEADER.pack(MAGIC, VERSION, RECORD_SIZE).ljust(RECORD_SIZE, b'\0'))
+
+    def start(self) -> Journal:
+        """Records every TickEvent and OrderEvent from now on"""
+        _log.info(f'Journaling events to {self.path}')
+        self._observers = [(TickEvent, events.observe(TickEvent, self.record)),
+                           (OrderEvent, events.observe(OrderEvent, self.record))]
+        return self
+
+    def stop(self):
+        for clazz, observer in self._observers:
+            events.stop_observing(clazz, observer)
+        self._observers = []
+        self.close()
+
+    def _symbol(self, symbol: str, recorded: int) -> int:
+        number = self.symbols.get(symbol)
+        if number is None:
+            number = self.symbols[symbol] = len(self.symbols)
+            self._buffer += _SYMBOL.pack(SYMBOL, 0, 0, number, recorded, symbol.encode())
+        return number
+
+    def record(self, event: Event):
+        recorded = time.time_ns()
+        with self._lock:
+            if isinstance(event, TickEvent):
+                bar = event.tick_bar
+                self._buffer += _TICK.pack(TICK, bar.close.scale, utc_offset_minutes(bar.date),
+                                           self._symbol(bar.symbol, recorded), recorded, to_epoch_ns(bar.date),
+                                           *(Price.of(price, bar.close.scale).ticks for price in bar[2:7]), bar.volume)
+            elif isinstance(event, OrderEvent):
+                order = event.order
+                position = order.position
+                self._buffer += _ORDER.pack(ORDER, order.filled_at.scale, 0, self._symbol(position.symbol, recorded),
+                                            recorded, order.order_id, position.direction.value,
+                                            _whole(position.quantity, 'Order quantity'), order.status.value,
+                                            order.filled_at.ticks, float(order.filled_quantity or 0))
+            else:
+                raise TypeError(f'Cannot journal {type(event).__name__}')
+            self.count += 1
+            if len(self._buffer) >= FLUSH_BYTES:
+                self._write()
+
+    def _write(self):
+        self.file.write(self._buffer)
+        self._buffer.clear()
+
+    def flush(self):
+        with self._lock:
+            self._write()
+            self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+        _log.info(f'Journaled {self.count} events to {self.path}')
+
+
+def _truncate_partial(path: str):
+    """Drops a record left half written by a crash, so appending stays aligned"""
+    extra = (os.path.getsize(path) - RECORD_SIZE) % RECORD_SIZE
+    if extra:
+        _log.warning(f'Dropping a partial record of {extra} bytes from {path}')
+        os.truncate(path, os.path.getsize(path) - extra)
+
+
+def read(path: str) -> tuple[np.memmap, dict[int, str]]:
+    """The records of a journal, memory mapped as TICK_DTYPE, and its symbol table. A partial last record is ignored"""
+    with open(path, 'rb') as file:
+        magic, version, record_size = _HEADER.unpack(file.read(_HEADER.size))
+    if magic != MAGIC:
+        raise JournalFormatError(f'{path} is not a journal')
+    if version != VERSION or record_size != RECORD_SIZE:
+        raise JournalFormatError(f'Unsupported journal version {version} with {record_size} byte records in {path}')
+    count = (os.path.getsize(path) - RECORD_SIZE) // RECORD_SIZE
+    if not count:
+        return np.empty(0, dtype=TICK_DTYPE), {}
+    records = np.memmap(path, dtype=TICK_DTYPE, mode='r', offset=RECORD_SIZE, shape=(count,))
+    named = records[records['kind'] == SYMBOL].view(SYMBOL_DTYPE)
+    return records, dict(zip(named['symbol'].tolist(), (name.decode() for name in named['name'].tolist())))
+
+
+def replay_events(records: np.ndarray, symbols: dict[int, str]) -> Iterator[tuple[int, Event]]:
+    """The journaled events as (recorded epoch nanoseconds, event), converted a chunk of records at a time"""
+    for start in range(0, len(records), CHUNK_RECORDS):
+        chunk = records[start:start + CHUNK_RECORDS]
+        kinds, scales, offsets, numbers, recorded = (chunk[name].tolist() for name in TICK_DTYPE.names[:5])
+        ticks = list(zip(*(chunk[name].tolist() for name in TICK_DTYPE.names[5:])))
+        zones = {offset: offset_tz(offset) for offset in set(offsets)}
+        fills = chunk.view(ORDER_DTYPE)['filled_quantity'].tolist() if ORDER in kinds else None
+        for i, kind in enumerate(kinds):
+            if kind == TICK:
+                date, open_, high, low, close, wap, volume = ticks[i]
+                scale = scales[i]
+                bar = TickBar(symbols[numbers[i]], from_epoch_ns(date, zones[offsets[i]]), Price(open_, scale),
+                              Price(high, scale), Price(low, scale), Price(close, scale), Price(wap, scale), volume)
+                yield recorded[i], TickEvent(bar)
+            elif kind == ORDER:
+                order_id, direction, quantity, status, filled_at = ticks[i][:5]
+                position = Position(symbols[numbers[i]], Direction(direction), quantity)
+                order = Order(position, OrderStatus(status), order_id, Price(filled_at, scales[i]), fills[i])
+                yield recorded[i], OrderEvent(order)
+
+
+class JournalReplay:
+    """Emits a journal's events again in the order they were recorded, paced by a ReplayClock"""
+
+    def __init__(self, path: str, speed: float = 1., emit: Callable = events.emit):
+        self.path = path
+        self.speed = speed
+        self.emit = emit
+        self.stopped = False
+        self._interrupt = threading.Event()
+
+    def run(self) -> int:
+        """Replays the journal once and returns the number of events emitted"""
+        records, symbols = read(self.path)
+        clock, count = ReplayClock(self.speed, self._interrupt), 0
+        start = time.perf_counter()
+        for recorded, event in replay_events(records, symbols):
+            if self.stopped:
+                break
+            clock.wait_until(recorded)
+            self.emit(event)
+            count += 1
+        elapsed = time.perf_counter() - start
+        _log.info(f'Replayed {count} events from {self.path} in {elapsed:.3f}s')
+        return count
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopped = True
+        self._interrupt.set()
@@ -1,15 +1,19 @@
 from __future__ import annotations
 
-from .util.events import Event, observe
-from .util.misc import decimal as d
+from .util.events import AsyncObserver, Event, Overflow, observe, stop_observing
+from .util.price import Price, price
 from .util import console
+from .util.timeutil import local_tz, to_epoch_ns, from_epoch_ns
 
+import numpy as np
 import pandas as pd
-from decimal import Decimal
-from typing import NamedTuple
-from datetime import datetime
+from typing import NamedTuple, Iterable, Callable, Mapping
+from types import MappingProxyType
+from datetime import datetime, timedelta
 from enum import Enum
 import dateparser
+import threading
+import weakref
 import logging
 
 _log = logging.getLogger(__name__)
@@ -67,20 +71,28 @@ class Symbols:
     def is_forex(symbol):
         return symbol.upper() in ('EUR', 'BTC')
 
+    @staticmethod
+    def price_scale(symbol):
+        """Number of decimal places prices for this symbol are held to"""
+        return 5 if Symbols.is_forex(symbol) else 2
+
 
 class TickBar(NamedTuple):
     symbol: str
     date: datetime
-    open: Decimal
-    high: Decimal
-    low: Decimal
-    close: Decimal
-    wap: Decimal
+    open: Price
+    high: Price
+    low: Price
+    close: Price
+    wap: Price
     volume: int
 
     @staticmethod
     def new(symbol: str, date: datetime, open_: float, high: float, low: float, close: float, wap: float, volume: int):
-        return TickBar(symbol, date, d(open_), d(high), d(low), d(close), d(wap), volume)
+        scale = Symbols.price_scale(symbol)
+        f = 10 ** scale
+        return TickBar(symbol, date, Price(round(open_ * f), scale), Price(round(high * f), scale),
+                       Price(round(low * f), scale), Price(round(close * f), scale), Price(round(wap * f), scale), volume)
 
     def to_gql(self):
         return {
@@ -99,101 +111,508 @@ class TickEvent(Event):
     def __init__(self, tick_bar: TickBar):
         self.tick_bar = tick_bar
 
+    @property
+    def key(self):
+        return self.tick_bar.symbol
+
     def __str__(self):
         return f'{self.__class__.__name__}({self.tick_bar.to_gql()})'
 
 
 class SymbolData:
+    """
+    Bar data for a single symbol, stored as typed NumPy columns. The columns are preallocated and grow
+    geometrically, so appending a bar is a handful of array stores rather than a batch of new objects.
+    """
 
     labels = ['Open', 'High', 'Low', 'Close', 'Ref Price', 'Volume']
+    dtypes = {'Open': np.float64, 'High': np.float64, 'Low': np.float64, 'Close': np.float64,
+              'Ref Price': np.float64, 'Volume': np.int64}
+    MIN_CAPACITY = 64
+    MAX_INITIAL_CAPACITY = 1 << 20  # Don't trust a size hint beyond ~56MB of bars
 
-    def __init__(self, symbol: str, data_frame: pd.DataFrame = None):
+    def __init__(self, symbol: str, data_frame: pd.DataFrame = None, capacity: int | float = None,
+                 resolution: Resolution = None):
         self.symbol = symbol.upper()
+        self.scale = Symbols.price_scale(self.symbol)
+        self.resolution = resolution
+        self.tz = None
+        self._frame = None
+        self._offset = 0  # Position of the first bar in the buffers
+        self._size = 0
+        self._dates = np.empty(0, dtype=np.int64)  # Epoch nanoseconds (UTC)
+        self._columns = {label: np.empty(0, dtype=dtype) for label, dtype in SymbolData.dtypes.items()}
         if data_frame is not None:
-            self.date_index = data_frame['Date']
-            self.columns = {k: v for (k, v) in data_frame.items() if k != 'Date'}
+            self._load_frame(data_frame)
         else:
-            self.date_index = []
-            self.columns = {label: [] for label in SymbolData.labels}
+            capacity = int(capacity) if capacity else SymbolData.MIN_CAPACITY
+            self.reserve(min(max(capacity, SymbolData.MIN_CAPACITY), SymbolData.MAX_INITIAL_CAPACITY))
+
+    @classmethod
+    def from_arrays(cls, symbol: str, dates, columns: dict, tz=None, resolution: Resolution = None) -> SymbolData:
+        """Wraps existing arrays (epoch nanosecond dates plus one array per label) without copying them"""
+        sd = cls(symbol, capacity=0, resolution=resolution)
+        sd.tz = tz or local_tz()
+        sd._dates = np.asarray(dates, dtype=np.int64)
+        sd._columns = {label: np.asarray(columns[label], dtype=dtype) for label, dtype in SymbolData.dtypes.items()}
+        sd._size = len(sd._dates)
+        return sd
+
+    @classmethod
+    def concat(cls, datas: Iterable[SymbolData]) -> SymbolData:
+        """Joins series of one symbol into a new one in time order. Where times repeat, the later series wins"""
+        datas = list(datas)
+        first = datas[0]
+        dates = np.concatenate([data.dates for data in datas])
+        order = np.argsort(dates, kind='stable')
+        dates = dates[order]
+        keep = np.append(dates[1:] != dates[:-1], True) if len(dates) else np.empty(0, dtype=bool)
+        order = order[keep]
+        columns = {label: np.concatenate([data.column(label) for data in datas])[order] for label in SymbolData.labels}
+        tz = next((data.tz for data in datas if data.tz is not None), None)
+        return SymbolData.from_arrays(first.symbol, dates[keep], columns, tz, first.resolution)
+
+    def _load_frame(self, data_frame: pd.DataFrame):
+        dates = data_frame['Date'] if 'Date' in data_frame.columns else data_frame.index
+        dates = pd.DatetimeIndex(dates)
+        if dates.tz is None:
+            dates = dates.tz_localize(local_tz())
+        self.tz = dates.tz
+        self._dates = dates.as_unit('ns').asi8.copy()
+        self._columns = {label: data_frame[label].to_numpy(dtype=dtype, copy=True)
+                         for label, dtype in SymbolData.dtypes.items()}
+        self._size = len(self._dates)
+
+    def reserve(self, capacity: int):
+        """Ensures room for at least `capacity` bars without reallocating"""
+        if capacity <= len(self._dates):
+            return
+        self._dates = _resized(self._dates, self._size, capacity)
+        self._columns = {label: _resized(column, self._size, capacity) for label, column in self._columns.items()}
+
+    @property
+    def capacity(self):
+        return len(self._dates)
 
     def append_bar(self, bar: TickBar):
-        self.date_index.append(bar.date)
-        self.columns['Open'].append(float(bar.open))
-        self.columns['High'].append(float(bar.high))
-        self.columns['Low'].append(float(bar.low))
-        self.columns['Close'].append(float(bar.close))
-        self.columns['Ref Price'].append(float(bar.wap))
-        self.columns['Volume'].append(bar.volume)
+        i = self._size
+        if i == len(self._dates):
+            self.reserve(max(2 * i, SymbolData.MIN_CAPACITY))
+        if self.tz is None:
+            self.tz = bar.date.tzinfo or local_tz()
+        self._dates[i] = to_epoch_ns(bar.date)
+        columns = self._columns
+        columns['Open'][i] = bar.open
+        columns['High'][i] = bar.high
+        columns['Low'][i] = bar.low
+        columns['Close'][i] = bar.close
+        columns['Ref Price'][i] = bar.wap
+        columns['Volume'][i] = bar.volume
+        self._size = i + 1
+
+    def extend_arrays(self, dates: np.ndarray, columns: dict[str, np.ndarray]):
+        """Appends a run of bars given as epoch nanosecond dates plus one array per label"""
+        start, end = self._size, self._size + len(dates)
+        if end > len(self._dates):
+            self.reserve(max(2 * len(self._dates), end, SymbolData.MIN_CAPACITY))
+        self._dates[start:end] = dates
+        for label in SymbolData.labels:
+            self._columns[label][start:end] = columns[label]
+        self._size = end
 
     def __getitem__(self, i) -> TickBar:
         return self.tick_bar(i)
 
     def tick_bar(self, i) -> TickBar:
-        r = [self.columns[key][i] for key in self.columns.keys()]
-        r.insert(0, self.date_index[i])
-        r.insert(0, self.symbol)
-        return TickBar(*r)
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError(f'Bar {i} out of range for {self.symbol} with {self._size} bars')
+        columns, scale = self._columns, self.scale
+        i += self._offset
+        return TickBar(self.symbol, from_epoch_ns(int(self._dates[i]), self.tz),
+                       price(float(columns['Open'][i]), scale),
+                       price(float(columns['High'][i]), scale),
+                       price(float(columns['Low'][i]), scale),
+                       price(float(columns['Close'][i]), scale),
+                       price(float(columns['Ref Price'][i]), scale),
+                       int(columns['Volume'][i]))
+
+    @property
+    def dates(self) -> np.ndarray:
+        """Bar times as epoch nanoseconds, a view on the underlying buffer"""
+        return self._dates[self._offset:self._offset + self._size]
+
+    @property
+    def date_index(self) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(self.dates.view('M8[ns]'), name='Date').tz_localize('UTC').tz_convert(self.tz)
+
+    def column(self, label) -> np.ndarray:
+        """A view on the filled portion of one column"""
+        return self._columns[label][self._offset:self._offset + self._size]
 
     @property
-    def data_frame(self):
-        data_frame = pd.DataFrame(index=self.date_index, data=self.columns)
-        data_frame.index.name = 'Date'
-        return data_frame
+    def columns(self) -> dict[str, np.ndarray]:
+        return {label: self.column(label) for label in SymbolData.labels}
+
+    @property
+    def data_frame(self) -> pd.DataFrame:
+        """
+        A read-only DataFrame whose columns share memory with the column buffers; only the date index is converted.
+        It is cached, and rebuilt only after more bars have been appended.
+        """
+        if self._frame is None or len(self._frame) != self._size:
+            columns = {}
+            for label in SymbolData.labels:
+                view = self.column(label)
+                view.flags.writeable = False
+                columns[label] = view
+            self._frame = pd.DataFrame(columns, index=self.date_index, copy=False)
+        return self._frame
 
     def __len__(self):
-        return len(self.date_index)
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the arrays, including spare capacity"""
+        return self._dates.nbytes + sum(column.nbytes for column in self._columns.values())
 
     def tick_bars(self):
-        for i, date in enumerate(self.date_index):
-            yield TickBar(self.symbol, date,
-                          d(self.columns['Open'][i]),
-                          d(self.columns['High'][i]),
-                          d(self.columns['Low'][i]),
-                          d(self.columns['Close'][i]),
-                          d(self.columns['Ref Price'][i]),
-                          self.columns['Volume'][i])
+        scale, factor = self.scale, 10 ** self.scale
+        for batch in self.batches():
+            # Round to ticks a batch at a time; rint rounds half to even, as price() does
+            ticks = [np.rint(column * factor).astype(np.int64).tolist() for column in batch[3:8]]
+            for date, open_, high, low, close, wap, volume in zip(batch.dates.tolist(), *ticks, batch.volume.tolist()):
+                yield TickBar(self.symbol, from_epoch_ns(date, self.tz), Price(open_, scale), Price(high, scale),
+                              Price(low, scale), Price(close, scale), Price(wap, scale), volume)
+
+    def batches(self, size=4096):
+        """Yields the bars as BarBatch column views of up to `size` bars each, without copying"""
+        dates = self.dates
+        columns = [self.column(label) for label in SymbolData.labels]
+        for start in range(0, self._size, size):
+            s = slice(start, start + size)
+            yield BarBatch(self.symbol, start, dates[s], *(column[s] for column in columns))
+
+    def window(self, n) -> BarBatch:
+        """Column views of the most recent `n` bars"""
+        start = max(self._size - n, 0)
+        return BarBatch(self.symbol, start, self.dates[start:], *(self.column(label)[start:] for label in SymbolData.labels))
+
+    def bar_view(self, i) -> BarView:
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError(f'Bar {i} out of range for {self.symbol} with {self._size} bars')
+        return BarView(self, i)
+
+    def rows(self):
+        """
+        Iterates the bars through a single BarView that is moved along the data, so no per-bar objects are created.
+        Call to_tick_bar() on the view to keep a bar beyond the current step.
+        """
+        view = BarView(self, 0)
+        for i in range(self._size):
+            view.index = i
+            yield view
 
     def condense(self, factor) -> 'SymbolData':
-        cur_ticks = len(self.date_index)
-        new_ticks = (cur_ticks // factor) + 1  # Floor division + 2
-        date_index = []
-        columns = {label: [] for label in self.columns}
-        for tick in range(new_ticks):
-            start = tick * factor
-            if start == cur_ticks:
-                break
-            end = min(start + factor, cur_ticks)  # Exclusive
-            s = slice(start, end)
-            print(s)
-            date_index.append(self.date_index[end - 1])
-            columns['Open'].append(self.columns['Open'][s][0])
-            columns['Close'].append(self.columns['Close'][s][-1])
-            columns['Low'].append(min(self.columns['Low'][s]))
-            columns['High'].append(max(self.columns['High'][s]))
-            columns['Ref Price'].append(sum(self.columns['Ref Price'][s])/factor)
-            columns['Volume'].append(sum(self.columns['Volume'][s]))
-
-        sd = SymbolData(self.symbol)
-        sd.date_index = date_index
-        sd.columns = columns
+        """Condenses every `factor` bars into one, labelled with the date of the last bar in the group"""
+        starts = np.arange(0, self._size, factor)
+        ends = np.append(starts[1:], self._size)
+        return self._aggregate(starts, self.dates[ends - 1] if self._size else self.dates)
+
+    def resample(self, resolution: Resolution) -> 'SymbolData':
+        """
+        Condenses into bars of a coarser resolution. Bars are grouped on local wall-clock buckets (minute, day,
+        Monday-based week, calendar month) rather than by count, so gaps in the data don't shift the groups.
+        Each bucket is labelled with its start time.
+        """
+        if resolution is Resolution.TICK:
+            raise ValueError('Cannot resample to TICK resolution')
+        if not self._size:
+            return SymbolData(self.symbol, resolution=resolution)
+        local = self.date_index.tz_localize(None).as_unit('ns').asi8
+        floor = bucket_floor(local, resolution)
+        starts = np.flatnonzero(np.diff(floor, prepend=floor[0] - 1))
+        sd = self._aggregate(starts, self.dates[starts] - (local[starts] - floor[starts]))
+        sd.resolution = resolution
         return sd
 
+    def _aggregate(self, starts: np.ndarray, dates: np.ndarray) -> 'SymbolData':
+        """Reduces each group of bars beginning at `starts` into a single bar with a volume-weighted Ref Price"""
+        if not self._size:
+            return SymbolData(self.symbol)
+        columns = self.columns
+        ends = np.append(starts[1:], self._size)
+        volume = np.add.reduceat(columns['Volume'], starts)
+        weighted = np.add.reduceat(columns['Ref Price'] * columns['Volume'], starts)
+        mean = np.add.reduceat(columns['Ref Price'], starts) / (ends - starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ref_price = np.where(volume > 0, weighted / volume, mean)
+        condensed = {
+            'Open': columns['Open'][starts],
+            'High': np.maximum.reduceat(columns['High'], starts),
+            'Low': np.minimum.reduceat(columns['Low'], starts),
+            'Close': columns['Close'][ends - 1],
+            'Ref Price': ref_price,
+            'Volume': volume,
+        }
+        return SymbolData.from_arrays(self.symbol, dates, condensed, self.tz)
+
+
+class RollingSymbolData(SymbolData):
+    """
+    A SymbolData holding only the most recent `capacity` bars, and optionally only those within `max_age` of the
+    newest one, so memory stays flat however long a session runs. Evicted bars are handed to `spill` (for
+    example DataCache.append) in chunks of `spill_size`; call flush() to hand over the remainder, and
+    flush(retained=True) to hand over the bars still held as well.
+
+    Each bar is written twice, at slots p and p + capacity, so the retained bars are always one contiguous run of
+    the buffers and column(), dates and window() are views rather than copies. Those views are only stable until
+    the next append; data_frame is a copy.
+    """
+
+    def __init__(self, symbol: str, capacity: int, max_age: timedelta = None,
+                 spill: Callable[[SymbolData], None] = None, spill_size=4096, resolution: Resolution = None):
+        super().__init__(symbol, capacity=0, resolution=resolution)
+        self.max_age_ns = int(max_age.total_seconds() * 1_000_000_000) if max_age else None
+        self.spill = spill
+        self.spill_size = spill_size
+        self._limit = capacity
+        self._appended = 0
+        self._frame_at = -1
+        self._dates = np.empty(2 * capacity, dtype=np.int64)
+        self._columns = {label: np.empty(2 * capacity, dtype=dtype) for label, dtype in SymbolData.dtypes.items()}
+        self._pending = None
+
+    @property
+    def capacity(self):
+        return self._limit
+
+    def reserve(self, capacity: int):
+        """Fixed capacity; nothing to do"""
+
+    def append_bar(self, bar: TickBar):
+        if self.tz is None:
+            self.tz = bar.date.tzinfo or local_tz()
+        self._append_row(to_epoch_ns(bar.date), (bar.open, bar.high, bar.low, bar.close, bar.wap, bar.volume))
+
+    def extend_arrays(self, dates: np.ndarray, columns: dict[str, np.ndarray]):
+        for row, ns in enumerate(dates.tolist()):
+            self._append_row(ns, [columns[label][row] for label in SymbolData.labels])
+
+    def _append_row(self, ns: int, values):
+        if self._size == self._limit:
+            self._evict(1)
+        for i in (self._appended % self._limit, self._appended % self._limit + self._limit):
+            self._dates[i] = ns
+            for label, value in zip(SymbolData.labels, values):
+                self._columns[label][i] = value
+        self._appended += 1
+        self._size += 1
+        self._offset = (self._appended - self._size) % self._limit
+        if self.max_age_ns is not None:
+            expired = int(np.searchsorted(self.dates, ns - self.max_age_ns))
+            if expired:
+                self._evict(expired)
+
+    def _evict(self, count: int):
+        if self.spill:
+            if self._pending is None:
+                self._pending = SymbolData(self.symbol, capacity=self.spill_size, resolution=self.resolution)
+                self._pending.tz = self.tz
+            self._pending.extend_arrays(self.dates[:count], {label: self.column(label)[:count]
+                                                             for label in SymbolData.labels})
+            if len(self._pending) >= self.spill_size:
+                self.flush()
+        self._size -= count
+        self._offset = (self._appended - self._size) % self._limit
+
+    def flush(self, retained=False):
+        """
+        Spills evicted bars that have not been handed over yet. With `retained`, also evicts and spills the bars
+        still held, leaving it empty, as at the end of a session
+        """
+        if retained and self.spill and self._size:
+            self._evict(self._size)
+        pending, self._pending = self._pending, None
+        if pending is not None and len(pending):
+            self.spill(pending)
+
+    @property
+    def data_frame(self) -> pd.DataFrame:
+        if self._frame is None or self._frame_at != self._appended:
+            self._frame = pd.DataFrame(self.columns, index=self.date_index, copy=True)
+            self._frame_at = self._appended
+        return self._frame
+
+
+BAR_DTYPE = np.dtype([('date', np.int64), ('open', np.float64), ('high', np.float64), ('low', np.float64),
+                      ('close', np.float64), ('wap', np.float64), ('volume', np.int64)])
+
+
+class BarBatch(NamedTuple):
+    """A contiguous run of bars as column views; `start` is the index of the first bar in its SymbolData"""
+    symbol: str
+    start: int
+    dates: np.ndarray  # Epoch nanoseconds
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    wap: np.ndarray
+    volume: np.ndarray
+
+    @property
+    def size(self):
+        return len(self.dates)
+
+    def to_records(self) -> np.ndarray:
+        """Copies the batch into a structured array of BAR_DTYPE rows"""
+        records = np.empty(self.size, dtype=BAR_DTYPE)
+        for name, column in zip(BAR_DTYPE.names, self[2:]):
+            records[name] = column
+        return records
+
+
+class BarView:
+    """A lazy view of one bar of a SymbolData. Fields are read from the columns only when accessed"""
+
+    __slots__ = ('data', 'index')
+
+    def __init__(self, data: SymbolData, index: int):
+        self.data = data
+        self.index = index
+
+    @property
+    def symbol(self) -> str:
+        return self.data.symbol
+
+    def _field(self, label) -> float:
+        return float(self.data._columns[label][self.data._offset + self.index])
+
+    @property
+    def date(self) -> datetime:
+        return from_epoch_ns(int(self.data._dates[self.data._offset + self.index]), self.data.tz)
+
+    @property
+    def open(self) -> Price:
+        return price(self._field('Open'), self.data.scale)
+
+    @property
+    def high(self) -> Price:
+        return price(self._field('High'), self.data.scale)
+
+    @property
+    def low(self) -> Price:
+        return price(self._field('Low'), self.data.scale)
+
+    @property
+    def close(self) -> Price:
+        return price(self._field('Close'), self.data.scale)
+
+    @property
+    def wap(self) -> Price:
+        return price(self._field('Ref Price'), self.data.scale)
+
+    @property
+    def volume(self) -> int:
+        return int(self.data._columns['Volume'][self.data._offset + self.index])
+
+    def to_tick_bar(self) -> TickBar:
+        return self.data.tick_bar(self.index)
+
+    def __repr__(self):
+        return f'BarView({self.symbol}, {self.index})'
+
+
+def bucket_floor(local: np.ndarray, resolution: Resolution) -> np.ndarray:
+    """Floors local wall-clock epoch nanoseconds to the start of their `resolution` bucket"""
+    if resolution is Resolution.MONTH:
+        return local.view('M8[ns]').astype('M8[M]').astype('M8[ns]').view(np.int64)
+    width = resolution.value * 1_000_000_000
+    origin = 4 * 86_400 * 1_000_000_000 if resolution is Resolution.WEEK else 0  # 1970-01-05 was a Monday
+    return (local - origin) // width * width + origin
+
+
+def _resized(array: np.ndarray, size: int, capacity: int) -> np.ndarray:
+    resized = np.empty(capacity, dtype=array.dtype)
+    resized[:size] = array[:size]
+    return resized
+
+
+class WatchListSnapshot(NamedTuple):
+    """An immutable view of a WatchList as of one version"""
+    version: int
+    prices: Mapping[str, TickBar]
+
 
 class WatchList:
     """
     A dictionary-like object for storing most recent price (bar) data.
-    Auto-subscribed to tick bar events
+    Auto-subscribed to tick bar events.
+    Every write publishes a new immutable snapshot (copy-on-write) and bumps `version`. Readers iterate a
+    snapshot without locking and are never blocked by writers; writers only serialize among themselves.
+    By default each tick event is applied before emit returns, so a read right after emitting sees its bar (the
+    fake broker fills at it). With `conflate`, events are instead conflated per symbol on a worker thread and
+    applied as one version per batch, for consumers that only show the latest bars and can lag a cycle behind.
+    Either way the WatchList is observed weakly, so dropping it unsubscribes it; close() does so right away.
     """
-    def __init__(self, symbols=None):
-        self.last_price: dict[str, TickBar] = {}
-        observe(TickEvent, lambda event: self.__setitem__(event.tick_bar.symbol, event.tick_bar))
+    def __init__(self, symbols=None, conflate=False):
+        self._write_lock = threading.Lock()
+        self._snapshot = WatchListSnapshot(0, MappingProxyType({}))
+        if conflate:
+            self._observer = observe(TickEvent, self._on_ticks, weak=True, asynchronous=True,
+                                     overflow=Overflow.CONFLATE_BY_KEY, batch=True)
+            weakref.finalize(self, self._observer.close)  # Stop the worker thread with the WatchList
+        else:
+            self._observer = observe(TickEvent, self._on_tick, weak=True)
         if symbols is not None:
             for s in symbols:
                 self.add_symbol(s)
 
+    def _on_tick(self, event: TickEvent):
+        self[event.tick_bar.symbol] = event.tick_bar
+
+    def _on_ticks(self, pending: list[TickEvent]):
+        self.update(event.tick_bar for event in pending)
+
+    def close(self):
+        """Stops applying tick events"""
+        if isinstance(self._observer, AsyncObserver):
+            self._observer.close()
+        else:
+            stop_observing(TickEvent, self._observer)
+
+    def _write(self, change: Callable[[dict[str, TickBar]], None]):
+        with self._write_lock:
+            prices = dict(self._snapshot.prices)
+            change(prices)
+            self._snapshot = WatchListSnapshot(self._snapshot.version + 1, MappingProxyType(prices))
+
+    def snapshot(self) -> WatchListSnapshot:
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def changed_since(self, version: int) -> bool:
+        return self._snapshot.version != version
+
+    @property
+    def last_price(self) -> Mapping[str, TickBar]:
+        return self._snapshot.prices
+
     def __setitem__(self, symbol, last_price: TickBar):
         _log.debug(f'Updating watchlist tickbar: {last_price}')
-        self.last_price[symbol] = last_price
+        self._write(lambda prices: prices.__setitem__(symbol, last_price))
+
+    def update(self, bars: Iterable[TickBar]):
+        """Sets many bars as one new version"""
+        self._write(lambda prices: prices.update((bar.symbol, bar) for bar in bars))
 
     def __getitem__(self, symbol):
         return self.last_price[symbol]
@@ -205,7 +624,7 @@ class WatchList:
         return self.last_price.__contains__(item)
 
     def __eq__(self, other):
-        return type(other) == type(self) and self.last_price.keys() == other.last_price.keys()
+        return type(other) is type(self) and self.last_price.keys() == other.last_price.keys()
 
     def __repr__(self):
         symbols = list(self.last_price.keys())
@@ -220,18 +639,21 @@ class WatchList:
     def symbols(self):
         return self.last_price.keys()
 
-    def add_symbol(self, symbol, price=0):
-        price = d(price)
+    def add_symbol(self, symbol, last=0):
         symbol = symbol.upper()
-        if (symbol not in self.last_price) or (self.last_price[symbol].close == 0):
-            tick_bar = TickBar(symbol, datetime.now(), price, price, price, price, price, 0)
-            _log.info(f'Adding {symbol} at {tick_bar}')
-            self.last_price[symbol] = tick_bar
-        else:
-            _log.info(f'Symbol {symbol} already present at {self.last_price[symbol].close}')
+        last = Price.of(last, Symbols.price_scale(symbol))
+
+        def add(prices):
+            if (symbol not in prices) or (prices[symbol].close == 0):
+                tick_bar = TickBar(symbol, datetime.now(), last, last, last, last, last, 0)
+                _log.info(f'Adding {symbol} at {tick_bar}')
+                prices[symbol] = tick_bar
+            else:
+                _log.info(f'Symbol {symbol} already present at {prices[symbol].close}')
+        self._write(add)
 
     def remove_symbol(self, symbol):
-        del self.last_price[symbol]
+        self._write(lambda prices: prices.__delitem__(symbol))
 
     def __str__(self):
         return self.__repr__()
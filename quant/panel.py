@@ -0,0 +1,203 @@
+"""
+ Bars for a universe of symbols aligned on one time index, for cross-sectional work across a watchlist
+"""
+from __future__ import annotations
+
+from .markets import SymbolData, TickBar, TickEvent, Resolution, bucket_floor
+from .util import events
+from .util.timeutil import local_tz, to_epoch_ns
+
+from typing import Iterable
+import numpy as np
+import pandas as pd
+import logging
+
+_log = logging.getLogger(__name__)
+
+
+class Panel:
+    """
+    One 2-D (time x symbol) array per field, sharing a time index of epoch nanoseconds. Bars are aligned on
+    `resolution` buckets. Prices are NaN and volume 0 where a symbol has no bar for a time.
+    Rows are preallocated and grow geometrically, like SymbolData.
+    """
+
+    labels = SymbolData.labels
+    MIN_CAPACITY = 64
+
+    def __init__(self, symbols: Iterable[str] = (), resolution=Resolution.FIVE_SEC, capacity: int = None):
+        self.resolution = resolution
+        self.tz = None
+        self.symbols: list[str] = []
+        self._column_of: dict[str, int] = {}
+        self._size = 0
+        self._dates = np.empty(0, dtype=np.int64)
+        self._fields = {label: self._empty_block(0, 0, label) for label in Panel.labels}
+        self.reserve(max(capacity or 0, Panel.MIN_CAPACITY))
+        for symbol in symbols:
+            self.add_symbol(symbol)
+
+    @staticmethod
+    def _empty_block(rows, columns, label):
+        if label == 'Volume':
+            return np.zeros((rows, columns), dtype=np.int64)
+        return np.full((rows, columns), np.nan)
+
+    @classmethod
+    def from_symbol_data(cls, datas: Iterable[SymbolData], resolution=Resolution.FIVE_SEC) -> Panel:
+        """
+        Builds a panel from cached history, aligning every series on the union of their bucketed times. Series
+        should already be at `resolution` (see SymbolData.resample); otherwise the last bar in a bucket wins.
+        """
+        datas = list(datas)
+        buckets = [cls._buckets(data, resolution) for data in datas]
+        dates = np.unique(np.concatenate(buckets)) if buckets else np.empty(0, dtype=np.int64)
+        panel = cls((data.symbol for data in datas), resolution, capacity=len(dates))
+        panel.tz = next((data.tz for data in datas if data.tz is not None), None)
+        panel._dates[:len(dates)] = dates
+        panel._size = len(dates)
+        for data, bucket in zip(datas, buckets):
+            rows, column = np.searchsorted(dates, bucket), panel._column_of[data.symbol]
+            for label in Panel.labels:
+                panel._fields[label][rows, column] = data.column(label)
+        return panel
+
+    @staticmethod
+    def _buckets(data: SymbolData, resolution: Resolution) -> np.ndarray:
+        if not len(data):
+            return np.empty(0, dtype=np.int64)
+        local = data.date_index.tz_localize(None).as_unit('ns').asi8
+        return bucket_floor(local, resolution) - (local - data.dates)
+
+    def subscribe(self) -> Panel:
+        """Fills the panel from live TickEvents"""
+        events.observe(TickEvent, lambda event: self.update(event.tick_bar))
+        return self
+
+    def reserve(self, capacity: int):
+        if capacity <= len(self._dates):
+            return
+        dates = np.empty(capacity, dtype=np.int64)
+        dates[:self._size] = self._dates[:self._size]
+        self._dates = dates
+        for label, block in self._fields.items():
+            resized = self._empty_block(capacity, len(self.symbols), label)
+            resized[:self._size] = block[:self._size]
+            self._fields[label] = resized
+
+    def add_symbol(self, symbol: str):
+        symbol = symbol.upper()
+        if symbol in self._column_of:
+            return
+        self._column_of[symbol] = len(self.symbols)
+        self.symbols.append(symbol)
+        for label, block in self._fields.items():
+            self._fields[label] = np.hstack([block, self._empty_block(len(block), 1, label)])
+
+    def _row_for(self, ns: int) -> int:
+        n = self._size
+        if n and ns == self._dates[n - 1]:
+            return n - 1
+        if not n or ns > self._dates[n - 1]:
+            if n == len(self._dates):
+                self.reserve(2 * n)
+            self._dates[n] = ns
+            self._size = n + 1
+            return n
+        row = int(np.searchsorted(self._dates[:n], ns))
+        if self._dates[row] != ns:  # A late bar for a time we have not seen: insert a row for it
+            _log.debug(f'Inserting out of order row at {row}')
+            self._dates = np.insert(self._dates, row, ns)
+            for label, block in self._fields.items():
+                self._fields[label] = np.insert(block, row, self._empty_block(1, len(self.symbols), label), axis=0)
+            self._size = n + 1
+        return row
+
+    def update(self, bar: TickBar):
+        if bar.symbol not in self._column_of:
+            self.add_symbol(bar.symbol)
+        if self.tz is None:
+            self.tz = bar.date.tzinfo or local_tz()
+        ns = to_epoch_ns(bar.date)
+        offset = int(bar.date.utcoffset().total_seconds() * 1_000_000_000) if bar.date.tzinfo else 0
+        row = self._row_for(int(bucket_floor(np.array([ns + offset]), self.resolution)[0]) - offset)
+        column = self._column_of[bar.symbol]
+        for label, value in zip(Panel.labels, (bar.open, bar.high, bar.low, bar.close, bar.wap, bar.volume)):
+            self._fields[label][row, column] = value
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, symbol):
+        return symbol in self._column_of
+
+    @property
+    def dates(self) -> np.ndarray:
+        return self._dates[:self._size]
+
+    @property
+    def date_index(self) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(self.dates.view('M8[ns]'), name='Date').tz_localize('UTC').tz_convert(self.tz)
+
+    def field(self, label) -> np.ndarray:
+        """A (time x symbol) view of one field"""
+        return self._fields[label][:self._size]
+
+    def data_frame(self, label='Close') -> pd.DataFrame:
+        return pd.DataFrame(self.field(label), index=self.date_index, columns=self.symbols, copy=False)
+
+    def column(self, symbol) -> int:
+        return self._column_of[symbol.upper()]
+
+    # Cross-sectional operations, each one vectorized over every symbol
+
+    def filled(self, label='Close') -> np.ndarray:
+        """The field with gaps filled forward from each symbol's previous bar"""
+        values = self.field(label)
+        rows = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+        np.maximum.accumulate(rows, axis=0, out=rows)
+        filled = values[rows, np.arange(values.shape[1])]
+        return filled
+
+    def last(self, label='Close') -> np.ndarray:
+        """Latest known value per symbol"""
+        if not self._size:
+            return np.full(len(self.symbols), np.nan)
+        return self.filled(label)[-1]
+
+    def returns(self, periods=1, label='Close') -> np.ndarray:
+        """Fractional change over `periods` rows, per row and symbol"""
+        values = self.filled(label)
+        returns = np.full(values.shape, np.nan)
+        if len(values) > periods:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                returns[periods:] = values[periods:] / values[:-periods] - 1
+        return returns
+
+    @staticmethod
+    def rank(values: np.ndarray) -> np.ndarray:
+        """Cross-sectional rank along the last axis, 0 for the smallest value; NaNs rank last"""
+        return np.argsort(np.argsort(np.where(np.isnan(values), np.inf, values), axis=-1), axis=-1)
+
+    def movers(self, periods=1, n=10) -> list[tuple[str, float]]:
+        """The `n` symbols with the largest absolute latest return, biggest first"""
+        latest = self.returns(periods)[-1] if self._size else np.full(len(self.symbols), np.nan)
+        order = np.argsort(-np.nan_to_num(np.abs(latest), nan=-1))[:n]
+        return [(self.symbols[i], float(latest[i])) for i in order if not np.isnan(latest[i])]
+
+    def relative_strength(self, benchmark: str, periods=1) -> np.ndarray:
+        """Each symbol's return over `periods` rows less that of the benchmark symbol"""
+        returns = self.returns(periods)
+        return returns - returns[:, [self.column(benchmark)]]
+
+    def correlation(self, periods=1) -> np.ndarray:
+        """Symbol x symbol correlation of returns, over the rows where every symbol has one"""
+        returns = self.returns(periods)
+        returns = returns[~np.isnan(returns).any(axis=1)]
+        return np.corrcoef(returns, rowvar=False)
+
+    def vwap(self) -> np.ndarray:
+        """Volume weighted Ref Price per symbol across the whole panel"""
+        wap, volume = self.field('Ref Price'), self.field('Volume')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.nansum(wap * volume, axis=0) / volume.sum(axis=0)
@@ -0,0 +1,51 @@
+"""
+ Runs a market data source in its own process and publishes its bars to a shared memory feed, so that any number of
+ local processes can read them with the "feed" source, while only this one holds the IB connection
+"""
+from .feed import FeedPublisher, DEFAULT_NAME, DEFAULT_CAPACITY
+from .ibkr import IBApi, PUBLISHER_CONNECTION_ID
+from .markets import WatchList
+from .sources import init_market_data
+from .util import Parser, console
+
+import time
+import logging
+
+_log = logging.getLogger(__name__)
+
+
+def main():
+    parser = Parser(description='Publish market data to local processes through shared memory')
+    parser.add_argument('symbols', type=str, nargs='+', help='Symbols to publish')
+    parser.add_argument('-s', dest='source', type=str, default='live',
+                        help='Source of market data: "live", "random", "synthetic", a date or a journal (.qjnl)')
+    parser.add_argument('-n', dest='name', type=str, default=DEFAULT_NAME,
+                        help='Name of the shared memory; subscribers use the source "feed:<name>"')
+    parser.add_argument('-c', dest='capacity', type=int, default=DEFAULT_CAPACITY,
+                        help='Bars held in the ring before the oldest are overwritten')
+    parser.add_argument('--client-id', dest='client_id', type=int, default=PUBLISHER_CONNECTION_ID,
+                        help='IBKR client id, different from any trader connected at the same time')
+    parser.add_argument('-H', dest='history', type=str, help='Directory for storing history', default='history')
+    parser.add_argument('-x', dest='speed', type=float, default=1.,
+                        help='Replay speed when the source is a date or journal. 0 replays unthrottled')
+    args = parser.parse_args()
+
+    logging.getLogger('ibapi').setLevel(logging.WARN)
+
+    IBApi.instance(args.client_id)
+    publisher = FeedPublisher(args.name, args.capacity).start()
+    watchlist = WatchList(args.symbols)
+    init_market_data(args.source, watchlist, args.history, args.speed)
+    console.announce(f'Publishing {", ".join(watchlist.symbols())} from {args.source} to feed {args.name}')
+    try:
+        while True:
+            time.sleep(10)
+            _log.info(f'Published {publisher.head} bars')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        publisher.close()
+
+
+if __name__ == "__main__":
+    main()
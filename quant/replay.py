@@ -0,0 +1,84 @@
+"""
+ Time-ordered replay of history as TickEvents, at real time, a multiple of it, or as fast as possible
+"""
+from __future__ import annotations
+
+from .markets import SymbolData, TickBar, TickEvent
+from .util import events
+
+from typing import Iterable, Iterator, Callable
+from itertools import repeat
+import heapq
+import threading
+import time
+import logging
+
+_log = logging.getLogger(__name__)
+
+UNTHROTTLED = 0
+
+
+def merge_bars(datas: Iterable[SymbolData]) -> Iterator[tuple[int, TickBar]]:
+    """
+    Every bar of several series as (epoch nanoseconds, bar), in time order. A heap holds the next bar of each
+    series; bars at the same time come out in the order the series were given.
+    """
+    streams = (zip(data.dates.tolist(), repeat(i), data.tick_bars()) for i, data in enumerate(datas))
+    for date, _, bar in heapq.merge(*streams, key=lambda entry: entry[:2]):
+        yield date, bar
+
+
+class ReplayClock:
+    """
+    Paces a replay at `speed` times the pace the bars were recorded at; UNTHROTTLED (0) doesn't wait. The first bar
+    sets the origin. Setting `interrupt` cuts a wait short
+    """
+
+    def __init__(self, speed: float = 1., interrupt: threading.Event = None):
+        self.speed = speed
+        self.interrupt = interrupt or threading.Event()
+        self._origin = None
+
+    def wait_until(self, date_ns: int):
+        if not self.speed:
+            return
+        now = time.monotonic()
+        if self._origin is None:
+            self._origin = (date_ns, now)
+        delay = self._origin[1] + (date_ns - self._origin[0]) / 1e9 / self.speed - now
+        if delay > 0:
+            self.interrupt.wait(delay)
+
+
+class Replay:
+    """Emits the bars of several series as TickEvents, merged in true chronological order"""
+
+    def __init__(self, datas: Iterable[SymbolData], speed: float = 1., emit: Callable = events.emit):
+        self.datas = list(datas)
+        self.speed = speed
+        self.emit = emit
+        self.stopped = False
+        self._interrupt = threading.Event()
+
+    def run(self) -> int:
+        """Replays everything once and returns the number of bars emitted"""
+        clock, count = ReplayClock(self.speed, self._interrupt), 0
+        start = time.perf_counter()
+        for date, bar in merge_bars(self.datas):
+            if self.stopped:
+                break
+            clock.wait_until(date)
+            self.emit(TickEvent(bar))
+            count += 1
+        elapsed = time.perf_counter() - start
+        _log.info(f'Replayed {count} bars of {len(self.datas)} symbols in {elapsed:.3f}s')
+        return count
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopped = True
+        self._interrupt.set()  # Don't sit out the wait for the next bar
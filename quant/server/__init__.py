@@ -15,6 +15,7 @@ from .resolver import Resolver
 from ..util import Parser, events
 from ..markets import TickEvent
 from ..sources import init_market_data
+from ..ibkr import IBApi, SERVER_CONNECTION_ID
 
 _log = logging.getLogger(__name__)
 
@@ -32,8 +33,11 @@ def run_server(res, listen_port):
 def main():
     parser = Parser()
     parser.add_argument('-s', dest='source', type=str,
-                        help='Source of market data: "live", "random" or a date for example "2022-09-08 10:00:00"',
+                        help='Source of market data: "live", "random", a date for example "2022-09-08 10:00:00", or "feed"'
+                             ' to read from quant.publisher (only the symbols it publishes get bars)',
                         default='live')
+    parser.add_argument('--client-id', dest='client_id', type=int, default=SERVER_CONNECTION_ID,
+                        help='IBKR client id, different from any trader or publisher connected at the same time')
     args = parser.parse_args()
 
     con: Connection = sl.connect('sqlite/lookup/symbols.db')
@@ -44,6 +48,7 @@ def main():
     session = sessionmaker(bind=engine, future=True)()
     watchlist_service = WatchListService(session)
 
+    IBApi.instance(args.client_id)
     init_market_data(args.source, watchlist_service.watchlist)
     events.observe(TickEvent, _log.debug)
 
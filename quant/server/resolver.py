@@ -21,6 +21,7 @@ class Resolver:
         self.watchlist_service = watchlist_service
         self.watchlist = watchlist_service.watchlist
         self.symbol_search_service = symbol_search_service
+        self._payload, self._payload_version = None, -1  # Rebuilt only when the watchlist changes
         query = QueryType()
         query.set_field('listSymbols', Resolver._list_symbols)
         query.set_field('searchSymbols', self._search_symbols)
@@ -99,12 +100,15 @@ class Resolver:
                 "success": False,
                 "errors": [str(error)]
             }
-        payload = {
-                "success": True,
-                "items": [tick_bar.to_gql() for _, tick_bar in self.watchlist.items()]
-            }
-        _log.debug(f'Watchlist {payload}')
-        return payload
+        snapshot = self.watchlist.snapshot()
+        if self._payload_version != snapshot.version:
+            self._payload = {
+                    "success": True,
+                    "items": [tick_bar.to_gql() for tick_bar in snapshot.prices.values()]
+                }
+            self._payload_version = snapshot.version
+            _log.debug(f'Watchlist {self._payload}')
+        return self._payload
 
     @staticmethod
     async def _counter_source(*_):
@@ -120,23 +124,24 @@ class Resolver:
         return count
 
     @staticmethod
-    async def _tick_bar_source(*_):
-        _log.info('New tick bar generator')
+    async def _tick_bar_source(_, __, symbol=None):
+        """Every symbol's bars, or with a symbol only that one's"""
+        _log.info('New tick bar generator' + (f' for {symbol}' if symbol else ''))
         queue = Queue()
 
         def on_event(e):
             queue.put(e)
 
-        observe(TickEvent, lambda e: queue.put(e), weak=True)
+        observe(TickEvent, on_event, weak=True, key=symbol.upper() if symbol else None)
         while True:
             try:
                 event = queue.get(block=False)
-                yield {'success': True, 'tick_bar': event.tick_bar}
+                yield {'success': True, 'tick_bar': event.tick_bar.to_gql()}
             except Empty:
                 await asyncio.sleep(1)
 
     @staticmethod
-    def _tick_bar(tick_bar, _):
+    def _tick_bar(tick_bar, _, **__):
         print('Getting tick bars')
         print(f'{tick_bar}')
         return tick_bar
@@ -1,31 +1,94 @@
-from .markets import DataRequest, SymbolData, TickEvent, TickBar, Resolution, WatchList
+from __future__ import annotations
+
+from .markets import DataRequest, SymbolData, RollingSymbolData, TickEvent, TickBar, Resolution, WatchList, BAR_DTYPE, BarBatch
 from .ibkr import BrokerContext, IBApi
-from .util import timeutil, diff, events, console
-from .util.misc import decimal as d
+from .replay import Replay
+from . import journal
+from .synthetic import SyntheticMarketData
+from .feed import FeedSubscriber, DEFAULT_NAME as DEFAULT_FEED
+from .util import timeutil, diff, events, console, columnar
+from .util.cache import LRUCache, CacheStats
+from .util.singleflight import SingleFlight
 
 import pandas_datareader as pdr
 import time
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 import random
 import threading
+import atexit
+import functools
 import logging
 
 import os
+import json
+import numpy as np
 import pandas as pd
 from numpy import float64, int64
+from typing import NamedTuple, Callable, Any
 
 _log = logging.getLogger(__name__)
 
+in_flight = SingleFlight()  # Identical requests made while one is under way share its result
+
+
+class RequestCache:
+    """
+    The shared in-process cache in front of the data sources, keyed on normalized DataRequests. Ranges that end
+    before today are closed and never change, so they stay until evicted; ranges reaching into today expire after
+    `open_range_ttl` seconds, and current prices after `current_price_ttl`. Cached values are shared: treat them
+    as read-only. Each source caches one type of value under its name, whoever asks: DataFrames for yahoo and
+    SymbolData for ibkr.
+    """
+
+    def __init__(self, max_size=512 * 1024 * 1024, current_price_ttl=60., open_range_ttl=300.):
+        self.lru = LRUCache(max_size)
+        self.current_price_ttl = current_price_ttl
+        self.open_range_ttl = open_range_ttl
+
+    @staticmethod
+    def key_for(source: str, request: DataRequest) -> tuple:
+        return source, request.symbol.upper(), timeutil.to_epoch_ns(request.start), timeutil.to_epoch_ns(request.end), \
+            request.resolution
+
+    def ttl_for(self, request: DataRequest) -> float | None:
+        today = datetime.now().astimezone().replace(hour=0, minute=0, second=0, microsecond=0)
+        return None if timeutil.to_epoch_ns(request.end) <= timeutil.to_epoch_ns(today) else self.open_range_ttl
+
+    def fetch(self, source: str, fetcher: Callable[[DataRequest], Any], request: DataRequest):
+        return self.lru.get_or_load(self.key_for(source, request), lambda: fetcher(request), self.ttl_for(request))
+
+    def wrap(self, source: str, fetcher: Callable[[DataRequest], Any]) -> Callable[[DataRequest], Any]:
+        """A fetcher that goes through the cache"""
+        return functools.wraps(fetcher)(lambda request: self.fetch(source, fetcher, request))
 
-def init_market_data(source, watchlist):
+    def current_price(self, symbol: str) -> float:
+        return self.lru.get_or_load(('current_price', symbol.upper()), lambda: YahooData.current_price(symbol),
+                                    self.current_price_ttl)
+
+    @property
+    def stats(self) -> CacheStats:
+        return self.lru.stats
+
+
+request_cache = RequestCache()
+
+
+def init_market_data(source, watchlist, cache_dir='history', speed=1.):
 
     if source == 'random':
-        RandomMarketData(watchlist, YahooData.current_price).start()
+        RandomMarketData(watchlist, request_cache.current_price).start()
+    elif source == 'synthetic':
+        SyntheticMarketData(watchlist).start()
     elif source == 'live':
-        IBKRMarketData(watchlist).start()
+        IBKRMarketData(watchlist, cache_dir=cache_dir).start()
+    elif source == 'feed' or source.startswith('feed:'):
+        FeedSubscriber(source[len('feed:'):] or DEFAULT_FEED, watchlist=watchlist).start()
+    elif source.endswith(journal.EXTENSION):
+        journal.JournalReplay(source, speed).start()
     else:
         date = timeutil.parse_date(source)
-        IBKRHistoricalMarketData(watchlist, date, 'history').start()
+        IBKRHistoricalMarketData(watchlist, date, cache_dir, speed).start()
 
 
 class YahooData:
@@ -36,11 +99,23 @@ class YahooData:
     def fetch(request: DataRequest):
         if request.resolution not in YahooData.intervals:
             raise ValueError('Only DAY WEEK and MONTH resolutions are supported')
+        return in_flight.do(RequestCache.key_for('yahoo', request), lambda: YahooData._fetch(request))
+
+    @staticmethod
+    def _fetch(request: DataRequest):
         interval = YahooData.intervals[request.resolution]
         df = pdr.get_data_yahoo(request.symbol, start=request.start, end=request.end, interval=interval)
         df = df[['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']]
         return df
 
+    @staticmethod
+    def fetch_symbol_data(request: DataRequest) -> SymbolData:
+        df = YahooData.fetch(request).rename(columns={'Adj Close': 'Ref Price'})
+        df.index = df.index.rename('Date')
+        data = SymbolData(request.symbol, df)
+        data.resolution = request.resolution
+        return data
+
     @staticmethod
     def current_price(symbol: str):
         _log.info(f'Fetching current price of {symbol}')
@@ -54,6 +129,10 @@ class IBKRData:
 
     @staticmethod
     def fetch_symbol_data(request: DataRequest) -> SymbolData:
+        return in_flight.do(RequestCache.key_for('ibkr', request), lambda: IBKRData._fetch_symbol_data(request))
+
+    @staticmethod
+    def _fetch_symbol_data(request: DataRequest) -> SymbolData:
         with BrokerContext() as broker:
             symbol_data = broker.req_historical_data(request)
         console.announce(f'Received {len(symbol_data)} tick bars')
@@ -66,44 +145,62 @@ class IBKRData:
 
 class IBKRHistoricalMarketData:
 
-    def __init__(self, watchlist: WatchList, start_date: datetime, cache_dir: str = None):
+    idle_wait = 1.  # Seconds between passes that emitted nothing, e.g. with an empty watchlist
+
+    def __init__(self, watchlist: WatchList, start_date: datetime, cache_dir: str = None, speed: float = 1.,
+                 loop=True):
         self.watchlist = watchlist
         if not timeutil.is_trading_day(start_date):
             raise ValueError(f'Date {start_date} is not a trading day. No historical data available')
         self.start_date = start_date
-        self.data_cache = DataCache(cache_dir) if cache_dir else None
+        self.data_cache = HistoryStore(cache_dir) if cache_dir else None
+        self.speed = speed
+        self.loop = loop
+        self.history: dict[str, SymbolData] = {}
+        self.stopped = False
+        self.replay: Replay | None = None
+
+    def load(self, symbol) -> SymbolData:
+        if symbol not in self.history:
+            symbol_data = None
+            if self.data_cache:
+                symbol_data = self.data_cache.load(symbol, self.start_date)
+            if not symbol_data:
+                symbol_data = self.fetch_data(symbol, self.start_date)
+            self.history[symbol] = symbol_data
+        return self.history[symbol]
 
     def run(self):
-        tick_bars = {}
-        while True:
-            for symbol, tick_bar in self.watchlist.items():
-                if symbol not in tick_bars:
-                    symbol_data = None
-                    if self.data_cache:
-                        symbol_data = self.data_cache.load(symbol, self.start_date)
-                    if not symbol_data:
-                        symbol_data = self.fetch_data(symbol, self.start_date)
-                        if self.data_cache:
-                            self.data_cache.save(symbol_data)
-                    tick_bars[symbol] = (symbol_data, symbol_data.tick_bars())
-                try:
-                    events.emit(TickEvent((tick_bars[symbol][1]).__next__()))
-                except StopIteration:
-                    console.warn('Replaying data')
-                    tick_bars[symbol] = (tick_bars[symbol][0], tick_bars[symbol][0].tick_bars())
-
-            time.sleep(5)
-
-    @staticmethod
-    def fetch_data(symbol, date):
+        """Replays the day for every symbol in the watchlist in time order, again and again if looping"""
+        while not self.stopped:
+            self.replay = Replay([self.load(symbol) for symbol, _ in self.watchlist.items()], self.speed)
+            if self.stopped:  # Stopped while loading, before stop() could see this pass
+                return
+            count = self.replay.run()
+            if not self.loop:
+                return
+            if not count:
+                time.sleep(self.idle_wait)  # Wait for symbols (or their bars) rather than spin
+                continue
+            console.warn('Replaying data')
+
+    def fetch_data(self, symbol, date):
         one_day_later = date + timedelta(days=1)
         request = DataRequest(symbol, date, one_day_later, Resolution.FIVE_SEC)
-        return IBKRData.fetch_symbol_data(request)
+        if self.data_cache:
+            return fetch_incremental(self.data_cache, IBKRData.fetch_symbol_data, request)
+        return request_cache.fetch('ibkr', IBKRData.fetch_symbol_data, request)
 
     def start(self):
         console.announce(f'Starting Historical Market Data Thread at {self.start_date}')
         threading.Thread(target=self.run, daemon=True).start()
 
+    def stop(self):
+        """Stops the replay, including the pass under way"""
+        self.stopped = True
+        if self.replay:
+            self.replay.stop()
+
 
 class DataCache:
 
@@ -113,6 +210,11 @@ class DataCache:
 
     def load(self, symbol: str, date: datetime) -> SymbolData:
         path = self.path_for(symbol, date)
+        if os.path.exists(path):
+            columns, meta = columnar.read(path)
+            resolution = Resolution[meta['resolution']] if meta.get('resolution') else None
+            return SymbolData.from_arrays(symbol, columns['Date'], columns, _tz_from_meta(meta), resolution)
+        path = self.path_for(symbol, date, 'csv')
         if os.path.exists(path):
             data_frame = pd.read_csv(path, dtype={
                 'Date': str,
@@ -129,14 +231,221 @@ class DataCache:
         if not os.path.exists(self.cache_dir):
             os.mkdir(self.cache_dir)
         path = self.path_for(data.symbol, data.date_index[0])
-        data.data_frame.to_csv(path)
-
-    def path_for(self, symbol, date):
+        meta = {'symbol': data.symbol, 'resolution': data.resolution.name if data.resolution else None}
+        meta.update(_tz_to_meta(data.tz, data.dates[0]))
+        columnar.write(path, {'Date': data.dates, **data.columns}, meta)
+
+    def append(self, data: SymbolData):
+        """Merges bars into the cached days they fall on, for example bars spilled from a RollingSymbolData"""
+        days = data.date_index.normalize()
+        for day in days.unique():
+            mask = days == day
+            part = SymbolData.from_arrays(data.symbol, data.dates[mask],
+                                          {label: data.column(label)[mask] for label in SymbolData.labels},
+                                          data.tz, data.resolution)
+            cached = self.load(data.symbol, day)
+            self.save(SymbolData.concat([cached, part]) if cached else part)
+
+    def path_for(self, symbol, date, extension='qcol'):
         date_str = date.strftime('%Y-%m-%d')
-        filename = f'{date_str}-{symbol}.csv'
+        filename = f'{date_str}-{symbol}.{extension}'
         return os.path.join(self.cache_dir, filename)
 
 
+def _tz_to_meta(tz, epoch_ns) -> dict:
+    """Names the time zone where it has a name, otherwise records its UTC offset as of `epoch_ns`"""
+    name = getattr(tz, 'key', None) or getattr(tz, 'zone', None)
+    if name:
+        return {'tz': name}
+    offset = tz.utcoffset(timeutil.from_epoch_ns(int(epoch_ns), timezone.utc).replace(tzinfo=None))
+    return {'tz_offset': int(offset.total_seconds())}
+
+
+def _tz_from_meta(meta: dict):
+    if 'tz' in meta:
+        return ZoneInfo(meta['tz'])
+    return timezone(timedelta(seconds=meta['tz_offset']))
+
+
+class HistoryRun(NamedTuple):
+    """Index entry for a run of one symbol's bars, stored contiguously and in time order in one segment"""
+    symbol: str
+    resolution: str | None
+    start: int  # Epoch nanoseconds of the first bar
+    end: int  # Epoch nanoseconds of the last bar
+    segment: int
+    offset: int  # In records
+    count: int
+    tz: dict
+
+
+class HistoryStore:
+    """
+    History for any number of symbols in a few large, append-only segment files of BAR_DTYPE records, with an
+    index of the runs they hold. Segments are memory mapped once, so a query is an index lookup plus slices of the
+    maps rather than a file per symbol and day. Runs are never rewritten; where they overlap, the later one wins.
+    Reads fall back to any DataCache files in the same directory.
+    """
+
+    SEGMENT_BYTES = 256 * 1024 * 1024
+    INDEX_FILE = 'index.jsonl'
+    COVERAGE_FILE = 'coverage.jsonl'
+
+    def __init__(self, root: str):
+        self.root = root
+        self.legacy = DataCache(root)
+        os.makedirs(root, exist_ok=True)
+        self.runs: dict[str, list[HistoryRun]] = {}
+        self._maps: dict[int, np.memmap] = {}
+        self._lock = threading.Lock()
+        self._segment, self._segment_size = 0, 0
+        index_path = os.path.join(root, HistoryStore.INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as file:
+                for line in file:
+                    self._add_run(HistoryRun(**json.loads(line)))
+        if os.path.exists(self._segment_path(self._segment)):
+            self._segment_size = os.path.getsize(self._segment_path(self._segment))
+        self.coverage: dict[tuple[str, str], list[tuple[int, int]]] = {}
+        coverage_path = os.path.join(root, HistoryStore.COVERAGE_FILE)
+        if os.path.exists(coverage_path):
+            with open(coverage_path) as file:
+                for line in file:
+                    entry = json.loads(line)
+                    self._add_coverage((entry['symbol'], entry['resolution']), entry['start'], entry['end'])
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.root, f'segment-{segment:05d}.bars')
+
+    def _add_run(self, run: HistoryRun):
+        self.runs.setdefault(run.symbol, []).append(run)
+        self._segment = max(self._segment, run.segment)
+
+    def save(self, data: SymbolData):
+        """Appends the bars as a new run"""
+        if not len(data):
+            return
+        records = BarBatch(data.symbol, 0, data.dates, *(data.column(label) for label in SymbolData.labels)).to_records()
+        with self._lock:
+            if self._segment_size and self._segment_size + records.nbytes > HistoryStore.SEGMENT_BYTES:
+                self._segment, self._segment_size = self._segment + 1, 0
+            with open(self._segment_path(self._segment), 'ab') as file:
+                file.write(records.tobytes())
+            run = HistoryRun(data.symbol, data.resolution.name if data.resolution else None,
+                             int(data.dates[0]), int(data.dates[-1]), self._segment,
+                             self._segment_size // BAR_DTYPE.itemsize, len(records), _tz_to_meta(data.tz, data.dates[0]))
+            with open(os.path.join(self.root, HistoryStore.INDEX_FILE), 'a') as file:
+                file.write(json.dumps(run._asdict()) + '\n')
+            self._segment_size += records.nbytes
+            self._add_run(run)
+
+    append = save  # Spilled bars are simply further runs
+
+    def _records(self, run: HistoryRun) -> np.ndarray:
+        records = self._maps.get(run.segment)
+        if records is None or len(records) < run.offset + run.count:  # Not mapped yet, or grown since
+            records = np.memmap(self._segment_path(run.segment), dtype=BAR_DTYPE, mode='r')
+            self._maps[run.segment] = records
+        return records[run.offset:run.offset + run.count]
+
+    def query(self, symbol: str, start: datetime, end: datetime, resolution: Resolution = None) -> SymbolData | None:
+        """
+        Bars of `symbol` from `start` up to `end`. A single run comes back as views of the mapped segment; bars
+        from several runs are merged into new arrays
+        """
+        symbol = symbol.upper()
+        first, last = timeutil.to_epoch_ns(start), timeutil.to_epoch_ns(end)
+        name = resolution.name if resolution else None
+        parts = []
+        for run in self.runs.get(symbol, ()):
+            if run.start >= last or run.end < first or (name and run.resolution and run.resolution != name):
+                continue
+            records = self._records(run)
+            records = records[np.searchsorted(records['date'], first):np.searchsorted(records['date'], last)]
+            parts.append(SymbolData.from_arrays(symbol, records['date'],
+                                                dict(zip(SymbolData.labels, (records[field] for field in BAR_DTYPE.names[1:]))),
+                                                _tz_from_meta(run.tz), Resolution[run.resolution] if run.resolution else resolution))
+        if not parts:
+            return None
+        return parts[0] if len(parts) == 1 else SymbolData.concat(parts)
+
+    def query_many(self, symbols, start: datetime, end: datetime, resolution: Resolution = None) -> dict[str, SymbolData]:
+        found = ((symbol, self.query(symbol, start, end, resolution)) for symbol in symbols)
+        return {symbol: data for symbol, data in found if data}
+
+    def load(self, symbol: str, date: datetime, resolution: Resolution = None) -> SymbolData | None:
+        """One local day of bars, as DataCache.load"""
+        day = date.replace(hour=0, minute=0, second=0, microsecond=0)
+        return self.query(symbol, day, day + timedelta(days=1), resolution) or self.legacy.load(symbol, date)
+
+    def _add_coverage(self, key: tuple[str, str], start: int, end: int):
+        ranges = sorted(self.coverage.get(key, []) + [(start, end)])
+        merged = [ranges[0]]
+        for first, last in ranges[1:]:
+            if first <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+            else:
+                merged.append((first, last))
+        self.coverage[key] = merged
+
+    def mark_covered(self, symbol: str, resolution: Resolution, start: datetime, end: datetime):
+        """Records that the store holds everything there is for the range, so it need not be fetched again"""
+        first, last = timeutil.to_epoch_ns(start), timeutil.to_epoch_ns(end)
+        if first >= last:
+            return
+        with self._lock:
+            with open(os.path.join(self.root, HistoryStore.COVERAGE_FILE), 'a') as file:
+                file.write(json.dumps({'symbol': symbol.upper(), 'resolution': resolution.name,
+                                       'start': first, 'end': last}) + '\n')
+            self._add_coverage((symbol.upper(), resolution.name), first, last)
+
+    def missing(self, request: DataRequest) -> list[DataRequest]:
+        """The parts of a request not yet covered, leaving out any that hold no trading day"""
+        start, end = timeutil.to_epoch_ns(request.start), timeutil.to_epoch_ns(request.end)
+        gaps = []
+        for first, last in self.coverage.get((request.symbol.upper(), request.resolution.name), []):
+            if first > start:
+                gaps.append((start, min(first, end)))
+            start = max(start, last)
+            if start >= end:
+                break
+        if start < end:
+            gaps.append((start, end))
+        tz = request.start.tzinfo or timeutil.local_tz()
+        requests = (request._replace(start=timeutil.from_epoch_ns(first, tz), end=timeutil.from_epoch_ns(last, tz))
+                    for first, last in gaps)
+        return [gap for gap in requests if timeutil.has_trading_day(gap.start, gap.end)]
+
+
+def fetch_incremental(store: HistoryStore, fetcher: Callable[[DataRequest], SymbolData],
+                      request: DataRequest) -> SymbolData:
+    """
+    Fetches only the parts of a request the store does not cover yet, saves them, and returns the whole range from the
+    store. A gap is recorded as covered, up to the start of today since today's bars are still coming in, only once
+    its fetch has completed with data. A gap whose fetch fails or times out is left to be fetched again; the other
+    gaps are still fetched and saved, then the first failure is raised.
+    """
+    today = datetime.now().astimezone().replace(hour=0, minute=0, second=0, microsecond=0)
+    failure = None
+    for gap in store.missing(request):
+        _log.info(f'Fetching missing {gap.symbol} {gap.start} to {gap.end}')
+        try:
+            data = fetcher(gap)
+        except Exception as e:  # noqa Any failure means the gap is still missing
+            _log.warning(f'Failed to fetch {gap.symbol} {gap.start} to {gap.end}: {e!r}')
+            failure = failure or e
+            continue
+        if data is None or not len(data):
+            _log.info(f'No data for {gap.symbol} {gap.start} to {gap.end}, not marking it covered')
+            continue
+        store.save(data)
+        store.mark_covered(gap.symbol, gap.resolution, gap.start, min(gap.end, today))
+    if failure is not None:
+        raise failure
+    data = store.query(request.symbol, request.start, request.end, request.resolution)
+    return data if data is not None else SymbolData(request.symbol, resolution=request.resolution)
+
+
 class RandomMarketData:
 
     def __init__(self, watchlist, first_open, tick_interval=5):
@@ -147,13 +456,13 @@ class RandomMarketData:
     @staticmethod
     def next_bar(symbol, prev_close) -> TickBar:
         date = datetime.now()
-        price = float(prev_close)
-        high = random.uniform(price, price * 1.01)
-        low = random.uniform(price * 0.99, price)
+        last = float(prev_close)
+        high = random.uniform(last, last * 1.01)
+        low = random.uniform(last * 0.99, last)
         close = random.uniform(low, high)
         volume = int(random.uniform(300, 600))
         wap = close
-        return TickBar(symbol, date, prev_close, d(high), d(low), d(close), d(wap), volume)
+        return TickBar.new(symbol, date, last, high, low, close, wap, volume)
 
     def run(self):
         while True:
@@ -175,11 +484,28 @@ class RandomMarketData:
 
 class IBKRMarketData:
 
-    def __init__(self, watchlist: WatchList):
+    LIVE_HISTORY_BARS = 4680  # One regular session of 5 second bars
+
+    def __init__(self, watchlist: WatchList, history_bars=LIVE_HISTORY_BARS, cache_dir: str = None):
         self.watchlist = watchlist
+        self.history_bars = history_bars
+        self.history: dict[str, RollingSymbolData] = {}
+        self.data_cache = HistoryStore(cache_dir) if cache_dir else None
+        self.stopped = False
+        self._observer = None
+        self._lock = threading.Lock()  # on_bar runs on the observer's worker, stop on whichever thread stops us
+
+    def on_bar(self, bar: TickBar):
+        """Keeps a bounded window of recent bars per symbol, spilling older ones to the history cache"""
+        with self._lock:
+            if bar.symbol not in self.history:
+                spill = self.data_cache.append if self.data_cache else None
+                self.history[bar.symbol] = RollingSymbolData(bar.symbol, self.history_bars, spill=spill,
+                                                             resolution=Resolution.FIVE_SEC)
+            self.history[bar.symbol].append_bar(bar)
 
     def run(self):
-        while True:
+        while not self.stopped:
             added, removed = diff(IBApi.instance().subscriptions.keys(), self.watchlist.symbols())
             for symbol in added:
                 IBApi.instance().subscribe_realtime(symbol)
@@ -189,5 +515,18 @@ class IBKRMarketData:
 
     def start(self):
         console.announce('Starting IBKR Market Data Thread')
+        # Off the IB reader thread: spilling history to disk must not hold up the socket
+        self._observer = events.observe(TickEvent, lambda event: self.on_bar(event.tick_bar), asynchronous=True,
+                                        maxsize=65_536)
+        atexit.register(self.stop)  # The spill is buffered, so hand it over however the process ends
         IBApi.instance().start()
         threading.Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        """Stops recording bars once those already queued are in, and writes every bar held to the history cache"""
+        self.stopped = True
+        if self._observer:
+            self._observer.close(drain=True)
+        with self._lock:
+            for rolling in self.history.values():
+                rolling.flush(retained=True)
@@ -15,7 +15,7 @@ Base = declarative_base()
 
 def watchlist_load(session: Session) -> WatchList:
     items = session.query(WatchListItem).all()
-    watchlist = WatchList()
+    watchlist = WatchList(conflate=True)  # Served to clients, which only show the latest bars
     for item in items:
         watchlist.add_symbol(item.symbol, 0)
     return watchlist
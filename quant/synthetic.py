@@ -0,0 +1,166 @@
+"""
+ A vectorized synthetic market: geometric Brownian motion prices with U-shaped intraday volume, for thousands of
+ symbols at a time, reproducible from a seed and needing no network
+"""
+from __future__ import annotations
+
+from .markets import SymbolData, TickBar, TickEvent, WatchList, Symbols
+from .util import events, console
+from .util.price import Price
+from .util.timeutil import to_epoch_ns, from_epoch_ns, local_tz
+
+from datetime import datetime, timedelta
+from typing import Iterable, NamedTuple
+import numpy as np
+import threading
+import time
+import zlib
+import logging
+
+_log = logging.getLogger(__name__)
+
+SECONDS_PER_YEAR = 252 * 6.5 * 60 * 60  # Trading seconds
+SESSION_OPEN = timedelta(hours=9, minutes=30)
+SESSION_LENGTH = timedelta(hours=6, minutes=30)
+
+
+def seed_price(symbol: str) -> float:
+    """An offline, stable starting price between 10 and 500, derived from the symbol"""
+    return 10. * 50. ** (zlib.crc32(symbol.encode()) / 2 ** 32)
+
+
+def seed_volume(symbol: str) -> float:
+    """A stable typical volume per 5 second bar, between 100 and 10000"""
+    return 100. * 100. ** (zlib.crc32(symbol[::-1].encode()) / 2 ** 32)
+
+
+def seasonality(local_ns: np.ndarray | int) -> np.ndarray:
+    """Relative volume by time of day: heaviest at the open and close, a third as heavy at midday"""
+    day_ns = 86_400 * 1_000_000_000
+    session = (np.asarray(local_ns) % day_ns - SESSION_OPEN.total_seconds() * 1e9) / (SESSION_LENGTH.total_seconds() * 1e9)
+    return 1 / 3 + 8 / 3 * (np.clip(session, 0., 1.) - 0.5) ** 2
+
+
+class Bars(NamedTuple):
+    """One step of bars for every symbol, as arrays in symbol order"""
+    date: int  # Epoch nanoseconds
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    wap: np.ndarray
+    volume: np.ndarray
+
+
+class SyntheticMarket:
+    """
+    Bars for many symbols per call. Each bar is built from `substeps` GBM increments, so high, low and the average
+    (Ref) price come from one path rather than being drawn independently. `drift` and `volatility` are annualized.
+    """
+
+    def __init__(self, symbols: Iterable[str] = (), seed: int = None, interval: int = 5, drift=0.05,
+                 volatility=0.3, substeps=4, seed_prices: dict[str, float] = None):
+        self.rng = np.random.default_rng(seed)
+        self.interval = interval
+        self.drift = drift
+        self.volatility = volatility
+        self.substeps = substeps
+        self.seed_prices = seed_prices or {}
+        self.symbols: list[str] = []
+        self._index: dict[str, int] = {}
+        self.last = np.empty(0)
+        self.base_volume = np.empty(0)
+        self.scales = np.empty(0, dtype=np.int64)
+        self.add_symbols(symbols)
+
+    def add_symbols(self, symbols: Iterable[str]):
+        symbols = [s.upper() for s in symbols if s.upper() not in self._index]
+        for symbol in symbols:
+            self._index[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        self.last = np.append(self.last, [self.seed_prices.get(s) or seed_price(s) for s in symbols])
+        self.base_volume = np.append(self.base_volume, [seed_volume(s) for s in symbols])
+        self.scales = np.append(self.scales, [Symbols.price_scale(s) for s in symbols]).astype(np.int64)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __contains__(self, symbol):
+        return symbol.upper() in self._index
+
+    def _paths(self, steps: int) -> np.ndarray:
+        """(symbols x steps*substeps) log price increments"""
+        dt = self.interval / SECONDS_PER_YEAR / self.substeps
+        shocks = self.rng.standard_normal((len(self.symbols), steps * self.substeps))
+        return (self.drift - self.volatility ** 2 / 2) * dt + self.volatility * np.sqrt(dt) * shocks
+
+    def _bars(self, open_: np.ndarray, paths: np.ndarray, local_ns: np.ndarray) -> tuple:
+        """Bars from (symbols x steps x substeps) prices, each step opening at the previous close"""
+        high = np.maximum(paths.max(axis=2), open_)
+        low = np.minimum(paths.min(axis=2), open_)
+        close = paths[:, :, -1]
+        wap = (open_ + paths.sum(axis=2)) / (self.substeps + 1)
+        noise = self.rng.lognormal(0., 0.5, close.shape)
+        volume = (self.base_volume[:, None] * seasonality(local_ns)[None, :] * noise).astype(np.int64)
+        return high, low, close, wap, volume
+
+    def step(self, date: datetime = None) -> Bars:
+        """The next bar for every symbol, dated `date` (default now)"""
+        date = (date or datetime.now()).astimezone()
+        ns = to_epoch_ns(date)
+        offset = int(date.utcoffset().total_seconds() * 1e9)
+        paths = self.last[:, None, None] * np.exp(np.cumsum(self._paths(1), axis=1))[:, None, :]
+        open_ = self.last[:, None]
+        high, low, close, wap, volume = self._bars(open_, paths, np.array([ns + offset]))
+        self.last = close[:, 0]
+        return Bars(ns, open_[:, 0], high[:, 0], low[:, 0], close[:, 0], wap[:, 0], volume[:, 0])
+
+    def tick_bars(self, bars: Bars, symbols: Iterable[str] = None, tz=None) -> list[TickBar]:
+        """The step as TickBars, for all symbols or just those given"""
+        rows = np.array([self._index[s.upper()] for s in symbols], dtype=np.int64) if symbols is not None \
+            else np.arange(len(self.symbols))
+        date = from_epoch_ns(bars.date, tz or local_tz())
+        factors = 10. ** self.scales[rows]
+        ticks = [np.rint(column[rows] * factors).astype(np.int64).tolist() for column in bars[1:6]]
+        return [TickBar(self.symbols[row], date, Price(open_, scale), Price(high, scale), Price(low, scale),
+                        Price(close, scale), Price(wap, scale), volume)
+                for row, scale, open_, high, low, close, wap, volume
+                in zip(rows.tolist(), self.scales[rows].tolist(), *ticks, bars.volume[rows].tolist())]
+
+    def history(self, start: datetime, steps: int) -> dict[str, SymbolData]:
+        """`steps` consecutive bars per symbol from `start`, generated in one pass"""
+        start = start if start.tzinfo else start.astimezone()
+        dates = to_epoch_ns(start) + np.arange(steps, dtype=np.int64) * self.interval * 1_000_000_000
+        offset = int(start.utcoffset().total_seconds() * 1e9)
+        log_paths = np.cumsum(self._paths(steps), axis=1)
+        paths = (self.last[:, None] * np.exp(log_paths)).reshape(len(self.symbols), steps, self.substeps)
+        open_ = np.concatenate([self.last[:, None], paths[:, :-1, -1]], axis=1)
+        high, low, close, wap, volume = self._bars(open_, paths, dates + offset)
+        self.last = close[:, -1].copy()
+        return {symbol: SymbolData.from_arrays(symbol, dates, dict(zip(SymbolData.labels, (
+                    open_[i], high[i], low[i], close[i], wap[i], volume[i]))), start.tzinfo)
+                for i, symbol in enumerate(self.symbols)}
+
+
+class SyntheticMarketData:
+    """A market data source for the watchlist, emitting a TickEvent per symbol every `tick_interval` seconds"""
+
+    def __init__(self, watchlist: WatchList, seed: int = None, tick_interval=5):
+        self.watchlist = watchlist
+        self.tick_interval = tick_interval
+        self.market = SyntheticMarket(seed=seed, interval=tick_interval)
+
+    def run(self):
+        while True:
+            symbols = [symbol for symbol, _ in self.watchlist.items()]
+            if any(symbol not in self.market for symbol in symbols):
+                self.market.add_symbols(symbols)
+            tick_bars = self.market.tick_bars(self.market.step(), symbols)
+            self.watchlist.update(tick_bars)
+            for tick_bar in tick_bars:
+                events.emit(TickEvent(tick_bar))
+            time.sleep(self.tick_interval)
+
+    def start(self):
+        console.announce('Starting Synthetic Market Data Thread')
+        threading.Thread(target=self.run, daemon=True).start()
@@ -4,7 +4,8 @@ from .sources import init_market_data
 from .util import events, Parser, console
 from .markets import TickEvent, TickBar, WatchList, render_bar
 from .fakebroker import FakeBroker
-from .ibkr import InteractiveBroker
+from .journal import Journal
+from .ibkr import InteractiveBroker, CONNECTION_ID
 
 import traceback
 from functools import partial
@@ -24,8 +25,11 @@ class Trader:
         self.is_open = False  # Did we open a position?
         self.is_closed = False  # Did we close out our open position?
 
-        events.observe(TickEvent, lambda event: self.on_bar(event.tick_bar))
-        events.observe(OrderEvent, lambda event: console.announce(f'Received order status: {event.order}'))
+        # Printing is slow; if the console falls behind, print only the latest bar rather than hold up market data
+        events.observe(TickEvent, lambda event: self.on_bar(event.tick_bar), asynchronous=True,
+                       overflow=events.Overflow.CONFLATE_BY_KEY, key=self.symbol)
+        events.observe(OrderEvent, lambda event: console.announce(f'Received order status: {event.order}'),
+                       key=self.symbol)
 
     def open_position(self):
         if self.is_open:
@@ -128,17 +132,24 @@ def main():
                         const=True, default=False,
                         help='Use the fake broker')
     parser.add_argument('-s', dest='source', type=str,
-                        help='Source of market data: "live", "random" or a date for example "2022-09-08 10:00:00"',
+                        help='Source of market data: "live", "random", "synthetic", a date for example "2022-09-08 10:00:00",'
+                             ' a journal (.qjnl) to replay or "feed" to read from quant.publisher, which must publish the symbol',
                         default='live')
     parser.add_argument('-H', dest='history', type=str, help='Directory for storing history', default='history')
+    parser.add_argument('-x', dest='speed', type=float, default=1.,
+                        help='Replay speed when the source is a date or journal, for example 10 for 10x. 0 replays unthrottled')
+    parser.add_argument('--client-id', dest='client_id', type=int, default=CONNECTION_ID,
+                        help='IBKR client id; each process connected to IBKR at the same time needs a different one')
+    parser.add_argument('-J', dest='journal', type=str, help='Record market data and order events to this journal file')
     args = parser.parse_args()
 
     logging.getLogger('ibapi').setLevel(logging.WARN)
 
     watchlist = WatchList()
     watchlist.add_symbol(args.symbol)
-    broker = init_broker(watchlist, use_fake=args.fake)
-    init_market_data(args.source, watchlist)
+    broker = init_broker(watchlist, use_fake=args.fake, client_id=args.client_id)
+    recorder = Journal(args.journal).start() if args.journal else None
+    init_market_data(args.source, watchlist, args.history, args.speed)
 
     direction = Direction.LONG if args.direction == 'buy' else Direction.SHORT
     position = Position(args.symbol.upper(), direction, args.quantity)
@@ -146,15 +157,17 @@ def main():
     if not args.delay:
         trader.open_position()
     run_command_loop(trader)
+    if recorder:
+        recorder.stop()
 
 
-def init_broker(watchlist, use_fake=False):
+def init_broker(watchlist, use_fake=False, client_id=CONNECTION_ID):
     if use_fake:
         console.announce('Using FAKE broker')
         broker = FakeBroker(watchlist)
     else:
         console.announce('Using Interactive Broker')
-        broker = InteractiveBroker(watchlist)
+        broker = InteractiveBroker(watchlist, client_id)
     console.announce('Starting the Broker interface')
     broker.start()
     return broker
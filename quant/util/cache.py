@@ -0,0 +1,120 @@
+"""
+ A thread-safe, size-bounded LRU cache with optional per-entry expiry
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Callable, Hashable, NamedTuple, Any
+import threading
+import time
+import sys
+import logging
+
+import numpy as np
+
+_log = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def sizeof(value) -> int:
+    """Approximate bytes held by a value: array and frame buffers where it has them"""
+    if hasattr(value, 'memory_usage'):  # DataFrame or Series
+        return int(np.sum(value.memory_usage(index=True)))
+    nbytes = getattr(value, 'nbytes', None)
+    return int(nbytes) if nbytes is not None else sys.getsizeof(value)
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    expirations: int
+    evictions: int
+    entries: int
+    size: int  # In bytes, as weighed
+
+    def __str__(self):
+        lookups = self.hits + self.misses
+        ratio = self.hits / lookups if lookups else 0.
+        return (f'{self.hits} hits, {self.misses} misses ({ratio:.0%} hit rate), {self.expirations} expired, '
+                f'{self.evictions} evicted, {self.entries} entries of {self.size / 1_000_000:.1f}MB')
+
+
+class _Entry(NamedTuple):
+    value: Any
+    size: int
+    expires: float | None
+
+
+class LRUCache:
+    """
+    Holds values up to a total of `max_size` bytes, as measured by `weigh`, evicting the least recently used first.
+    Entries put with a `ttl` (seconds) expire after it; others stay until evicted.
+    """
+
+    def __init__(self, max_size: int, weigh: Callable[[Any], int] = sizeof):
+        self.max_size = max_size
+        self.weigh = weigh
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.expirations = self.evictions = 0
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires is not None and entry.expires <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(self, key: Hashable, value, ttl: float = None):
+        size = self.weigh(value)
+        if size > self.max_size:
+            _log.debug(f'Not caching {key}: {size} bytes is more than the whole cache')
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(value, size, time.monotonic() + ttl if ttl is not None else None)
+            self._size += size
+            while self._size > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_load(self, key: Hashable, load: Callable[[], Any], ttl: float = None):
+        """Returns the cached value, or loads, caches and returns it. Loads happen outside the lock"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = load()
+            self.put(key, value, ttl)
+        return value
+
+    def _remove(self, key):
+        self._size -= self._entries.pop(key).size
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def stats(self) -> CacheStats:
+        return CacheStats(self.hits, self.misses, self.expirations, self.evictions, len(self._entries), self._size)
@@ -1,7 +1,10 @@
-import time
+from __future__ import annotations
+
+import asyncio
+import threading
 import logging
+from concurrent.futures import Future
 from typing import Callable
-from .timeutil import Waiter
 
 _log = logging.getLogger(__name__)
 
@@ -11,29 +14,43 @@ class CallChannels:
     def __init__(self, base_req_id=1000):
         self._channels = {}
         self._next_req_id = base_req_id
+        self._lock = threading.Lock()
 
-    def channel_for(self, key, metadata=None, result=None) -> 'CallChannel':
+    def channel_for(self, key, metadata=None, data=None) -> 'CallChannel':
         if key not in self._channels:
-            self._channels[key] = CallChannel(self, key, metadata, result)
+            self._channels[key] = CallChannel(self, key, metadata, data)
         return self._channels[key]
 
-    def next_channel(self, metadata=None, result=None) -> 'CallChannel':
-        channel = self.channel_for(self._next_req_id, metadata, result)
-        self._next_req_id += 1
+    def next_channel(self, metadata=None, data=None) -> 'CallChannel':
+        with self._lock:  # Requests may be issued from several threads
+            channel = self.channel_for(self._next_req_id, metadata, data)
+            self._next_req_id += 1
         return channel
 
+    def get(self, key) -> 'CallChannel | None':
+        """The open channel for the key, without creating one"""
+        return self._channels.get(key)
+
+    def __contains__(self, key):
+        return key in self._channels
+
     def close(self, key):
-        return self._channels.pop(key)
+        return self._channels.pop(key, None)
 
 
 class CallChannel:
+    """
+    One request to an asynchronous API and the data that comes back for it. The reader thread feeds data in with
+    on_data and completes the channel with close, or with fail if the request was refused; the caller waits with
+    result(timeout), or awaits the channel. `data` holds what has arrived so far.
+    """
 
-    def __init__(self, channels: CallChannels, key, metadata=None, result=None):
+    def __init__(self, channels: CallChannels, key, metadata=None, data=None):
         self.key = key
         self.metadata = metadata
-        self.result = result
+        self.data = data
+        self.future = Future()
 
-        self._waiter = None
         self._callbacks = []
         self._buffer = []
         self._channels = channels
@@ -41,24 +58,34 @@ class CallChannel:
     def add_callback(self, callback):
         self._callbacks.append(callback)
 
+    def start(self, call: Callable) -> CallChannel:
+        """Makes the request without waiting for it"""
+        call()
+        return self
+
     def call(self, call: Callable, max_wait=30):
-        if max_wait == 0:
-            call()
-        else:
-            self._waiter = Waiter(max_wait)
-            call()
-            while self._waiter.still_waiting():
-                time.sleep(1)
-            if self._waiter.expired():
-                _log.warning(f'Call for {self.key} failed to complete in {self._waiter.max_wait}s,'
-                             f' results may be incomplete.')
-        return self.result
+        """Makes the request and waits up to `max_wait` seconds for it to complete. 0 means don't wait"""
+        self.start(call)
+        return self.result(max_wait) if max_wait else self.data
+
+    def result(self, timeout=None):
+        """
+        Waits for the channel to close and returns its data. Raises TimeoutError if it hasn't closed within the
+        timeout, leaving what did arrive in `data`, and the failure's exception if the channel failed
+        """
+        try:
+            return self.future.result(timeout)
+        except TimeoutError:
+            raise TimeoutError(f'Call for {self.key} failed to complete in {timeout}s') from None
+
+    def __await__(self):
+        return asyncio.wrap_future(self.future).__await__()
 
     def on_data(self, data):
         for callback in self._callbacks:
             callback(data)
-        if self.result is None:
-            self.result = data
+        if self.data is None:
+            self.data = data
 
     def buffer(self, data):
         self._buffer.append(data)
@@ -71,6 +98,11 @@ class CallChannel:
     def close(self, data=None):
         if data is not None:
             self.on_data(data)
-        if self._waiter is not None:
-            self._waiter.done()
         self._channels.close(self.key)
+        if not self.future.done():
+            self.future.set_result(self.data)
+
+    def fail(self, exception: Exception):
+        self._channels.close(self.key)
+        if not self.future.done():
+            self.future.set_exception(exception)
@@ -0,0 +1,113 @@
+"""
+ A small binary columnar file format: a header followed by one typed array per column, readable by memory mapping.
+ A file holds one or more such blocks back to back.
+
+ Layout (little endian):
+   4 bytes  magic b'QCOL'
+   4 bytes  format version (uint32)
+   4 bytes  header length in bytes (uint32)
+   header   UTF-8 JSON: {"rows": n, "columns": [{"name", "dtype", "offset"}, ...], "meta": {...}}
+   columns  each starting at its `offset` past the header, with the header and every column padded to ALIGNMENT bytes
+"""
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import numpy as np
+from typing import BinaryIO, Iterator
+
+MAGIC = b'QCOL'
+VERSION = 1
+ALIGNMENT = 64
+_PREAMBLE = struct.Struct('<4sII')
+
+
+class ColumnarFormatError(Exception):
+    pass
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write(path: str, columns: dict[str, np.ndarray], meta: dict = None):
+    """Writes equal length columns and a JSON-serializable `meta` dict. The file is replaced atomically"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as file:
+        write_block(file, columns, meta)
+    os.replace(tmp_path, path)
+
+
+def write_block(file: BinaryIO, columns: dict[str, np.ndarray], meta: dict = None):
+    """
+    Writes one block (preamble, header and columns) at the file's current position. A stream of blocks written one
+    after another can be read back with read_blocks
+    """
+    rows = len(next(iter(columns.values()))) if columns else 0
+    arrays = {name: np.ascontiguousarray(values, dtype=np.dtype(values.dtype).newbyteorder('<'))
+              for name, values in columns.items()}
+    if any(len(values) != rows for values in arrays.values()):
+        raise ValueError('Columns must all have the same length')
+
+    offsets, offset = [], 0
+    for values in arrays.values():
+        offsets.append(offset)
+        offset = _aligned(offset + values.nbytes)
+    header = json.dumps({
+        'rows': rows,
+        'columns': [{'name': name, 'dtype': values.dtype.str, 'offset': offset}
+                    for (name, values), offset in zip(arrays.items(), offsets)],
+        'meta': meta or {},
+    }).encode()
+    start, end = _aligned(_PREAMBLE.size + len(header)), offset
+
+    file.write(_PREAMBLE.pack(MAGIC, VERSION, len(header)))
+    file.write(header)
+    written = _PREAMBLE.size + len(header)
+    for values, offset in zip(arrays.values(), offsets):
+        file.write(b'\0' * (start + offset - written))
+        file.write(values.tobytes())
+        written = start + offset + values.nbytes
+    file.write(b'\0' * (start + end - written))  # Pad the block to a whole number of ALIGNMENT bytes
+
+
+def read(path: str) -> tuple[dict[str, np.ndarray], dict]:
+    """
+    Returns the columns, as read-only arrays over a memory map of the file, and the `meta` dict. The map is released
+    once no array refers to it
+    """
+    return next(read_blocks(path))[:2]
+
+
+def read_blocks(path: str) -> Iterator[tuple[dict[str, np.ndarray], dict, int]]:
+    """Yields (columns, meta, position) for each block in a file, as read"""
+    with open(path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size < _PREAMBLE.size:
+            raise ColumnarFormatError(f'{path} is too short')
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    position = 0
+    while position < size:
+        columns, meta, end = _read_block(buffer, position, path)
+        yield columns, meta, position
+        position = end
+
+
+def _read_block(buffer, position: int, path: str) -> tuple[dict[str, np.ndarray], dict, int]:
+    magic, version, header_length = _PREAMBLE.unpack_from(buffer, position)
+    if magic != MAGIC or version != VERSION:
+        raise ColumnarFormatError(f'{path} is not a version {VERSION} columnar file')
+    header_start = position + _PREAMBLE.size
+    header = json.loads(buffer[header_start:header_start + header_length])
+    rows, start = header['rows'], position + _aligned(_PREAMBLE.size + header_length)
+    columns, end = {}, start
+    for column in header['columns']:
+        dtype = np.dtype(column['dtype'])
+        if rows:
+            columns[column['name']] = np.frombuffer(buffer, dtype=dtype, count=rows, offset=start + column['offset'])
+        else:
+            columns[column['name']] = np.empty(0, dtype=dtype)
+        end = max(end, start + _aligned(column['offset'] + rows * dtype.itemsize))
+    return columns, header['meta'], end
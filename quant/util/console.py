@@ -4,6 +4,7 @@
 
 from decimal import Decimal
 from numpy import float64
+from .price import Price
 
 
 class Colors:
@@ -43,7 +44,7 @@ class Console:
         comparison = value if comparison is None else comparison
         start_color = Colors.RED if value < comparison else Colors.GREEN if value > comparison else ''
         bold = Colors.BOLD if bold else ''
-        is_float = type(value) in (float, Decimal, float64)
+        is_float = type(value) in (float, Decimal, float64, Price)
         if is_float and value < 10:
             val_str = f'{value:.3f}'
         elif is_float:
@@ -1,49 +1,199 @@
 from abc import ABC
-from collections import defaultdict
+from collections import defaultdict, deque
+from enum import Enum
 from typing import Type
-import traceback
+import inspect
+import threading
 import logging
 import weakref
 
 log = logging.getLogger(__name__)
 
+DEFAULT_QUEUE_SIZE = 1024
+
 
 class Event(ABC):
     """Base class for all events"""""
 
+    @property
+    def key(self):
+        """What the event is about, for observers that asked for only one key (for example a symbol). None for all"""
+        return None
+
+
+class Overflow(Enum):
+    """What an asynchronous observer's queue does with a new event when it is full"""
+    BLOCK = 'block'  # The emitter waits for room
+    DROP_OLDEST = 'drop-oldest'  # The oldest queued event is discarded
+    CONFLATE = 'conflate'  # Only the newest event is kept: a queue of one slot, overwritten
+    CONFLATE_BY_KEY = 'conflate-by-key'  # Only the newest event per key is kept, however many keys there are
+
+
+def _weak_ref(observer: callable):
+    """A weak reference to the observer. A bound method's is to its object, as the method itself is made per access"""
+    return weakref.WeakMethod(observer) if inspect.ismethod(observer) else weakref.ref(observer)
+
 
-observers = defaultdict(list)
+class AsyncObserver:
+    """
+    Delivers events to an observer on its own worker thread, through a bounded queue, so that emitting costs the
+    same however slow the observer is. `dropped` counts events discarded by the overflow policy.
+    Each cycle the worker takes the oldest event, or with `batch` or CONFLATE_BY_KEY everything pending. With
+    `batch` the observer gets those as one list. Under CONFLATE_BY_KEY a cycle holds at most one event per key,
+    so a burst costs the observer O(keys) work rather than O(events).
+    """
 
+    def __init__(self, clazz: Type[Event], observer: callable, maxsize=DEFAULT_QUEUE_SIZE, overflow=Overflow.BLOCK,
+                 weak=False, batch=False):
+        self.clazz = clazz
+        self.ref = _weak_ref(observer) if weak else (lambda: observer)
+        self.name = getattr(observer, '__qualname__', repr(observer))
+        self.overflow = overflow
+        self.maxsize = 1 if overflow is Overflow.CONFLATE else maxsize
+        self.batch = batch
+        self.keyed = overflow is Overflow.CONFLATE_BY_KEY
+        self.queue = {} if self.keyed else deque()  # Pending events, by key when keyed (dicts keep insertion order)
+        self.dropped = 0
+        self.delivered = 0
+        self.closed = False
+        self._draining = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=f'observer-{self.name}', daemon=True)
+        self._thread.start()
+
+    def __call__(self, event: Event):
+        with self._condition:
+            if self.keyed:
+                key = event.key
+                if key in self.queue:
+                    self.dropped += 1
+                self.queue[key] = event
+            else:
+                if len(self.queue) >= self.maxsize:
+                    if self.overflow is Overflow.BLOCK:
+                        while len(self.queue) >= self.maxsize and not self.closed:
+                            self._condition.wait()
+                    else:
+                        self.queue.popleft()
+                        self.dropped += 1
+                self.queue.append(event)
+            self._condition.notify_all()
+
+    def _take(self) -> list[Event]:
+        """Everything pending, or just the oldest event for a one-at-a-time unkeyed observer"""
+        if self.keyed:
+            pending, self.queue = list(self.queue.values()), {}
+        elif self.batch:
+            pending = list(self.queue)
+            self.queue.clear()
+        else:
+            pending = [self.queue.popleft()]
+        return pending
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self.queue and not self.closed and not self._draining:
+                    self._condition.wait()
+                if self.closed or not self.queue:  # Closed, or drained
+                    return
+                pending = self._take()
+                self._condition.notify_all()
+            observer = self.ref()
+            if observer is None:
+                log.debug(f'Observer {self.name} for {self.clazz} was garbage collected')
+                self.close()
+                return
+            for delivery in [pending] if self.batch else pending:
+                if _deliver(observer, delivery):
+                    self.close()
+                    return
+            self.delivered += len(pending)
 
-def observe(clazz: Type[Event], observer: callable, weak=False):
-    log.debug(f'Adding {observer!r} for event type {clazz!r}')
-    observers[clazz].append((weak, weakref.ref(observer) if weak else observer))
+    def close(self, drain=False):
+        """
+        Unregisters and stops the worker, discarding anything still queued. With `drain`, the worker delivers what is
+        queued first, and close waits for it to
+        """
+        stop_observing(self.clazz, self)
+        if drain and threading.current_thread() is not self._thread:
+            with self._condition:
+                self._draining = True
+                self._condition.notify_all()
+            self._thread.join()
+        with self._condition:
+            self.closed = True
+            self.queue = {} if self.keyed else deque()
+            self._condition.notify_all()
+
+    def __repr__(self):
+        return f'AsyncObserver({self.name}, {self.overflow.value}, queued={len(self.queue)}, dropped={self.dropped})'
+
+
+observers = defaultdict(dict)  # Event class -> key -> [(weak, ref)]. Key None observes every event of the class
+_lock = threading.Lock()  # Held for every change to observers. emit reads without it, relying on copy on write
+
+
+def observe(clazz: Type[Event], observer: callable, weak=False, asynchronous=False, maxsize=DEFAULT_QUEUE_SIZE,
+            overflow=Overflow.BLOCK, key=None, batch=False):
+    """
+    Calls the observer with each event of the class, until it returns True. With a `key`, only events whose key
+    matches, looked up by key rather than filtered per observer. By default it is called on the emitting thread;
+    `asynchronous` gives it a queue and worker thread of its own instead, and `batch` a list of the events
+    pending each time (see AsyncObserver). Returns what to pass to stop_observing
+    """
+    log.debug(f'Adding {observer!r} for event type {clazz!r}' + (f' key {key!r}' if key is not None else ''))
+    if asynchronous:
+        ref = AsyncObserver(clazz, observer, maxsize, overflow, weak, batch)
+        weak = False
+    else:
+        ref = _weak_ref(observer) if weak else observer
+    with _lock:
+        by_key = observers[clazz]
+        by_key[key] = by_key.get(key, []) + [(weak, ref)]  # Copy on write, as emit may be iterating the old list
+    return ref
+
+
+def _deliver(observer: callable, event: Event) -> bool:
+    """Calls the observer, returning True if it asked to stop observing"""
+    try:
+        if observer(event):
+            log.info(f'Removing {observer!r} for event type {type(event)!r}')
+            return True
+    except Exception:  # noqa Don't allow bad observers to hang us
+        log.exception(f'Error in observer {observer!r}:')
+    return False
 
 
 def emit(event: Event):
     clazz = type(event)
-    for (weak, ref) in observers[clazz]:
+    by_key = observers.get(clazz)
+    if not by_key:
+        return
+    key = event.key
+    matching = by_key.get(None, ())
+    if key is not None and key in by_key:
+        matching = [*matching, *by_key[key]]
+    for (weak, ref) in matching:
         if weak:
             observer = ref()
             if observer is None:
-                print(f'Observer for {clazz} was GCd')
+                log.debug(f'Observer for {clazz} was garbage collected')
                 stop_observing(clazz, ref)
                 continue
-            else:
-                print(f'Observer for {clazz} WAS NOT GCd')
         else:
-            # print(f'Observer for {clazz} is not a weak ref')
             observer = ref
-
-        try:
-            if observer(event):
-                log.info(f'Removing {observer!r} for event type {clazz!r}')
-                stop_observing(clazz, ref)
-        except Exception:  # noqa Don't allow bad observers to hang us
-            log.warning(f'Error in observer {observer!r}:')
-            print(traceback.format_exc())
+        if _deliver(observer, event):
+            stop_observing(clazz, ref)
 
 
 def stop_observing(clazz: Type[Event], observer_ref):
-    """Removes the observer from any of the event types"""
-    observers[clazz] = [(w, o) for w, o in observers[clazz] if o != observer_ref]
+    """Removes the observer from the event type, whatever key it observes"""
+    with _lock:
+        by_key = observers[clazz]
+        for key, registered in list(by_key.items()):
+            remaining = [(w, o) for w, o in registered if o != observer_ref]
+            if remaining:
+                by_key[key] = remaining
+            else:
+                by_key.pop(key, None)
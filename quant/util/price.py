@@ -0,0 +1,148 @@
+"""
+ Fixed-point prices: an integer count of ticks at a per-instrument decimal scale
+"""
+from __future__ import annotations
+
+from decimal import Decimal, ROUND_HALF_EVEN
+from numbers import Integral, Real
+
+_POWERS = [10 ** i for i in range(19)]
+
+
+class Price:
+    """
+    An exact price held as integer ticks, e.g. Price(15978, 2) is 159.78. Creating one is an integer multiply
+    rather than a string format and parse, and sums and differences stay exact. Converts to float or Decimal
+    only when asked to, for display or serialization.
+    """
+
+    __slots__ = ('ticks', 'scale')
+
+    def __init__(self, ticks: int, scale: int = 2):
+        self.ticks = ticks
+        self.scale = scale
+
+    @staticmethod
+    def of(num, scale: int = 2) -> Price | None:
+        """Converts a float, int, Decimal, numeric string or Price to a Price at the given scale"""
+        if num is None:
+            return None
+        if type(num) is Price:
+            return num if num.scale == scale else Price(num._ticks_at(scale), scale)
+        if isinstance(num, Integral):
+            return Price(int(num) * _POWERS[scale], scale)
+        if isinstance(num, (Decimal, str)):
+            ticks = Decimal(num).scaleb(scale).to_integral_value(ROUND_HALF_EVEN)
+            return Price(int(ticks), scale)
+        return Price(round(float(num) * _POWERS[scale]), scale)
+
+    def _ticks_at(self, scale: int) -> int:
+        if scale >= self.scale:
+            return self.ticks * _POWERS[scale - self.scale]
+        return round(self.ticks / _POWERS[self.scale - scale])
+
+    def _aligned(self, other) -> tuple[int, int, int] | None:
+        """Returns both operands as ticks at a common scale, or None if `other` is not a Price or an integer"""
+        if type(other) is Price:
+            scale = max(self.scale, other.scale)
+            return self._ticks_at(scale), other._ticks_at(scale), scale
+        if isinstance(other, Integral):
+            return self.ticks, int(other) * _POWERS[self.scale], self.scale
+        return None
+
+    def to_decimal(self) -> Decimal:
+        return Decimal(self.ticks).scaleb(-self.scale)
+
+    def __float__(self):
+        return self.ticks / _POWERS[self.scale]
+
+    def __int__(self):
+        whole = abs(self.ticks) // _POWERS[self.scale]
+        return whole if self.ticks >= 0 else -whole
+
+    def __bool__(self):
+        return self.ticks != 0
+
+    def __add__(self, other):
+        aligned = self._aligned(other) or self._aligned(Price.of(other, self.scale))
+        return Price(aligned[0] + aligned[1], aligned[2])
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        aligned = self._aligned(other) or self._aligned(Price.of(other, self.scale))
+        return Price(aligned[0] - aligned[1], aligned[2])
+
+    def __rsub__(self, other):
+        return -(self - other)
+
+    def __neg__(self):
+        return Price(-self.ticks, self.scale)
+
+    def __abs__(self):
+        return Price(abs(self.ticks), self.scale)
+
+    def __mul__(self, other):
+        if isinstance(other, Integral):
+            return Price(self.ticks * int(other), self.scale)
+        if type(other) is Price:
+            return NotImplemented
+        return Price.of(float(self) * float(other), self.scale)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        if type(other) is Price:
+            return float(self) / float(other)
+        return Price.of(float(self) / float(other), self.scale)
+
+    def _compare(self, other) -> int | None:
+        aligned = self._aligned(other)
+        if aligned is not None:
+            a, b = aligned[0], aligned[1]
+        elif isinstance(other, Decimal):
+            a, b = self.to_decimal(), other
+        elif isinstance(other, Real):  # Including NumPy floats, for example read from SymbolData columns
+            a, b = float(self), float(other)
+        else:
+            return None
+        return int(a > b) - int(a < b)
+
+    def __eq__(self, other):
+        c = self._compare(other)
+        return NotImplemented if c is None else c == 0
+
+    def __lt__(self, other):
+        c = self._compare(other)
+        return NotImplemented if c is None else c < 0
+
+    def __le__(self, other):
+        c = self._compare(other)
+        return NotImplemented if c is None else c <= 0
+
+    def __gt__(self, other):
+        c = self._compare(other)
+        return NotImplemented if c is None else c > 0
+
+    def __ge__(self, other):
+        c = self._compare(other)
+        return NotImplemented if c is None else c >= 0
+
+    def __hash__(self):
+        return hash(self.to_decimal())  # Consistent with equal ints, floats and Decimals
+
+    def __format__(self, format_spec):
+        return format(self.to_decimal(), format_spec)
+
+    def __str__(self):
+        return str(self.to_decimal())
+
+    def __repr__(self):
+        return f"Price('{self}')"
+
+
+def price(num, scale: int = 2) -> Price | None:
+    """Fast path for the common float case of Price.of"""
+    if type(num) is float:
+        return Price(round(num * _POWERS[scale]), scale)
+    return Price.of(num, scale)
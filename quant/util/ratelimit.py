@@ -0,0 +1,68 @@
+"""
+ Rate limiting shared between threads: token buckets, and sliding windows for hard per-window limits
+"""
+from __future__ import annotations
+
+from collections import deque
+import threading
+import time
+
+
+class TokenBucket:
+    """Allows `rate` calls per second on average, with bursts of up to `capacity` calls"""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Blocks until the tokens are available and takes them. Returns the time spent waiting"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= tokens  # May go negative: later callers then queue up behind this one
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class SlidingWindow:
+    """
+    At most `count` calls in any `seconds` long window, for every (count, seconds) limit given. Unlike a token
+    bucket, which can let through its capacity again as soon as it refills, no window ever holds more than its count
+    """
+
+    def __init__(self, *limits: tuple[int, float]):
+        self.limits = limits
+        self._times = deque(maxlen=max(count for count, _ in limits))  # When each recent call went, or will go
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Blocks until a call is allowed, and counts it. Returns the time spent waiting"""
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._times[-1]) if self._times else now
+            for count, seconds in self.limits:
+                if len(self._times) >= count:
+                    at = max(at, self._times[-count] + seconds)
+            self._times.append(at)  # Reserved, so later callers queue up behind this one
+        wait = at - now
+        if wait > 0:
+            time.sleep(wait)
+        return max(wait, 0.)
@@ -0,0 +1,59 @@
+"""
+ Coalescing of identical concurrent calls
+"""
+from __future__ import annotations
+
+from concurrent.futures import Future
+from typing import Callable, Hashable, NamedTuple, Any
+import threading
+import logging
+
+_log = logging.getLogger(__name__)
+
+
+class FlightStats(NamedTuple):
+    calls: int  # Calls actually made
+    shared: int  # Calls that waited on one already in flight instead
+
+    def __str__(self):
+        return f'{self.calls} calls, {self.shared} deduplicated'
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers that ask for a key while its call is in flight wait for it
+    and share its result, or its exception.
+    """
+
+    def __init__(self):
+        self._in_flight: dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.calls = self.shared = 0
+
+    def do(self, key: Hashable, call: Callable[[], Any]):
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._in_flight[key] = Future()
+                self.calls += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+        if not leader:
+            _log.debug(f'Waiting on in-flight call for {key}')
+            return future.result()
+        try:
+            result = call()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    @property
+    def stats(self) -> FlightStats:
+        return FlightStats(self.calls, self.shared)
@@ -1,7 +1,9 @@
 import time
 from collections.abc import Iterable
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone, time as dt_time
+from zoneinfo import ZoneInfo
 import os
+import functools
 
 
 class Waiter:
@@ -34,6 +36,8 @@ class Timer:
         self.name = name if name else Timer.instances
         self.base = time.perf_counter()
         self.t = [0.0]
+        self.count = 0
+        self.unit = 'items'
 
     def __call__(self, *args, **kwargs):
         return self.step(args[0])
@@ -57,11 +61,20 @@ class Timer:
     def diff_last(self):
         return self.t[-1] - self.t[-2]
 
+    def add(self, count: int, unit: str = None):
+        """Counts work done, so the report on exit includes throughput"""
+        self.count += count
+        self.unit = unit or self.unit
+
     def __enter__(self):
-        pass
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.step('Timer({0}) took {1:.3f}s')
+        if self.count:
+            total = self.total()
+            self.step(f'Timer({{0}}) took {{1:.3f}}s for {self.count} {self.unit} ({self.count / total:.1f}/s)')
+        else:
+            self.step('Timer({0}) took {1:.3f}s')
 
 
 def timed_release(iterable: Iterable, delay: float):
@@ -70,6 +83,10 @@ def timed_release(iterable: Iterable, delay: float):
         time.sleep(delay)
 
 
+MARKET_TZ = ZoneInfo('America/New_York')
+SESSION_OPEN = dt_time(9, 30)
+SESSION_CLOSE = dt_time(16)
+
 all_trading_days = set()
 
 
@@ -83,6 +100,50 @@ def is_trading_day(date: datetime):
     return date_string in all_trading_days
 
 
+@functools.cache
+def _last_trading_day():
+    is_trading_day(datetime.now())  # Loads the calendar
+    return max(all_trading_days)
+
+
+def is_market_closed(date: datetime):
+    """True for weekends, and for holidays as far as the trading day calendar goes"""
+    if date.weekday() >= 5:
+        return True
+    date_string = date.strftime('%Y-%m-%d')
+    return not is_trading_day(date) and date_string <= _last_trading_day()
+
+
+def has_trading_day(start: datetime, end: datetime):
+    """True if any day from start up to (not including) end is not known to be a market holiday or weekend"""
+    day, last = start.date(), (end - timedelta(microseconds=1)).date()
+    while day <= last:
+        if not is_market_closed(datetime(day.year, day.month, day.day)):
+            return True
+        day += timedelta(days=1)
+    return False
+
+
+def trading_sessions(start: datetime, end: datetime) -> list[tuple[datetime, datetime]]:
+    """
+    The regular trading hours of each trading day from start to end, clipped to them, as (open, close) in the time
+    zone of `start` (naive local time if it has none)
+    """
+    tz = start.tzinfo
+    start, end = start.astimezone(MARKET_TZ), end.astimezone(MARKET_TZ)
+    sessions = []
+    day = start.date()
+    while day <= end.date():
+        if not is_market_closed(datetime(day.year, day.month, day.day)):
+            session_open = max(start, datetime.combine(day, SESSION_OPEN, MARKET_TZ))
+            session_close = min(end, datetime.combine(day, SESSION_CLOSE, MARKET_TZ))
+            if session_open < session_close:
+                sessions.append(tuple(d.astimezone(tz) if tz else d.astimezone().replace(tzinfo=None)
+                                      for d in (session_open, session_close)))
+        day += timedelta(days=1)
+    return sessions
+
+
 def spans_days(start: datetime, end: datetime):
     return start.strftime('%Y-%m-%d') != end.strftime('%Y-%m-%d')
 
@@ -99,6 +160,39 @@ def count_trading_days(start: datetime, end: datetime):
     return total_days, trading_days
 
 
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def local_tz():
+    return datetime.now().astimezone().tzinfo
+
+
+def to_epoch_ns(date: datetime) -> int:
+    """Exact epoch nanoseconds for a datetime; naive datetimes are taken as local time"""
+    if date.tzinfo is None:
+        date = date.astimezone()
+    delta = date - _EPOCH
+    return (delta.days * 86_400 + delta.seconds) * 1_000_000_000 + delta.microseconds * 1_000
+
+
+NAIVE_OFFSET = -32768  # utc_offset_minutes of a naive, local time date
+
+
+def utc_offset_minutes(date: datetime) -> int:
+    """A date's UTC offset in minutes, to store next to its epoch nanoseconds. NAIVE_OFFSET if it has no zone"""
+    return NAIVE_OFFSET if date.tzinfo is None else int(date.utcoffset().total_seconds() // 60)
+
+
+def offset_tz(minutes: int):
+    """The fixed offset zone for utc_offset_minutes, or None (local time) for NAIVE_OFFSET"""
+    return None if minutes == NAIVE_OFFSET else timezone(timedelta(minutes=minutes))
+
+
+def from_epoch_ns(ns: int, tz) -> datetime:
+    seconds, nanos = divmod(ns, 1_000_000_000)
+    return datetime.fromtimestamp(seconds, tz).replace(microsecond=nanos // 1_000)
+
+
 def parse_date(date_str: str) -> datetime:
     formats = ['%Y%m%d', '%Y%m%d  %H:%M:%S', '%Y-%m-%d', '%Y-%m-%d  %H:%M:%S']
     for f in formats:
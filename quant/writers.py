@@ -0,0 +1,168 @@
+"""
+ Output writers for bar data. Each formats a frame column-wise, a chunk of rows at a time, and streams it to its
+ file, so nothing larger than a chunk is built in memory
+"""
+from __future__ import annotations
+
+from .util import columnar
+from .util.console import Colors
+
+from abc import ABC, abstractmethod
+from typing import IO
+from pandas import DataFrame, DatetimeIndex
+import numpy as np
+import sys
+import logging
+
+_log = logging.getLogger(__name__)
+
+CHUNK_ROWS = 65_536
+
+
+class Writer(ABC):
+    """Writes the bars of one symbol after another. Frames have Open, High, Low, Close, a Ref Price and Volume"""
+
+    binary = False
+
+    def __init__(self, file: IO, owns_file=False):
+        self.file = file
+        self.owns_file = owns_file
+
+    def write(self, symbol: str, df: DataFrame):
+        if not isinstance(df.index, DatetimeIndex):
+            df = df.set_axis(DatetimeIndex(df.index))
+        self.start(symbol.upper(), df)
+        for start in range(0, len(df), CHUNK_ROWS):
+            self.write_chunk(symbol.upper(), df.iloc[start:start + CHUNK_ROWS])
+
+    def start(self, symbol: str, df: DataFrame):
+        pass
+
+    @abstractmethod
+    def write_chunk(self, symbol: str, chunk: DataFrame):
+        pass
+
+    def close(self):
+        self.file.flush()
+        if self.owns_file:
+            self.file.close()
+
+
+def _dates(index: DatetimeIndex, separator='T', offset=False) -> list[str]:
+    """
+    Dates as local wall-clock 'YYYY-MM-DD HH:MM:SS' strings, formatted by NumPy in one call rather than per date.
+    With `offset`, ISO 8601 with the UTC offset, as datetime.isoformat gives
+    """
+    local = (index.tz_localize(None) if index.tz else index).as_unit('s').asi8
+    text = np.datetime_as_string(local.view('M8[s]'))
+    if separator != 'T':
+        text = np.char.replace(text, 'T', separator)
+    if not offset or index.tz is None:
+        return text.tolist()
+    offsets = (local - index.as_unit('s').asi8).tolist()
+    names = {seconds: f'{"-" if seconds < 0 else "+"}{abs(seconds) // 3600:02d}:{abs(seconds) % 3600 // 60:02d}'
+             for seconds in set(offsets)}
+    return [date + names[seconds] for date, seconds in zip(text.tolist(), offsets)]
+
+
+def _text(values: np.ndarray) -> list[str]:
+    """Shortest round-tripping text for each value, empty for NaN as pandas writes it"""
+    text = [str(value) for value in values.tolist()]
+    if values.dtype.kind == 'f':
+        for i in np.flatnonzero(np.isnan(values)).tolist():
+            text[i] = ''
+    return text
+
+
+def _render(values: np.ndarray, comparison: np.ndarray = None, bold=False) -> list[str]:
+    """Column-wise console.render_val: red or green against the comparison, 3 decimals below 10 and 2 above"""
+    text = [f'{value:.3f}' if value < 10 else f'{value:.2f}' for value in values.tolist()]
+    if comparison is None:
+        colors = [''] * len(text)
+    else:
+        colors = np.where(values < comparison, Colors.RED, np.where(values > comparison, Colors.GREEN, '')).tolist()
+    style = Colors.BOLD if bold else ''
+    return [f'{color}{style}{value}{Colors.END}' for color, value in zip(colors, text)]
+
+
+class TerminalWriter(Writer):
+    """The colored one line per bar format of markets.render_bar_data"""
+
+    def start(self, symbol: str, df: DataFrame):
+        self.prev_close = self.prev_ref_price = None
+
+    def write_chunk(self, symbol: str, chunk: DataFrame):
+        open_, high, low, close, ref_price = (chunk.iloc[:, i].to_numpy(dtype=float) for i in range(5))
+        volume = chunk.iloc[:, 5].tolist()
+        prev_close = np.concatenate([[self.prev_close or open_[0]], close[:-1]])
+        prev_close = np.where(prev_close != 0, prev_close, open_)  # As render_bar_data, which skips a falsy close
+        prev_ref_price = np.concatenate([[self.prev_ref_price or ref_price[0]], ref_price[:-1]])
+        prev_ref_price = np.where(prev_ref_price != 0, prev_ref_price, ref_price)
+        dates = _dates(chunk.index, separator=' ')
+        lines = zip(dates, _render(ref_price, prev_ref_price, bold=True), _render(open_), _render(high, open_),
+                    _render(low, open_), _render(close, prev_close), volume)
+        self.file.write(''.join(f'{date} {symbol} {r} O{o}-H{h}-L{lo}-C{c} {v: >4}\n'
+                                for date, r, o, h, lo, c, v in lines))
+        self.prev_close, self.prev_ref_price = close[-1], ref_price[-1]
+
+
+class CsvWriter(Writer):
+    """CSV with a Symbol column, one header for the whole file"""
+
+    def __init__(self, file: IO, owns_file=False):
+        super().__init__(file, owns_file)
+        self.header = True
+
+    def write_chunk(self, symbol: str, chunk: DataFrame):
+        if self.header:
+            labels = [chunk.index.name or 'Date', 'Symbol'] + [str(label) for label in chunk.columns]
+            self.file.write(','.join(labels) + '\n')
+            self.header = False
+        columns = [_dates(chunk.index, separator=' ', offset=True), [symbol] * len(chunk)]
+        columns.extend(_text(chunk[label].to_numpy()) for label in chunk.columns)
+        self.file.write(''.join(','.join(row) + '\n' for row in zip(*columns)))
+
+
+class JsonLinesWriter(Writer):
+    """One JSON object per bar, with ISO dates"""
+
+    def write_chunk(self, symbol: str, chunk: DataFrame):
+        dates = _dates(chunk.index, offset=True)
+        chunk = chunk.reset_index(drop=True)
+        chunk.insert(0, 'Symbol', symbol)
+        chunk.insert(0, 'Date', dates)
+        text = chunk.to_json(orient='records', lines=True)
+        self.file.write(text if text.endswith('\n') else text + '\n')
+
+
+class ColumnarWriter(Writer):
+    """
+    Blocks of the util.columnar format, one per chunk, with epoch nanosecond dates and the symbol and time zone in
+    each block's meta. Read back with columnar.read_blocks
+    """
+
+    binary = True
+
+    def write_chunk(self, symbol: str, chunk: DataFrame):
+        index = chunk.index
+        columns = {'Date': index.as_unit('ns').asi8}
+        columns.update((str(label), chunk[label].to_numpy()) for label in chunk.columns)
+        columnar.write_block(self.file, columns, {'symbol': symbol, 'tz': str(index.tz) if index.tz else None})
+
+
+writers = {
+    'terminal': TerminalWriter,
+    'csv': CsvWriter,
+    'jsonl': JsonLinesWriter,
+    'binary': ColumnarWriter,
+}
+
+
+def open_writer(output_format: str, path: str = None) -> Writer:
+    """A writer for the format, to the named file or else standard output"""
+    if output_format not in writers:
+        raise ValueError(f'Unknown output format {output_format}, choose from {", ".join(writers)}')
+    writer_class = writers[output_format]
+    if path:
+        return writer_class(open(path, 'wb' if writer_class.binary else 'w', buffering=1 << 20), owns_file=True)
+    return writer_class(sys.stdout.buffer if writer_class.binary else sys.stdout)
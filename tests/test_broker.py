@@ -1,4 +1,5 @@
 from quant.broker import Position, Direction, Order, OrderStatus
+from quant.util.price import Price, price
 from decimal import Decimal
 
 
@@ -29,3 +30,10 @@ class TestBroker:
         profit = (current_price - filled_at) * quantity
 
         assert order.p_or_l(current_price) == profit, 'Profit of order does not match current price'
+
+    def test_p_or_l_fixed_point(self):
+        position = Position('AAPL', Direction.SHORT, 100)
+        order = Order(position, OrderStatus.FILLED, -1, price(159.78), 100)
+
+        assert order.p_or_l(price(150.00)) == Price(97800)
+        assert Order.combined_p_or_l([order, order], price(160.00)) == Price(-4400)
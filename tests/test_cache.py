@@ -0,0 +1,61 @@
+from quant import fetch
+from quant.util.cache import LRUCache
+from quant.sources import RequestCache, IBKRData
+from quant.markets import DataRequest, Resolution, SymbolData, TickBar
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import time
+
+
+class TestLRUCache:
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=3 * 800)
+        for key in 'abc':
+            cache.put(key, np.zeros(100))
+        assert cache.get('a') is not None  # Now b is the oldest
+        cache.put('d', np.zeros(100))
+        assert 'b' not in cache and 'a' in cache and 'd' in cache
+        assert cache.stats.evictions == 1 and cache.stats.size == 3 * 800
+
+    def test_expiry_and_counters(self):
+        cache = LRUCache(max_size=1000)
+        loads = []
+        load = lambda: loads.append(1) or len(loads)  # noqa: E731
+        assert cache.get_or_load('k', load, ttl=0.01) == 1
+        assert cache.get_or_load('k', load, ttl=0.01) == 1
+        time.sleep(0.02)
+        assert cache.get_or_load('k', load) == 2
+        assert (cache.stats.hits, cache.stats.misses, cache.stats.expirations) == (1, 2, 1)
+
+
+class TestRequestCache:
+
+    def test_closed_days_are_permanent(self):
+        cache = RequestCache()
+        now = datetime.now().astimezone()
+        closed = DataRequest('FOO', now - timedelta(days=10), now - timedelta(days=5))
+        open_ = DataRequest('FOO', now - timedelta(days=10), now)
+        assert cache.ttl_for(closed) is None
+        assert cache.ttl_for(open_) == cache.open_range_ttl
+
+    def test_normalized_key(self):
+        cache = RequestCache()
+        calls = []
+        start = datetime(2022, 9, 8).astimezone()
+        fetcher = cache.wrap('test', lambda request: calls.append(request) or 'data')
+        fetcher(DataRequest('foo', start, start + timedelta(days=1)))
+        fetcher(DataRequest('FOO', start.astimezone(timezone(timedelta(hours=3))), start + timedelta(days=1)))
+        assert len(calls) == 1 and cache.stats.hits == 1
+
+    def test_fetch_cli_and_replay_share_ibkr_entries(self, monkeypatch):
+        cache = RequestCache()
+        monkeypatch.setattr(fetch, 'request_cache', cache)
+        start = datetime(2022, 9, 8, 10).astimezone()
+        data = SymbolData('FOO', resolution=Resolution.FIVE_SEC)
+        data.append_bar(TickBar.new('FOO', start, 1, 2, 0.5, 1.5, 1.2, 7))
+        monkeypatch.setattr(IBKRData, '_fetch_symbol_data', lambda request: data)
+        request = DataRequest('FOO', start, start + timedelta(hours=1), Resolution.FIVE_SEC)
+        assert fetch._fetchers['ibkr'](request)['Volume'].tolist() == [7]
+        assert cache.fetch('ibkr', IBKRData.fetch_symbol_data, request) is data  # What replay gets back
+        assert cache.stats.hits == 1
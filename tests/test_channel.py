@@ -0,0 +1,49 @@
+from quant.util.channel import CallChannels
+import asyncio
+import pytest
+import threading
+import time
+
+
+class TestCallChannel:
+
+    def test_returns_when_closed(self):
+        channels = CallChannels()
+        channel = channels.next_channel(data=[])
+        channel.add_callback(channel.data.append)
+
+        def reply():
+            for i in range(3):
+                channel.on_data(i)
+            channel.close()
+
+        start = time.perf_counter()
+        assert channel.call(lambda: threading.Timer(0.01, reply).start()) == [0, 1, 2]
+        assert time.perf_counter() - start < 0.5
+        assert channel.key not in channels
+
+    def test_timeout_raises_and_keeps_partial_data(self):
+        channel = CallChannels().next_channel(data=[])
+        channel.add_callback(channel.data.append)
+        with pytest.raises(TimeoutError):
+            channel.call(lambda: channel.on_data('partial'), max_wait=0.01)
+        assert channel.data == ['partial']
+
+    def test_failure_raises(self):
+        channels = CallChannels()
+        channel = channels.next_channel(data=[])
+        channel.start(lambda: threading.Timer(0.01, channel.fail, (ValueError('refused'),)).start())
+        with pytest.raises(ValueError, match='refused'):
+            channel.result(1)
+        assert channel.key not in channels
+
+    def test_awaitable(self):
+        channels = CallChannels()
+
+        async def many():
+            pending = [channels.next_channel().start(lambda: None) for _ in range(3)]
+            for i, channel in enumerate(pending):
+                threading.Timer(0.01, channel.close, (i,)).start()
+            return await asyncio.gather(*pending)
+
+        assert asyncio.run(many()) == [0, 1, 2]
@@ -0,0 +1,128 @@
+from quant.util import events
+from quant.util.events import Event, Overflow
+import sys
+import threading
+import time
+
+
+class Ping(Event):
+    def __init__(self, n):
+        self.n = n
+
+
+def wait_for(condition, timeout=1.):
+    start = time.perf_counter()
+    while not condition() and time.perf_counter() - start < timeout:
+        time.sleep(0.001)
+    return condition()
+
+
+class TestAsyncObservers:
+
+    def teardown_method(self):
+        events.observers.pop(Ping, None)
+
+    def test_slow_observer_does_not_block_emit(self):
+        release, received = threading.Event(), []
+        events.observe(Ping, lambda e: release.wait() and False or received.append(e.n), asynchronous=True)
+        start = time.perf_counter()
+        for n in range(100):
+            events.emit(Ping(n))
+        assert time.perf_counter() - start < 0.05
+        release.set()
+        assert wait_for(lambda: len(received) == 100)
+        assert received == list(range(100))
+
+    def test_overflow_policies(self):
+        release, dropped, conflated = threading.Event(), [], []
+        gate = lambda target: lambda e: release.wait() and target.append(e.n)  # noqa: E731
+        drop = events.observe(Ping, gate(dropped), asynchronous=True, maxsize=3, overflow=Overflow.DROP_OLDEST)
+        conflate = events.observe(Ping, gate(conflated), asynchronous=True, overflow=Overflow.CONFLATE)
+        events.emit(Ping(0))
+        assert wait_for(lambda: not drop.queue and not conflate.queue)  # Both workers are now held on the first
+        for n in range(1, 10):
+            events.emit(Ping(n))
+        release.set()
+        assert wait_for(lambda: len(dropped) == 4 and len(conflated) == 2)
+        assert dropped == [0, 7, 8, 9] and conflated == [0, 9] and drop.dropped == 6
+
+    def test_close_drains(self):
+        release, received = threading.Event(), []
+        ref = events.observe(Ping, lambda e: release.wait() and received.append(e.n), asynchronous=True)
+        for n in range(5):
+            events.emit(Ping(n))
+        threading.Timer(0.02, release.set).start()
+        ref.close(drain=True)
+        assert received == list(range(5)) and not events.observers[Ping]
+
+    def test_returning_true_stops(self):
+        received = []
+        events.observe(Ping, lambda e: received.append(e.n) or e.n == 1, asynchronous=True)
+        for n in range(3):
+            events.emit(Ping(n))
+        assert wait_for(lambda: not events.observers[Ping])
+        assert received == [0, 1]
+
+
+class Keyed(Event):
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+    @property
+    def key(self):
+        return self.symbol
+
+
+class TestKeyedObservers:
+
+    def teardown_method(self):
+        events.observers.pop(Keyed, None)
+
+    def test_only_matching_key_is_called(self):
+        everything, spy, qqq = [], [], []
+        events.observe(Keyed, lambda e: everything.append(e.symbol))
+        events.observe(Keyed, lambda e: spy.append(e.symbol), key='SPY')
+        events.observe(Keyed, lambda e: qqq.append(e.symbol), key='QQQ')
+        for symbol in ('SPY', 'IWM', 'QQQ', 'SPY'):
+            events.emit(Keyed(symbol))
+        assert everything == ['SPY', 'IWM', 'QQQ', 'SPY']
+        assert spy == ['SPY', 'SPY'] and qqq == ['QQQ']
+
+    def test_stop_observing_a_key(self):
+        received = []
+        ref = events.observe(Keyed, lambda e: received.append(e.symbol), key='SPY')
+        events.emit(Keyed('SPY'))
+        events.stop_observing(Keyed, ref)
+        events.emit(Keyed('SPY'))
+        assert received == ['SPY'] and not events.observers[Keyed]
+
+    def test_concurrent_registration(self):
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # Switch threads as often as possible, to interleave the registrations
+        try:
+            def register(symbol):
+                refs = [events.observe(Keyed, lambda e: None, key=symbol) for _ in range(200)]
+                for ref in refs[::2]:
+                    events.stop_observing(Keyed, ref)
+
+            threads = [threading.Thread(target=register, args=(symbol,)) for symbol in ('SPY', 'SPY', 'QQQ', None)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        assert {key: len(registered) for key, registered in events.observers[Keyed].items()} == {
+            'SPY': 200, 'QQQ': 100, None: 100}
+
+    def test_conflate_by_key(self):
+        release, batches = threading.Event(), []
+        ref = events.observe(Keyed, lambda pending: release.wait() and batches.append([e.symbol for e in pending]),
+                             asynchronous=True, overflow=Overflow.CONFLATE_BY_KEY, batch=True)
+        events.emit(Keyed('IWM'))
+        assert wait_for(lambda: not ref.queue)  # The worker is held on the first batch
+        for n in range(1000):
+            events.emit(Keyed('SPY' if n % 2 else 'QQQ'))
+        release.set()
+        assert wait_for(lambda: len(batches) == 2)
+        assert batches == [['IWM'], ['QQQ', 'SPY']] and ref.dropped == 998
@@ -0,0 +1,75 @@
+from quant.feed import FeedPublisher, FeedSubscriber
+from quant.markets import TickBar, WatchList
+from quant.util import console
+from datetime import datetime, timedelta, timezone
+import multiprocessing
+import os
+import pytest
+import threading
+
+
+def bar(symbol, n):
+    date = datetime(2022, 9, 8, 10, tzinfo=timezone(timedelta(hours=-4))) + timedelta(seconds=5 * n)
+    return TickBar.new(symbol, date, 100 + n, 101 + n, 99 + n, 100.5 + n, 100.25 + n, n)
+
+
+def read_in_child(name, count, results):
+    subscriber = FeedSubscriber(name, from_start=True)
+    bars = subscriber.tick_bars(subscriber.poll())
+    results.put(([(b.symbol, b.volume, float(b.close)) for b in bars][:count], subscriber.lost))
+    subscriber.close()
+
+
+@pytest.fixture
+def publisher():
+    publisher = FeedPublisher(f'quant-test-{os.getpid()}', capacity=8, max_symbols=4)
+    yield publisher
+    publisher.close()
+
+
+class TestFeed:
+
+    def test_subscriber_reads_new_bars(self, publisher):
+        publisher.publish(bar('SPY', 0))
+        subscriber = FeedSubscriber(publisher.name)
+        publisher.publish(bar('QQQ', 1))
+        publisher.publish(bar('SPY', 2))
+        bars = subscriber.tick_bars(subscriber.poll())
+        assert bars == [bar('QQQ', 1), bar('SPY', 2)]
+        assert not len(subscriber.poll()) and subscriber.lost == 0
+        subscriber.close()
+
+    def test_slow_reader_detects_overrun(self, publisher):
+        subscriber = FeedSubscriber(publisher.name)
+        for n in range(20):
+            publisher.publish(bar('SPY', n))
+        bars = subscriber.tick_bars(subscriber.poll(limit=5))
+        assert subscriber.lost == 12
+        assert [b.volume for b in bars] == [12, 13, 14, 15, 16]
+        assert [b.volume for b in subscriber.tick_bars(subscriber.poll())] == [17, 18, 19]
+        subscriber.close()
+
+    def test_only_watched_symbols(self, publisher, monkeypatch):
+        warnings = []
+        monkeypatch.setattr(console, 'warn', warnings.append)
+        subscriber = FeedSubscriber(publisher.name, watchlist=WatchList(['SPY', 'DIA']))
+        for n, symbol in enumerate(['SPY', 'QQQ', 'SPY']):
+            publisher.publish(bar(symbol, n))
+        emitted = []
+        subscriber.check_interval = 0
+        threading.Timer(0.05, subscriber.stop).start()
+        subscriber.run(emit=emitted.append)
+        assert [(e.tick_bar.symbol, e.tick_bar.volume) for e in emitted] == [('SPY', 0), ('SPY', 2)]
+        assert len(warnings) == 1 and 'DIA' in warnings[0]  # Warned once, however many checks
+        subscriber.close()
+
+    def test_other_process_reads(self, publisher):
+        for n, symbol in enumerate(['SPY', 'QQQ', 'IWM']):
+            publisher.publish(bar(symbol, n))
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        child = context.Process(target=read_in_child, args=(publisher.name, 3, results))
+        child.start()
+        bars, lost = results.get(timeout=30)
+        child.join(timeout=30)
+        assert bars == [('SPY', 0, 100.5), ('QQQ', 1, 101.5), ('IWM', 2, 102.5)] and lost == 0
@@ -0,0 +1,94 @@
+from quant.ibkr import IBApi, IBKRError, HistoricalDataError, InteractiveBroker, CONNECTION_ID, plan_chunks, \
+    to_time_string
+from quant.markets import DataRequest, Resolution, WatchList
+from quant.util import channels
+from quant.util.timeutil import MARKET_TZ
+from ibapi.common import BarData
+from datetime import datetime, timedelta
+import pytest
+
+
+def market_time(*args):
+    return datetime(*args, tzinfo=MARKET_TZ)
+
+
+class TestPlanChunks:
+
+    def test_small_request_is_one_chunk(self):
+        request = DataRequest('FOO', market_time(2022, 9, 8, 10), market_time(2022, 9, 8, 10, 30), Resolution.FIVE_SEC)
+        assert plan_chunks(request) == [request]
+
+    def test_splits_and_skips_weekends(self):
+        request = DataRequest('FOO', market_time(2022, 9, 9, 9), market_time(2022, 9, 12, 11), Resolution.FIVE_SEC)
+        chunks = plan_chunks(request)
+        assert chunks[0].start == market_time(2022, 9, 9, 9, 30) and chunks[-1].end == request.end
+        assert all(c.expected_size() <= 720 for c in chunks)
+        assert {c.start.weekday() for c in chunks} == {0, 4}  # Nothing asked for Saturday or Sunday
+        assert to_time_string(chunks[0].start, chunks[0].end) == '3600 S'
+
+    def test_only_trading_sessions(self):
+        request = DataRequest('FOO', market_time(2022, 9, 5), market_time(2022, 9, 19), Resolution.FIVE_SEC)
+        chunks = plan_chunks(request)
+        assert len(chunks) == 63  # 9 trading days (Labor Day is a holiday) of 6.5 hours, in 7 chunks each
+        assert all(market_time(2022, 9, 6) < c.start < market_time(2022, 9, 17) for c in chunks)
+        assert all((c.start.hour, c.start.minute) >= (9, 30) and (c.end.hour, c.end.minute) <= (16, 0)
+                   for c in chunks)
+        assert sum((c.end - c.start for c in chunks), timedelta()) == timedelta(hours=6.5) * 9
+
+    def test_forex_trades_around_the_clock(self):
+        request = DataRequest('EUR', market_time(2022, 9, 8), market_time(2022, 9, 9), Resolution.FIVE_SEC)
+        assert len(plan_chunks(request)) == 24
+
+
+class TestHistoricalErrors:
+
+    def test_no_data_closes_pacing_violation_fails(self):
+        api = IBApi()
+        empty, paced = channels.next_channel(data=[]), channels.next_channel(data=[])
+        api.error(empty.key, 162, 'Historical Market Data Service error message:HMDS query returned no data: FOO')
+        api.error(paced.key, 162, 'Historical Market Data Service error message:Historical data request pacing violation')
+        assert empty.future.result(0) == []
+        with pytest.raises(HistoricalDataError):
+            paced.future.result(0)
+
+    def test_errors_fail_their_request_warnings_do_not(self):
+        api = IBApi()
+        channel = channels.next_channel(data=[])
+        api.error(channel.key, 2106, 'HMDS data farm connection is OK:ushmds')
+        assert not channel.future.done()
+        api.error(channel.key, 200, 'No security definition has been found for the request')
+        with pytest.raises(IBKRError) as error:
+            channel.result(0)
+        assert error.value.code == 200
+
+
+class TestClientId:
+
+    def test_set_until_connected(self, monkeypatch):
+        monkeypatch.setattr(IBApi, '_instance', None)
+        assert IBApi.instance().client_id == CONNECTION_ID
+        api = IBApi.instance(7)
+        assert api.client_id == 7 and InteractiveBroker(WatchList(), 7).ib is api
+        api.is_connected = True
+        assert IBApi.instance().client_id == 7
+        with pytest.raises(ValueError):
+            InteractiveBroker(WatchList(), 8)
+
+    def test_late_data_for_a_failed_request_is_dropped(self):
+        api = IBApi()
+        channel = channels.next_channel(metadata='FOO', data=[])
+        api.error(channel.key, 200, 'No security definition has been found for the request')
+        bar = BarData()
+        bar.date, bar.open, bar.high, bar.low, bar.close, bar.average, bar.volume = '20220908 10:00:00', 1, 2, 0.5, 1.5, 1.2, 7
+        api.historicalData(channel.key, bar)
+        api.historicalDataEnd(channel.key, '', '')
+        assert channel.key not in channels
+
+    def test_refused_subscription_is_retried(self):
+        api = IBApi()
+        api.subscribe_realtime('FOO')
+        channel = api.subscriptions['FOO']
+        api.error(channel.key, 354, 'Requested market data is not subscribed')
+        assert 'FOO' not in api.subscriptions
+        api.realtimeBar(channel.key, 1662645600, 1, 2, 0.5, 1.5, 7, 1.2, 3)
+        assert channel.key not in channels
@@ -0,0 +1,53 @@
+from quant.indicators import IndicatorEngine, Vwap, Ema, Atr, Rsi
+from quant.markets import SymbolData, TickBar
+from datetime import datetime, timedelta
+from functools import partial
+import numpy as np
+
+
+def random_walk(symbol, n, seed=7):
+    rng = np.random.default_rng(seed)
+    sd = SymbolData(symbol)
+    start = datetime(2022, 9, 8, 15, 0).astimezone()
+    close = 100.
+    for i in range(n):
+        open_, close = close, close + rng.normal(0, .2)
+        high, low = max(open_, close) + rng.random() * .1, min(open_, close) - rng.random() * .1
+        date = start + timedelta(seconds=5 * i) + (timedelta(days=1) if i >= n // 2 else timedelta())
+        sd.append_bar(TickBar.new(symbol, date, open_, high, low, close, (high + low) / 2, int(rng.integers(0, 500))))
+    return sd
+
+
+class TestIndicators:
+
+    factories = {'vwap': Vwap, 'ema9': partial(Ema, 9), 'atr': Atr, 'rsi': Rsi}
+
+    def test_batch_matches_streaming(self):
+        sd = random_walk('foo', 2000)
+        for name, factory in self.factories.items():
+            batch = factory().batch(sd)
+            streaming = factory()
+            values = [streaming.update(bar) for bar in sd.tick_bars()]
+            assert np.array_equal(batch, values), name
+
+    def test_vwap_resets_daily(self):
+        sd = random_walk('foo', 10)
+        vwap = Vwap().batch(sd)
+        wap, volume = sd.column('Ref Price'), sd.column('Volume')
+        assert vwap[5] == wap[5]  # First bar of the second day
+        assert vwap[6] == (wap[5] * volume[5] + wap[6] * volume[6]) / (volume[5] + volume[6])
+
+    def test_engine_warm_up_continues_streaming(self):
+        symbol = 'BAR'
+        sd = random_walk(symbol, 600)
+        history = SymbolData(symbol)
+        for bar in sd.tick_bars():
+            if len(history) < 500:
+                history.append_bar(bar)
+        engine = IndicatorEngine(self.factories)
+        engine.warm_up(history)
+        for i in range(500, 600):
+            engine.update(sd[i])
+
+        expected = {name: factory().batch(sd)[-1] for name, factory in self.factories.items()}
+        assert engine[symbol] == expected
@@ -0,0 +1,72 @@
+from quant.broker import Direction, Order, OrderEvent, OrderStatus, Position
+from quant.journal import Journal, JournalReplay, RECORD_SIZE, TICK, ORDER, read
+from quant.markets import TickBar, TickEvent
+from quant.replay import UNTHROTTLED
+from quant.util import events
+from quant.util.price import Price
+from datetime import datetime, timedelta, timezone
+
+
+def bar(symbol, minute, close, date_tz=timezone(timedelta(hours=-4))):
+    return TickBar.new(symbol, datetime(2022, 9, 8, 10, minute, tzinfo=date_tz), close, close + 1, close - 1,
+                       close, close, 100 + minute)
+
+
+class TestJournal:
+
+    def test_round_trip(self, tmp_path):
+        path = str(tmp_path / 'session.qjnl')
+        order = Order(Position('SPY', Direction.SHORT, 10), OrderStatus.FILLED, 7, Price(39512, 2), 10)
+        recorded = [TickEvent(bar('SPY', 0, 395.12)), TickEvent(bar('QQQ', 0, 297.5)), OrderEvent(order),
+                    TickEvent(bar('SPY', 1, 395.2, date_tz=None))]
+        journal = Journal(path).start()
+        for event in recorded:
+            events.emit(event)
+        journal.stop()
+
+        records, symbols = read(path)
+        assert symbols == {0: 'SPY', 1: 'QQQ'}
+        assert (records['kind'] == TICK).sum() == 3 and (records['kind'] == ORDER).sum() == 1
+
+        replayed = []
+        assert JournalReplay(path, UNTHROTTLED, replayed.append).run() == 4
+        assert [e.tick_bar for e in replayed if isinstance(e, TickEvent)] == [e.tick_bar for e in recorded[:2]] + [
+            recorded[3].tick_bar]
+        replayed_order = replayed[2].order
+        assert (replayed_order.position, replayed_order.status, replayed_order.order_id) == (order.position,
+                                                                                             order.status, 7)
+        assert replayed_order.filled_at == Price(39512, 2) and replayed_order.filled_quantity == 10
+
+    def test_appends_and_reuses_symbols(self, tmp_path):
+        path = str(tmp_path / 'session.qjnl')
+        journal = Journal(path)
+        journal.record(TickEvent(bar('SPY', 0, 395.)))
+        journal.close()
+        with open(path, 'ab') as file:
+            file.write(b'\1' * 10)  # A record cut short by a crash
+        journal = Journal(path)
+        journal.record(TickEvent(bar('SPY', 1, 396.)))
+        journal.record(TickEvent(bar('IWM', 1, 180.)))
+        journal.close()
+
+        records, symbols = read(path)
+        assert symbols == {0: 'SPY', 1: 'IWM'}
+        assert len(records) * RECORD_SIZE + RECORD_SIZE == (tmp_path / 'session.qjnl').stat().st_size
+        replayed = []
+        JournalReplay(path, UNTHROTTLED, replayed.append).run()
+        assert [(e.tick_bar.symbol, float(e.tick_bar.close)) for e in replayed] == [
+            ('SPY', 395.), ('SPY', 396.), ('IWM', 180.)]
+
+    def test_float_fill(self, tmp_path):
+        path = str(tmp_path / 'session.qjnl')
+        journal = Journal(path)
+        order = Order(Position('SPY', Direction.LONG, 10), OrderStatus.PARTIALLY_FILLED, 3, Price(39512, 2), 2.5)
+        journal.record(OrderEvent(order))  # IB reports fills as floats
+        journal.record(OrderEvent(order.update_status(OrderStatus.FILLED, filled_quantity=10.0)))
+        journal.close()
+
+        replayed = []
+        JournalReplay(path, UNTHROTTLED, replayed.append).run()
+        assert [(e.order.status, e.order.filled_quantity) for e in replayed] == [
+            (OrderStatus.PARTIALLY_FILLED, 2.5), (OrderStatus.FILLED, 10.0)]
+        assert replayed[1].order.position == order.position
@@ -1,5 +1,11 @@
-from quant.markets import SymbolData, TickBar
-from datetime import datetime
+from quant.markets import SymbolData, RollingSymbolData, TickBar, TickEvent, Resolution, WatchList
+from quant.util import events
+from datetime import datetime, timedelta
+from decimal import Decimal
+import numpy as np
+import gc
+import time
+import weakref
 
 
 class TestSymbolData:
@@ -17,5 +23,185 @@ class TestSymbolData:
         assert sdc[0].high == 120
         assert sdc[0].low == 80
         assert sdc[0].close == 115
-        assert sdc[0].wap == 95
+        assert sdc[0].wap == Decimal('92.35')  # Volume weighted
         assert sdc[0].volume == 17
+
+    def test_append_grows_columns(self):
+        symbol = 'foo'
+        sd = SymbolData(symbol)
+        start = datetime(2022, 9, 8, 9, 30).astimezone()
+        for i in range(SymbolData.MIN_CAPACITY * 3):
+            sd.append_bar(TickBar.new(symbol, start + timedelta(seconds=5 * i), 100, 110, 90, 100 + i, 100, i))
+        assert len(sd) == SymbolData.MIN_CAPACITY * 3
+        assert sd.capacity >= len(sd)
+        assert sd[-1].close == 100 + len(sd) - 1
+        assert sd[1].date == start + timedelta(seconds=5)
+        assert sd.column('Volume').dtype == np.int64
+
+        df = sd.data_frame
+        assert df.shape == (len(sd), len(SymbolData.labels))
+        assert df.index[0] == start
+
+    def test_capacity_hint(self):
+        sd = SymbolData('foo', capacity=5000)
+        assert sd.capacity == 5000
+        assert len(sd) == 0
+
+    def test_resample_by_time(self):
+        symbol = 'foo'
+        sd = SymbolData(symbol)
+        start = datetime(2022, 9, 8, 9, 30, 50).astimezone()
+        for i in (0, 1, 2, 3, 4, 30):  # 2 bars in the first minute, 3 in the next, then a gap
+            sd.append_bar(TickBar.new(symbol, start + timedelta(seconds=5 * i), 100 + i, 110 + i, 90 - i, 100 + i, 100 + i, 10))
+        sdm = sd.resample(Resolution.MINUTE)
+        assert len(sdm) == 3
+        assert sdm.resolution is Resolution.MINUTE
+        assert [bar.volume for bar in sdm.tick_bars()] == [20, 30, 10]
+        assert sdm[0].date == start.replace(second=0)
+        assert sdm[1].open == 102
+        assert sdm[1].close == 104
+        assert sdm[1].high == 114
+        assert sdm[1].low == 86
+        assert sdm[1].wap == 103
+
+        sdd = sdm.resample(Resolution.DAY)
+        assert len(sdd) == 1
+        assert sdd[0].volume == 60
+        assert sdd[0].date == start.replace(hour=0, minute=0, second=0)
+
+    def test_data_frame_is_cached_view(self):
+        symbol = 'foo'
+        sd = SymbolData(symbol)
+        start = datetime(2022, 9, 8, 9, 30).astimezone()
+        for i in range(3):
+            sd.append_bar(TickBar.new(symbol, start + timedelta(seconds=5 * i), 100, 110, 90, 100, 100, 4))
+        df = sd.data_frame
+        assert sd.data_frame is df
+        assert np.shares_memory(df['Close'].to_numpy(), sd.column('Close'))
+
+        sd.append_bar(TickBar.new(symbol, start + timedelta(seconds=15), 100, 110, 90, 101, 100, 4))
+        assert sd.data_frame is not df
+        assert len(sd.data_frame) == 4
+        assert len(df) == 3
+
+    def test_batches_and_rows(self):
+        symbol = 'foo'
+        sd = SymbolData(symbol)
+        start = datetime(2022, 9, 8, 9, 30).astimezone()
+        for i in range(10):
+            sd.append_bar(TickBar.new(symbol, start + timedelta(seconds=5 * i), 100, 110, 90, 100 + i, 100, i))
+
+        batches = list(sd.batches(4))
+        assert [b.size for b in batches] == [4, 4, 2]
+        assert batches[1].start == 4
+        assert np.shares_memory(batches[1].close, sd.column('Close'))
+        records = batches[2].to_records()
+        assert records['close'].tolist() == [108, 109]
+        assert records['volume'].tolist() == [8, 9]
+
+        views = sd.rows()
+        first = next(views)
+        assert first.close == 100
+        assert next(views) is first
+        assert first.close == 101
+        assert first.to_tick_bar() == sd[1]
+        assert list(sd.tick_bars()) == [sd[i] for i in range(len(sd))]
+
+
+class TestRollingSymbolData:
+
+    start = datetime(2022, 9, 8, 9, 30).astimezone()
+
+    def bar(self, i):
+        return TickBar.new('foo', self.start + timedelta(seconds=5 * i), 100, 110, 90, 100 + i, 100, i)
+
+    def test_keeps_last_bars_and_spills(self):
+        spilled = []
+        sd = RollingSymbolData('foo', 5, spill=spilled.append, spill_size=3)
+        for i in range(12):
+            sd.append_bar(self.bar(i))
+        assert len(sd) == 5
+        assert sd.column('Volume').tolist() == [7, 8, 9, 10, 11]
+        assert sd[0].close == 107
+        assert np.shares_memory(sd.window(3).close, sd.column('Close'))
+        assert [data.column('Volume').tolist() for data in spilled] == [[0, 1, 2], [3, 4, 5]]
+        sd.flush()
+        assert spilled[-1].column('Volume').tolist() == [6]
+        assert sd.data_frame['Volume'].tolist() == [7, 8, 9, 10, 11]
+        sd.flush(retained=True)
+        assert [data.column('Volume').tolist() for data in spilled[3:]] == [[7, 8, 9, 10, 11]] and len(sd) == 0
+
+    def test_max_age(self):
+        sd = RollingSymbolData('foo', 100, max_age=timedelta(seconds=20))
+        for i in range(10):
+            sd.append_bar(self.bar(i))
+        assert sd.column('Volume').tolist() == [5, 6, 7, 8, 9]
+
+    def test_concat(self):
+        a, b = SymbolData('foo'), SymbolData('foo')
+        for i in (0, 1, 2):
+            a.append_bar(self.bar(i))
+        for i in (2, 3):
+            b.append_bar(self.bar(i)._replace(volume=99))
+        joined = SymbolData.concat([b, a])
+        assert joined.column('Volume').tolist() == [0, 1, 2, 99]
+
+
+class TestWatchList:
+
+    def test_versioned_snapshots(self):
+        watchlist = WatchList(['abc'])
+        version = watchlist.version
+        snapshot = watchlist.snapshot()
+
+        bar = TickBar.new('ABC', datetime.now(), 1, 2, 0.5, 1.5, 1.2, 10)
+        watchlist['ABC'] = bar
+        watchlist.add_symbol('def', 3)
+        assert watchlist.changed_since(version)
+        assert watchlist.version == version + 2
+        assert watchlist['ABC'] is bar
+        assert watchlist.last_close('DEF') == 3
+
+        assert list(snapshot.prices) == ['ABC']
+        assert snapshot.prices['ABC'].close == 0
+        assert not watchlist.changed_since(watchlist.version)
+
+    def test_bulk_update_is_one_version(self):
+        watchlist = WatchList()
+        watchlist.update(TickBar.new(s, datetime.now(), 1, 1, 1, 1, 1, 1) for s in ('A', 'B', 'C'))
+        assert watchlist.version == 1
+        assert len(watchlist) == 3
+
+    def test_read_after_emit(self):
+        watchlist = WatchList(['A'])
+        bar = TickBar.new('A', datetime.now(), 1, 2, 0.5, 1.5, 1.2, 10)
+        events.emit(TickEvent(bar))
+        assert watchlist['A'] is bar  # The fake broker fills at the close it reads right after the tick
+        watchlist.close()
+        events.emit(TickEvent(bar._replace(volume=11)))
+        assert watchlist['A'] is bar
+
+    def test_dropped_watchlist_is_collected(self):
+        plain, conflated = WatchList(['A']), WatchList(['A'], conflate=True)
+        worker = conflated._observer
+        collected = [weakref.ref(plain), weakref.ref(conflated)]
+        del plain, conflated
+        gc.collect()
+        assert [ref() for ref in collected] == [None, None]
+        assert worker.closed
+        registered = [ref for by_key in events.observers[TickEvent].values() for _, ref in by_key]
+        assert worker not in registered
+        events.emit(TickEvent(TickBar.new('A', datetime.now(), 1, 1, 1, 1, 1, 1)))  # Prunes the dead plain observer
+        assert len([ref for by_key in events.observers[TickEvent].values() for _, ref in by_key]) < len(registered)
+
+    def test_tick_events_are_conflated(self):
+        watchlist = WatchList(['A', 'B'], conflate=True)
+        version = watchlist.version
+        for n in range(1000):
+            events.emit(TickEvent(TickBar.new('AB'[n % 2], datetime.now(), 1, 1, 1, 1, 1, n)))
+        start = time.perf_counter()
+        while (watchlist['A'].volume, watchlist['B'].volume) != (998, 999) and time.perf_counter() - start < 1:
+            time.sleep(0.001)
+        assert (watchlist['A'].volume, watchlist['B'].volume) == (998, 999)
+        assert watchlist.version - version < 1000  # Fewer versions than events
+        watchlist.close()
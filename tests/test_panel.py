@@ -0,0 +1,47 @@
+from quant.panel import Panel
+from quant.markets import SymbolData, TickBar, Resolution
+from datetime import datetime, timedelta
+import numpy as np
+
+
+def bars(symbol, closes, start, step=5):
+    sd = SymbolData(symbol)
+    for i, close in enumerate(closes):
+        if close is not None:
+            sd.append_bar(TickBar.new(symbol, start + timedelta(seconds=step * i), close, close, close, close, close, 10))
+    return sd
+
+
+class TestPanel:
+
+    start = datetime(2022, 9, 8, 9, 30).astimezone()
+
+    def test_from_symbol_data_aligns(self):
+        panel = Panel.from_symbol_data([bars('aaa', [10, 11, 12], self.start),
+                                        bars('bbb', [20, None, 22, 23], self.start)])
+        assert panel.symbols == ['AAA', 'BBB']
+        assert len(panel) == 4
+        close = panel.field('Close')
+        assert np.isnan(close[1, 1]) and np.isnan(close[3, 0])
+        assert panel.field('Volume')[3].tolist() == [0, 10]
+        assert panel.last().tolist() == [12, 23]
+        assert panel.filled()[1].tolist() == [11, 20]
+
+    def test_live_updates_and_movers(self):
+        panel = Panel(['AAA'])
+        for i, (a, b) in enumerate([(10, 20), (11, 20), (11, 30)]):
+            date = self.start + timedelta(seconds=5 * i, microseconds=1234 * i)  # Jitter within the bucket
+            panel.update(TickBar.new('AAA', date, a, a, a, a, a, 1))
+            panel.update(TickBar.new('BBB', date, b, b, b, b, b, 1))
+        assert len(panel) == 3
+        assert panel.date_index[1] == self.start + timedelta(seconds=5)
+        movers = panel.movers(periods=2)
+        assert movers[0][0] == 'BBB'
+        assert np.isclose(movers[0][1], .5)
+        assert Panel.rank(panel.last()).tolist() == [0, 1]
+        assert np.isclose(panel.relative_strength('AAA', 2)[-1, 1], .4)
+
+    def test_resolution_buckets(self):
+        panel = Panel.from_symbol_data([bars('aaa', range(24), self.start)], Resolution.MINUTE)
+        assert len(panel) == 2
+        assert panel.data_frame().index[1] == self.start + timedelta(minutes=1)
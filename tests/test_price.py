@@ -0,0 +1,34 @@
+from quant.util.price import Price, price
+from decimal import Decimal
+import numpy as np
+
+
+class TestPrice:
+
+    def test_conversions(self):
+        p = price(159.78)
+        assert p.ticks == 15978
+        assert p == Price.of(Decimal('159.78')) == Price.of('159.78') == Decimal('159.78')
+        assert float(p) == 159.78
+        assert p.to_decimal() == Decimal('159.78')
+        assert str(p) == '159.78'
+        assert f'{p:.3f}' == '159.780'
+        assert int(Price(-15978)) == -159
+
+    def test_arithmetic(self):
+        a, b = price(187.34), price(159.78)
+        assert (a - b) * 100 == Price(275600)
+        assert sum([a, b]) == price(347.12)
+        assert a - 1 == price(186.34)
+        assert Price(1, 5) + Price(1, 2) == Price(1001, 5)
+        assert a > b and b < 160 and a >= 187.34
+
+    def test_numpy_scalars(self):
+        p = Price(150, 2)
+        assert p < np.float64(2) and p > np.float32(1) and p == np.float64(1.5) and p != np.float64(1.51)
+        assert p == np.int64(1) + Price(50, 2) and p > np.int64(1)
+        assert np.float64(2) > p
+
+    def test_hash_matches_equal_values(self):
+        assert hash(Price(100)) == hash(1) == hash(Decimal('1.00'))
+        assert {Price(15978): 'x'}[Price(159780, 3)] == 'x'
@@ -0,0 +1,25 @@
+from quant.util.ratelimit import TokenBucket, SlidingWindow
+import time
+
+
+class TestTokenBucket:
+
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=100, capacity=3)
+        assert all(bucket.try_acquire() for _ in range(3))
+        assert not bucket.try_acquire()
+        start = time.monotonic()
+        for _ in range(5):
+            bucket.acquire()
+        assert 0.04 <= time.monotonic() - start < 0.2
+
+
+class TestSlidingWindow:
+
+    def test_every_window_is_enforced(self):
+        window = SlidingWindow((2, 0.05), (3, 0.2))
+        start = time.monotonic()
+        waits = [window.acquire() for _ in range(4)]
+        assert waits[:2] == [0., 0.]
+        assert 0.04 <= waits[2] < 0.1  # Third call: held by the short window
+        assert 0.15 <= time.monotonic() - start < 0.4  # Fourth: held by the long one, as 3 went in 0.2s
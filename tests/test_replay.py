@@ -0,0 +1,62 @@
+from quant.replay import Replay, merge_bars, UNTHROTTLED
+from quant.markets import SymbolData, TickBar, WatchList
+from quant import sources
+from datetime import datetime, timedelta
+import threading
+import time
+
+
+def series(symbol, start, seconds):
+    sd = SymbolData(symbol)
+    for s in seconds:
+        sd.append_bar(TickBar.new(symbol, start + timedelta(seconds=s), 1, 2, 0.5, 1.5, 1.2, s))
+    return sd
+
+
+class TestReplay:
+
+    start = datetime(2022, 9, 8, 9, 30).astimezone()
+
+    def test_chronological_order(self):
+        datas = [series('A', self.start, [0, 10, 20]), series('B', self.start, [5, 10, 15, 25])]
+        bars = [(bar.symbol, bar.volume) for _, bar in merge_bars(datas)]
+        assert bars == [('A', 0), ('B', 5), ('A', 10), ('B', 10), ('B', 15), ('A', 20), ('B', 25)]
+
+    def test_speed(self):
+        datas = [series('A', self.start, [0, 1, 2])]
+        emitted = []
+        start = time.perf_counter()
+        assert Replay(datas, speed=20, emit=emitted.append).run() == 3
+        assert 0.09 <= time.perf_counter() - start < 0.5
+        start = time.perf_counter()
+        Replay(datas, speed=UNTHROTTLED, emit=emitted.append).run()
+        assert time.perf_counter() - start < 0.05
+        assert [event.tick_bar.volume for event in emitted] == [0, 1, 2] * 2
+
+    def test_historical_source_backs_off_when_idle(self, monkeypatch):
+        passes = []
+        monkeypatch.setattr(sources, 'Replay', lambda datas, speed: passes.append(datas) or Replay(datas, speed))
+        source = sources.IBKRHistoricalMarketData(WatchList(), self.start)
+        source.idle_wait = 0.05
+        thread = threading.Thread(target=source.run, daemon=True)
+        thread.start()
+        time.sleep(0.2)
+        source.stop()
+        thread.join(timeout=1)
+        assert not thread.is_alive()
+        assert 1 <= len(passes) <= 6 and passes[0] == []
+
+        passes.clear()
+        sources.IBKRHistoricalMarketData(WatchList(), self.start, loop=False).run()
+        assert len(passes) == 1
+
+    def test_stop_interrupts_the_pass_under_way(self):
+        source = sources.IBKRHistoricalMarketData(WatchList(['A']), self.start)
+        source.history['A'] = series('A', self.start, [0, 3600, 7200])  # Hours to replay at 1x
+        thread = threading.Thread(target=source.run, daemon=True)
+        thread.start()
+        time.sleep(0.05)
+        start = time.perf_counter()
+        source.stop()
+        thread.join(timeout=1)
+        assert not thread.is_alive() and time.perf_counter() - start < 0.5
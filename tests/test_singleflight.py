@@ -0,0 +1,30 @@
+from quant.util.singleflight import SingleFlight
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import pytest
+
+
+class TestSingleFlight:
+
+    def test_concurrent_calls_share_result(self):
+        flight, release, calls = SingleFlight(), threading.Event(), []
+
+        def call():
+            calls.append(1)
+            release.wait(1)
+            return 'result'
+
+        with ThreadPoolExecutor(4) as executor:
+            futures = [executor.submit(flight.do, 'key', call) for _ in range(4)]
+            while flight.calls + flight.shared < 4:
+                pass
+            release.set()
+            assert [future.result() for future in futures] == ['result'] * 4
+        assert len(calls) == 1 and flight.stats == (1, 3)
+        assert flight.do('key', lambda: 'again') == 'again'  # Nothing in flight any more
+
+    def test_exception_is_shared(self):
+        flight = SingleFlight()
+        with pytest.raises(ValueError):
+            flight.do('key', lambda: int('x'))
+        assert flight.do('key', lambda: 1) == 1
@@ -1,4 +1,9 @@
-from quant.sources import YahooData
+from quant.sources import YahooData, DataCache, HistoryStore, IBKRMarketData, fetch_incremental
+from quant.markets import SymbolData, TickBar, TickEvent, Resolution, DataRequest, WatchList
+from quant.util import events
+from datetime import datetime, timedelta
+import pytest
+import threading
 
 
 class TestSources:
@@ -8,3 +13,141 @@ class TestSources:
         assert type(price) is float
         assert price > 100
         assert price < 1000
+
+
+class TestDataCache:
+
+    def test_append_merges_days(self, tmp_path):
+        cache = DataCache(str(tmp_path))
+        start = datetime(2022, 9, 8, 15, 59, 55).astimezone()
+        sd = SymbolData('foo')
+        for i in range(3):
+            sd.append_bar(TickBar.new('FOO', start + timedelta(hours=12 * i), 1, 2, 0.5, 1.5, 1.2, i))
+        cache.append(sd)
+        cache.append(sd)
+        assert cache.load('FOO', start).column('Volume').tolist() == [0]
+        assert cache.load('FOO', start + timedelta(days=1)).column('Volume').tolist() == [1, 2]
+
+    def test_binary_round_trip(self, tmp_path):
+        cache = DataCache(str(tmp_path))
+        start = datetime(2022, 9, 8, 9, 30).astimezone()
+        sd = SymbolData('foo', resolution=Resolution.FIVE_SEC)
+        for i in range(5):
+            sd.append_bar(TickBar.new('FOO', start + timedelta(seconds=5 * i), 1, 2, 0.5, 1.5, 1.2, i))
+        cache.save(sd)
+        loaded = cache.load('FOO', start)
+        assert loaded.resolution == Resolution.FIVE_SEC
+        assert loaded.data_frame.equals(sd.data_frame)
+
+    def test_reads_csv(self, tmp_path):
+        cache = DataCache(str(tmp_path))
+        start = datetime(2022, 9, 8, 9, 30).astimezone()
+        sd = SymbolData('foo')
+        sd.append_bar(TickBar.new('FOO', start, 1, 2, 0.5, 1.5, 1.2, 7))
+        sd.data_frame.to_csv(cache.path_for('foo', start, 'csv'))
+        assert cache.load('foo', start).column('Volume').tolist() == [7]
+
+
+class TestHistoryStore:
+
+    @staticmethod
+    def bars(symbol, start, n, volume=0):
+        sd = SymbolData(symbol, resolution=Resolution.FIVE_SEC)
+        for i in range(n):
+            sd.append_bar(TickBar.new(symbol, start + timedelta(hours=i), 1, 2, 0.5, 1.5, 1.2, volume + i))
+        return sd
+
+    def test_query_across_days(self, tmp_path):
+        start = datetime(2022, 9, 8, 12).astimezone()
+        store = HistoryStore(str(tmp_path))
+        store.save(self.bars('FOO', start, 48))
+        store.save(self.bars('BAR', start, 3))
+        store = HistoryStore(str(tmp_path))  # Reopened from the index
+        day = store.load('FOO', start + timedelta(days=1))
+        assert len(day) == 24 and day.resolution == Resolution.FIVE_SEC
+        span = store.query('FOO', start + timedelta(hours=10), start + timedelta(hours=20))
+        assert span.column('Volume').tolist() == list(range(10, 20))
+        assert set(store.query_many(['FOO', 'BAR', 'BAZ'], start, start + timedelta(days=1))) == {'FOO', 'BAR'}
+
+    def test_later_runs_win(self, tmp_path):
+        start = datetime(2022, 9, 8, 12).astimezone()
+        store = HistoryStore(str(tmp_path))
+        store.save(self.bars('FOO', start, 4))
+        store.append(self.bars('FOO', start + timedelta(hours=2), 4, volume=100))
+        merged = store.query('FOO', start, start + timedelta(days=1))
+        assert merged.column('Volume').tolist() == [0, 1, 100, 101, 102, 103]
+
+
+class TestFetchIncremental:
+
+    @staticmethod
+    def fetcher(requests):
+        def fetch(request):
+            requests.append(request)
+            sd = SymbolData(request.symbol, resolution=request.resolution)
+            day = request.start
+            while day < request.end:
+                if day.weekday() < 5:
+                    sd.append_bar(TickBar.new(request.symbol, day, 1, 2, 0.5, 1.5, 1.2, day.day))
+                day += timedelta(days=1)
+            return sd
+        return fetch
+
+    def test_fetches_only_gaps(self, tmp_path):
+        store, requests = HistoryStore(str(tmp_path)), []
+        start = datetime(2022, 8, 1).astimezone()
+        fetch_incremental(store, self.fetcher(requests), DataRequest('FOO', start, start + timedelta(days=10)))
+        data = fetch_incremental(store, self.fetcher(requests), DataRequest('FOO', start, start + timedelta(days=15)))
+        assert [(r.start.day, r.end.day) for r in requests] == [(1, 11), (11, 16)]
+        assert data.column('Volume').tolist() == [1, 2, 3, 4, 5, 8, 9, 10, 11, 12, 15]
+        fetch_incremental(store, self.fetcher(requests), DataRequest('FOO', start + timedelta(days=5), start + timedelta(days=14)))
+        assert len(requests) == 2
+
+    def test_skips_weekend_gaps(self, tmp_path):
+        store, requests = HistoryStore(str(tmp_path)), []
+        saturday = datetime(2022, 8, 6).astimezone()
+        fetch_incremental(store, self.fetcher(requests), DataRequest('FOO', saturday, saturday + timedelta(days=2)))
+        assert requests == []
+
+    def test_failed_gap_is_not_covered(self, tmp_path):
+        store, requests = HistoryStore(str(tmp_path)), []
+        start = datetime(2022, 8, 1).astimezone()
+        fetch_incremental(store, self.fetcher(requests), DataRequest('FOO', start + timedelta(days=5), start + timedelta(days=10)))
+        fetch = self.fetcher(requests)
+
+        def fails_after_first_gap(request):
+            if request.start.day > 1:
+                raise TimeoutError('Historical data for FOO timed out')
+            return fetch(request)
+
+        request = DataRequest('FOO', start, start + timedelta(days=15))
+        with pytest.raises(TimeoutError):
+            fetch_incremental(store, fails_after_first_gap, request)
+        assert [(gap.start.day, gap.end.day) for gap in store.missing(request)] == [(11, 16)]
+
+        fetch_incremental(store, lambda r: SymbolData('FOO', resolution=r.resolution), request)  # Nothing came back
+        assert [(gap.start.day, gap.end.day) for gap in store.missing(request)] == [(11, 16)]
+
+        data = fetch_incremental(store, fetch, request)
+        assert [(r.start.day, r.end.day) for r in requests] == [(6, 11), (1, 6), (11, 16)]
+        assert data.column('Volume').tolist() == [1, 2, 3, 4, 5, 8, 9, 10, 11, 12, 15]
+        assert store.missing(request) == []
+
+
+class TestIBKRMarketData:
+
+    def test_stop_writes_all_bars(self, tmp_path):
+        start = datetime(2022, 9, 8, 12).astimezone()
+        source = IBKRMarketData(WatchList(), history_bars=10, cache_dir=str(tmp_path))
+        for i in range(25):
+            source.on_bar(TickBar.new('FOO', start + timedelta(seconds=5 * i), 1, 2, 0.5, 1.5, 1.2, i))
+        assert HistoryStore(str(tmp_path)).query('FOO', start, start + timedelta(hours=1)) is None  # Still buffered
+        release = threading.Event()
+        source._observer = events.observe(TickEvent, lambda e: release.wait() and source.on_bar(e.tick_bar),
+                                          asynchronous=True)
+        for i in range(25, 30):  # Queued behind a slow write when stop is called
+            events.emit(TickEvent(TickBar.new('FOO', start + timedelta(seconds=5 * i), 1, 2, 0.5, 1.5, 1.2, i)))
+        threading.Timer(0.05, release.set).start()
+        source.stop()
+        written = HistoryStore(str(tmp_path)).query('FOO', start, start + timedelta(hours=1))
+        assert written.column('Volume').tolist() == list(range(30))
@@ -0,0 +1,33 @@
+from quant.synthetic import SyntheticMarket, seed_price
+from datetime import datetime
+import numpy as np
+
+
+class TestSyntheticMarket:
+
+    symbols = [f'SYM{i}' for i in range(1000)] + ['EUR']
+
+    def test_reproducible(self):
+        a, b = SyntheticMarket(self.symbols, seed=7), SyntheticMarket(self.symbols, seed=7)
+        date = datetime(2022, 9, 8, 10)
+        assert np.array_equal(a.step(date).close, b.step(date).close)
+        assert a.last[0] != seed_price('SYM0')
+
+    def test_bars_are_consistent(self):
+        market = SyntheticMarket(self.symbols, seed=1)
+        bars = market.step(datetime(2022, 9, 8, 10))
+        assert (bars.high >= np.maximum(bars.open, bars.close)).all()
+        assert (bars.low <= np.minimum(bars.open, bars.close)).all()
+        assert (bars.low <= bars.wap).all() and (bars.wap <= bars.high).all()
+        tick_bars = market.tick_bars(bars, ['SYM3', 'EUR'])
+        assert [bar.symbol for bar in tick_bars] == ['SYM3', 'EUR']
+        assert tick_bars[1].close.scale == 5 and float(tick_bars[0].close) == round(bars.close[3], 2)
+
+    def test_history_continues_prices(self):
+        market = SyntheticMarket(self.symbols[:10], seed=3)
+        history = market.history(datetime(2022, 9, 8, 9, 30), 4680)
+        data = history['SYM0']
+        assert len(data) == 4680 and data.column('Open')[0] == seed_price('SYM0')
+        assert (data.column('Open')[1:] == data.column('Close')[:-1]).all()
+        volume = data.column('Volume')
+        assert volume[:60].mean() > volume[2300:2360].mean()  # Busier at the open than at midday
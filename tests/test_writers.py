@@ -0,0 +1,48 @@
+from quant.writers import TerminalWriter, CsvWriter, JsonLinesWriter, ColumnarWriter
+from quant.markets import render_bar_data
+from quant.util import columnar
+import pandas as pd
+import numpy as np
+import io
+import json
+
+
+def frame():
+    index = pd.date_range('2022-09-08 09:30', periods=5, freq='min', tz='US/Eastern', name='Date')
+    return pd.DataFrame({'Open': [9.5, 10, 10.5, 10.5, 11], 'High': [10., 11., 11., 11., 12.],
+                         'Low': [9, 9.5, 10, 10, 10.5], 'Close': [9.8, 10.6, 10.2, 10.2, 11.5],
+                         'Ref Price': [9.7, 10.2, 10.4, 10.1, 11.1], 'Volume': [100, 2000, 30, 40, 12345]}, index=index)
+
+
+class TestWriters:
+
+    def test_terminal_matches_render_bar_data(self, monkeypatch):
+        monkeypatch.setattr('quant.writers.CHUNK_ROWS', 2)
+        df, out = frame(), io.StringIO()
+        TerminalWriter(out).write('foo', df)
+        expected, prev_close, prev_ref_price = [], None, None
+        for date, row in zip(df.index, df.itertuples(index=False)):
+            expected.append(render_bar_data('FOO', date, *row, prev_close, prev_ref_price))
+            prev_close, prev_ref_price = row[3], row[4]
+        assert out.getvalue().splitlines() == expected
+
+    def test_csv_and_jsonl(self):
+        out = io.StringIO()
+        CsvWriter(out).write('foo', frame())
+        assert pd.read_csv(io.StringIO(out.getvalue()))['Symbol'].tolist() == ['FOO'] * 5
+        out = io.StringIO()
+        JsonLinesWriter(out).write('foo', frame())
+        first = json.loads(out.getvalue().splitlines()[0])
+        assert first['Date'] == '2022-09-08T09:30:00-04:00' and first['Volume'] == 100
+
+    def test_columnar_blocks(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('quant.writers.CHUNK_ROWS', 3)
+        path = tmp_path / 'out.qcol'
+        with open(path, 'wb') as file:
+            writer = ColumnarWriter(file)
+            writer.write('foo', frame())
+            writer.write('bar', frame())
+        blocks = list(columnar.read_blocks(str(path)))
+        assert [(meta['symbol'], len(columns['Close'])) for columns, meta, _ in blocks] == \
+            [('FOO', 3), ('FOO', 2), ('BAR', 3), ('BAR', 2)]
+        assert np.array_equal(blocks[1][0]['Volume'], [40, 12345])